@@ -1,11 +1,21 @@
-from typing import Callable, Union, Optional, Sequence
+import os
+import json
+from typing import Callable, Union, Optional, Sequence, Dict, List, Tuple, Any
 
 from datetime import timedelta
 from .format import format_timer
+from . import curves
 
 
 Stage1GoalActivityId = 2048
 
+CatalogVersion = 1
+
+# the catalog of Activities in the store that ships with the game
+DefaultCatalogFile = os.path.join(os.path.dirname(__file__), 'catalog.json')
+
+CurveParam = Union[int, float, Callable[[int], Union[int, float]], curves.Curve]
+
 
 class Activity:
     def __init__(
@@ -13,49 +23,40 @@ class Activity:
         id: int,
         name: str,
         duration: Union[timedelta, int, float],
-        price: Union[int, Callable[[int], int]] = 0,
-        money_cost: Union[int, Callable[[int], int]] = 0,
-        juice_cost: Union[float, Callable[[int], float]] = 0,
-        money_rate: Union[int, Callable[[int], int]] = 0,
-        juice_rate: Union[float, Callable[[int], float]] = 0,
-        auto_price: Union[int, Callable[[int], int]] = 0,
+        price: CurveParam = 0,
+        money_cost: CurveParam = 0,
+        juice_cost: CurveParam = 0,
+        money_rate: CurveParam = 0,
+        juice_rate: CurveParam = 0,
+        auto_price: CurveParam = 0,
     ):
         """
         Create new Activity.
         
+        Each of the parameters that depend on how many of something are owned
+        can be given as a single number for a uniform value, a Curve from the
+        curves module, or any other function that accepts the current number of
+        owned instances and returns the value for the next one. Typed curves
+        allow totals over many instances to be calculated in closed form; other
+        functions have their running totals cached instead.
+        
         :param id: The ID of the Activity. Must be unique across all instances
         of Activity.
         :param name: The display name of the Activity.
         :param duration: The amount of time that one execution takes. This can
         either be a number of seconds or a timedelta.
-        :param price: How much an instance costs to buy from the
-        store. This can be either a single number for a uniform price or a
-        function that accepts the current number of owned instances and returns
-        the price of purchasing the next one.
-        :param money_cost: The amount of money needed to start an execution of a
-        single instance of this Activity. This can be either a single number for
-        a uniform cost or a function that accepts the current number of owned
-        instances and returns the amount of additional money needed to power the
-        execution of the next instance.
-        :param juice_cost: The amount of juice needed to power an execution of a
-        single instance of this Activity. This can be either a single number for
-        a uniform cost or a function that accepts the current number of owned
-        instances and returns the amount of additional juice needed to power the
-        execution of the next instance.
-        :param money_rate: The amount of money produced by an execution of a
-        single instance of this Activity. This can be either a single number for
-        a uniform production or a function that accepts the current number of
-        owned instances and returns the amount of additional money that the next
-        instance will produce.
-        :param juice_rate: The amount of juice produced by an execution of a
-        single instance of this Activity. This can be either a single number for
-        a uniform production or a function that accepts the current number of
-        owned instances and returns the amount of additional juice that the next
-        instance will produce.
-        :param auto_price: How much each automation costs in ideas. Keep in mind
-        that each one will *double* the prior production. This can either be a
-        single number for a uniform cost for each or a function that accepts the
-        current number of automations and returns the price of the next one.
+        :param price: How much an instance costs to buy from the store.
+        :param money_cost: The amount of additional money needed to start an
+        execution of the next instance of this Activity.
+        :param juice_cost: The amount of additional juice needed to power an
+        execution of the next instance of this Activity.
+        :param money_rate: The amount of additional money that an execution of
+        the next instance of this Activity produces.
+        :param juice_rate: The amount of additional juice that an execution of
+        the next instance of this Activity produces.
+        :param auto_price: How much each automation costs in ideas, by the
+        current number of automations. Keep in mind that each one will *double*
+        the prior production.
         """
         self.id = id
         self.name = name
@@ -64,53 +65,33 @@ class Activity:
         if isinstance(duration, int) or isinstance(duration, float):
             self.duration = timedelta(seconds=duration)
         
-        # money_cost
-        if isinstance(money_cost, float) or isinstance(money_cost, int):
-            def money_cost_func(_):
-                return int(money_cost)
-            self.money_cost = money_cost_func
-        else:
-            self.money_cost = money_cost
-        
-        # price
-        if isinstance(price, float) or isinstance(price, int):
-            def price_func(_):
-                return int(price)
-            self.price = price_func
-        else:
-            self.price = price
-            
-        # juice_cost
-        if isinstance(juice_cost, float) or isinstance(juice_cost, int):
-            def juice_cost_func(_):
-                return float(juice_cost)
-            self.juice_cost = juice_cost_func
-        else:
-            self.juice_cost = juice_cost
-        
-        # money_rate
-        if isinstance(money_rate, float) or isinstance(money_rate, int):
-            def money_func(_):
-                return int(money_rate)
-            self.money_rate = money_func
-        else:
-            self.money_rate = money_rate
-            
-        # juice_rate
-        if isinstance(juice_rate, float) or isinstance(juice_rate, int):
-            def juice_func(_):
-                return float(juice_rate)
-            self.juice_rate = juice_func
-        else:
-            self.juice_rate = juice_rate
-            
-        # auto_price
-        if isinstance(auto_price, float) or isinstance(auto_price, int):
-            def auto_func(_):
-                return int(auto_price)
-            self.auto_price = auto_func
-        else:
-            self.auto_price = auto_price
+        self.price = curves.as_curve(price, int)
+        self.money_cost = curves.as_curve(money_cost, int)
+        self.juice_cost = curves.as_curve(juice_cost, float)
+        self.money_rate = curves.as_curve(money_rate, int)
+        self.juice_rate = curves.as_curve(juice_rate, float)
+        self.auto_price = curves.as_curve(auto_price, int)
+    
+    def total_price(self, count: int, amount: int) -> int:
+        """
+        Get the total price of buying several instances at once.
+
+        :param count: The number of instances already owned.
+        :param amount: The number of instances to buy.
+        :return: The sum of the prices of each of the bought instances.
+        """
+        return self.price.total(count, amount)
+
+    def max_affordable(self, count: int, money: int) -> int:
+        """
+        Get the largest number of instances that can be bought at once with the
+        given amount of money. Prices must be positive.
+
+        :param count: The number of instances already owned.
+        :param money: The amount of money available to spend.
+        :return: The number of instances that can be bought.
+        """
+        return self.price.max_affordable(count, money)
     
     def __str__(self):
         msg = "Activity<{:s}({:d}), duration={:s}>"
@@ -119,89 +100,151 @@ class Activity:
     def __repr__(self):
         msg = "Activity(id={!r}, name={!r}, duration={!r})"
         return msg.format(self.id, self.name, self.duration)
-            
-            
-# TODO: consistent order of args in Jobs and Outlets
-Jobs = [
-    Activity(
-        0, 'Eat Bagels', 1,
-        price=lambda x: round(19+(1.3**x)),
-        money_cost=0,
-        juice_cost=0.0,
-        money_rate=1,
-        juice_rate=0.0,
-        auto_price=lambda x: 1 if x == 0 else int(1.02 ** (50*x)),
-    ),
-    Activity(
-        1, 'Data Entry', 10.0,
-        price=100,
-        money_cost=2,
-        juice_cost=0.01,
-        money_rate=11,
-        juice_rate=0.0,
-        auto_price=5
-    ),
-    Activity(
-        2, 'Create Spreadsheets', 100,
-        price=10000,
-        money_cost=0,
-        juice_cost=0.17,
-        money_rate=27,
-        juice_rate=0.0,
-        auto_price=200,
-    )
-]
-
-
-Outlets = [
-    Activity(
-        1024, 'Binge Netflix Show', 3,
-        price=200,
-        money_cost=30,
-        juice_cost=0.0,
-        money_rate=0,
-        juice_rate=0.002,
-        auto_price=lambda x: 2 if x == 0 else int(1.8 ** x)
-    ),
-    Activity(
-        1025, 'Write Fanfiction', 25,
-        price=10000,
-        money_cost=250,
-        juice_cost=20.0,
-        money_rate=0,
-        juice_rate=1.0,
-        auto_price=600,
-    ),
-    Activity(
-        1026, 'Make Poetry', 200,
-        price=100000,
-        money_cost=1000,
-        juice_cost=420.0,
-        money_rate=0,
-        juice_rate=5.0,
-        auto_price=10000
-    ),
-    # TODO: More activities
-    Activity(
-        Stage1GoalActivityId, 'Generate Construct', timedelta(weeks=2),
-        price=lambda x: round((5*(10**9) - 1)+(5**x)),
-        money_cost=lambda x: x*(1*(10**6)),
-        juice_cost=lambda x: x*(1*(10**4)),
-        money_rate=0,
-        juice_rate=(1*(10**3)),
-        auto_price=lambda x: x*(1*(10**11))
-    )
-]
+
+
+# functions that 'custom' curves in a catalog can refer to by name, for values
+# that don't fit any of the typed curves
+CustomCurves: Dict[str, Callable[[int], Union[int, float]]] = {
+    'bagels_auto_price': lambda x: 1 if x == 0 else int(1.02 ** (50*x)),
+    'netflix_auto_price': lambda x: 2 if x == 0 else int(1.8 ** x),
+}
+
+# the type that a single number is converted to for each curve of an Activity
+_CurveKinds = (
+    ('price', int),
+    ('money_cost', int),
+    ('juice_cost', float),
+    ('money_rate', int),
+    ('juice_rate', float),
+    ('auto_price', int),
+)
+
+# catalogs that have already been read, by absolute path
+_LoadedCatalogs: Dict[str, Tuple[List[Activity], List[Activity]]] = {}
+
+
+def load_catalog(file_name: str = DefaultCatalogFile) -> Tuple[List[Activity], List[Activity]]:
+    """
+    Read the Activities in a catalog file. Each file is only read once; later
+    calls with the same file give the same Activities.
+
+    The file is JSON with a 'jobs' list and an 'outlets' list. Each entry has an
+    'id', a 'name', and a 'duration' that is either a number of seconds or the
+    keyword arguments of a timedelta (such as {"weeks": 2}). Each of its curves
+    is either a single number or a dict as accepted by curves.from_spec(), and
+    any that are left out are 0.
+
+    :param file_name: The catalog file to read.
+    :return: The jobs and the outlets in the catalog.
+    """
+    path = os.path.abspath(file_name)
+    if path in _LoadedCatalogs:
+        return _LoadedCatalogs[path]
+
+    with open(path, 'r') as fp:
+        data = json.load(fp)
+    version = data.get('meta', {}).get('version', None)
+    if version != CatalogVersion:
+        msg = "Catalog file is version {!r} but this build of cre8orforge only reads version {:d}"
+        raise ValueError(msg.format(version, CatalogVersion))
+
+    jobs = [_activity_from_spec(spec) for spec in data.get('jobs', [])]
+    outlets = [_activity_from_spec(spec) for spec in data.get('outlets', [])]
+    _LoadedCatalogs[path] = (jobs, outlets)
+    return jobs, outlets
+
+
+def use_catalog(file_name: str = DefaultCatalogFile):
+    """
+    Replace the contents of Jobs and Outlets with the Activities in a catalog
+    file. Games loaded afterwards use the new Activities.
+
+    :param file_name: The catalog file to read.
+    """
+    jobs, outlets = load_catalog(file_name)
+    ids = [act.id for act in jobs + outlets]
+    if len(set(ids)) != len(ids):
+        raise ValueError("Activity IDs in catalog are not unique")
+    Jobs[:] = jobs
+    Outlets[:] = outlets
+    _index_catalog()
+
+
+def _activity_from_spec(spec: Dict[str, Any]) -> Activity:
+    try:
+        duration = spec['duration']
+        if isinstance(duration, dict):
+            duration = timedelta(**duration)
+        params = {}
+        for param, kind in _CurveKinds:
+            params[param] = curves.from_spec(spec.get(param, 0), kind, CustomCurves)
+        return Activity(spec['id'], spec['name'], duration, **params)
+    except (KeyError, TypeError, ValueError) as e:
+        msg = "Bad catalog entry for activity {!r}: {!s}"
+        raise ValueError(msg.format(spec.get('name', spec.get('id', None)), str(e)))
+
+
+Jobs: List[Activity] = []
+Outlets: List[Activity] = []
+
+
+# id-keyed lookup tables over the catalog; rebuilt by _index_catalog() whenever
+# Jobs or Outlets change so that lookups never need to scan the lists.
+_ActivitiesById: Dict[int, Activity] = {}
+_JobIndexesById: Dict[int, int] = {}
+_OutletIndexesById: Dict[int, int] = {}
+
+
+def _index_catalog():
+    """
+    Rebuild the id-keyed lookup tables from the current contents of Jobs and
+    Outlets.
+    """
+    _ActivitiesById.clear()
+    _JobIndexesById.clear()
+    _OutletIndexesById.clear()
+    for idx, act in enumerate(Jobs):
+        _ActivitiesById[act.id] = act
+        _JobIndexesById[act.id] = idx
+    for idx, act in enumerate(Outlets):
+        _ActivitiesById[act.id] = act
+        _OutletIndexesById[act.id] = idx
+
+
+use_catalog()
 
 
 def from_id(id: int) -> Activity:
-    for act in Jobs:
-        if act.id == id:
-            return act
-    for act in Outlets:
-        if act.id == id:
-            return act
-    raise ValueError("No activity exists with ID: {!s}".format(id))
+    try:
+        return _ActivitiesById[id]
+    except KeyError:
+        raise ValueError("No activity exists with ID: {!s}".format(id))
+
+
+def is_job(act: Activity) -> bool:
+    """
+    Check whether an Activity is one of the Jobs in the store.
+
+    :param act: The Activity to check.
+    :return: True if act is in Jobs, False if it is in Outlets.
+    """
+    return act.id in _JobIndexesById
+
+
+def store_index(act: Activity) -> int:
+    """
+    Get the index of an Activity within the store list that contains it; Jobs if
+    it is a job or Outlets if it is an outlet.
+
+    :param act: The Activity to get the index of.
+    :return: The index of act in Jobs or Outlets.
+    """
+    if act.id in _JobIndexesById:
+        return _JobIndexesById[act.id]
+    try:
+        return _OutletIndexesById[act.id]
+    except KeyError:
+        raise ValueError("No activity exists with ID: {!s}".format(act.id))
     
 
 class Execution:
@@ -336,8 +379,8 @@ class OwnedActivities:
         ex = Execution(
             game_time,
             game_time + self.activity.duration.total_seconds(),
-            sum(self.activity.money_rate(c) for c in range(self.active)),
-            sum(self.activity.juice_rate(c) for c in range(self.active)),
+            self.activity.money_rate.total(0, self.active),
+            self.activity.juice_rate.total(0, self.active),
             self.automation_bonus
         )
         self.execution = ex
@@ -384,22 +427,22 @@ class OwnedActivities:
     # TODO: Refactor these names to better match the property names in Activity.
     @property
     def money_production(self) -> int:
-        total = sum(self.activity.money_rate(c) for c in range(self.active))
+        total = self.activity.money_rate.total(0, self.active)
         return total
         
     @property
     def juice_production(self) -> float:
-        total = sum(self.activity.juice_rate(c) for c in range(self.active))
+        total = self.activity.juice_rate.total(0, self.active)
         return total
         
     @property
     def juice_cost(self) -> float:
-        total = sum(self.activity.juice_cost(c) for c in range(self.active))
+        total = self.activity.juice_cost.total(0, self.active)
         return total
     
     @property
     def money_cost(self) -> int:
-        total = sum(self.activity.money_cost(c) for c in range(self.active))
+        total = self.activity.money_cost.total(0, self.active)
         return total
          
     @property
@@ -431,8 +474,8 @@ class OwnedActivities:
         
         self._active = new_amount
         if self.execution is not None:
-            self.execution.money = sum(self.activity.money_rate(c) for c in range(self.active))
-            self.execution.juice = sum(self.activity.juice_rate(c) for c in range(self.active))
+            self.execution.money = self.activity.money_rate.total(0, self.active)
+            self.execution.juice = self.activity.juice_rate.total(0, self.active)
             
     @property
     def automation_bonus(self) -> int:
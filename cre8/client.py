@@ -0,0 +1,387 @@
+"""
+A client for the daemon that keeps its connection open and sends commands with
+the binary protocol in the wire module, so that many commands can be sent
+without waiting for the answers to earlier ones. This is much faster than the
+CLI's one-connection-per-command protocol for bots and other programs that send
+lots of commands, especially when they are for many players:
+
+    with Client() as c:
+        first = c.submit(['-s', 'alice.p', 'click', 'job', '0'])
+        second = c.submit(['-s', 'bob.p', 'status'])
+        c.flush()
+        print(c.wait(second).stdout)
+"""
+
+import io
+import os
+import time
+import shutil
+import socket
+import tempfile
+import contextlib
+import logging
+from typing import Any, Callable, Dict, List, Optional, Sequence, Set, Tuple
+
+from .engine import RulesViolationError
+from . import daemon, wire
+
+_log = logging.getLogger(__name__)
+
+# commands that the protocol benchmark cycles through for each player
+BenchmarkCommands = (['status'], ['store'], ['click', 'job', '0'])
+
+
+class Response:
+    """
+    The daemon's answer to a command.
+    """
+
+    def __init__(self, request_id: int, result: int, stdout: str, stderr: str, message: str):
+        """
+        :param request_id: The ID that Client.submit() gave the command.
+        :param result: One of the Result codes in the wire module.
+        :param stdout: What the command wrote to stdout.
+        :param stderr: What the command wrote to stderr.
+        :param message: The error message if the command failed.
+        """
+        self.request_id = request_id
+        self.result = result
+        self.stdout = stdout
+        self.stderr = stderr
+        self.message = message
+
+    @property
+    def ok(self) -> bool:
+        return self.result == wire.ResultOk
+
+    def check(self) -> 'Response':
+        """
+        Raise an exception if the command failed; a RulesViolationError if the
+        game didn't allow it or a DaemonCommandError for anything else.
+
+        :return: This Response.
+        """
+        if self.result == wire.ResultRulesViolation:
+            raise RulesViolationError(self.message)
+        if self.result != wire.ResultOk:
+            raise daemon.DaemonCommandError(self.message)
+        return self
+
+    def __repr__(self):
+        return "Response(request_id={:d}, result={!r})".format(self.request_id, wire.ResultNames[self.result])
+
+
+class Client:
+    """
+    A connection to the daemon using the wire protocol. The daemon is started if
+    it isn't already running.
+
+    Commands given to submit() are held until flush() is called, so that many of
+    them can be sent at once. Responses can arrive in any order; wait() gets the
+    response to a particular command and receive() gets whichever arrives next.
+    """
+
+    def __init__(
+        self,
+        socket_path: Optional[str] = None,
+        cwd: Optional[str] = None,
+        start_timeout: float = daemon.DefaultStartTimeout
+    ):
+        """
+        :param socket_path: The socket that the daemon listens on. Defaults to
+        daemon.default_socket_path().
+        :param cwd: The directory that relative paths in commands are relative
+        to. Defaults to the current directory.
+        :param start_timeout: How long to wait for a newly started daemon.
+        """
+        if socket_path is None:
+            socket_path = daemon.default_socket_path()
+        if cwd is None:
+            cwd = os.getcwd()
+        self.socket_path = socket_path
+        self.cwd = os.path.abspath(cwd)
+        self._sock: Optional[socket.socket] = None
+        self._reader = wire.FrameReader()
+        self._next_id = 1
+        self._outgoing = bytearray()
+        self._in_flight: Set[int] = set()
+        # responses that have arrived but haven't been taken yet, in the order
+        # they arrived
+        self._received: Dict[int, Response] = {}
+        self._connect(start_timeout)
+
+    def __enter__(self) -> 'Client':
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        """
+        Close the connection. Commands that were sent but not answered are
+        still run by the daemon.
+        """
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+
+    @property
+    def in_flight(self) -> int:
+        """
+        The number of commands that have been submitted and not yet answered.
+        """
+        return len(self._in_flight)
+
+    def submit(self, argv: Sequence[str]) -> int:
+        """
+        Queue a command to be sent by the next flush().
+
+        :param argv: The command-line arguments of the command exactly as they
+        would be given to the CLI, including any global options such as the
+        state file.
+        :return: The ID of the request, for getting its response with wait().
+        """
+        return self._queue(wire.KindCommand, list(argv))
+
+    def flush(self):
+        """
+        Send every command submitted since the last flush.
+        """
+        if len(self._outgoing) == 0:
+            return
+        self._check_open()
+        try:
+            self._sock.sendall(self._outgoing)
+        except OSError as e:
+            raise daemon.DaemonCommandError("Lost connection to daemon while sending commands: {!s}".format(e))
+        self._outgoing.clear()
+
+    def wait(self, request_id: int) -> Response:
+        """
+        Get the response to a command, waiting for it if it hasn't arrived.
+        Commands that were submitted but not flushed are sent first.
+
+        :param request_id: The ID that submit() gave the command.
+        """
+        if request_id not in self._received and request_id not in self._in_flight:
+            raise ValueError("No command with request ID {:d} is waiting for a response".format(request_id))
+        self.flush()
+        while request_id not in self._received:
+            self._receive_more()
+        return self._received.pop(request_id)
+
+    def receive(self) -> Response:
+        """
+        Get the next response to arrive, waiting for one if none has. Commands
+        that were submitted but not flushed are sent first.
+        """
+        if len(self._received) == 0 and len(self._in_flight) == 0:
+            raise ValueError("No commands are waiting for a response")
+        self.flush()
+        while len(self._received) == 0:
+            self._receive_more()
+        request_id = next(iter(self._received))
+        return self._received.pop(request_id)
+
+    def run(self, argv: Sequence[str]) -> Response:
+        """
+        Run a single command and wait for its response.
+
+        :param argv: The command-line arguments of the command.
+        """
+        return self.wait(self.submit(argv))
+
+    def run_many(self, commands: Sequence[Sequence[str]]) -> List[Response]:
+        """
+        Send several commands at once and wait for all of their responses.
+
+        :param commands: The command-line arguments of each command.
+        :return: The response to each command, in the same order as commands.
+        """
+        ids = [self.submit(argv) for argv in commands]
+        self.flush()
+        return [self.wait(request_id) for request_id in ids]
+
+    def admin(self, name: str, *params: str) -> Response:
+        """
+        Ask the daemon about itself rather than any one game, and wait for the
+        answer. See the wire module for the requests that can be made.
+
+        :param name: The name of the request, such as 'memory'.
+        :param params: The parameters of the request.
+        """
+        return self.wait(self._queue(wire.KindAdmin, [name] + list(params)))
+
+    def _queue(self, kind: int, strings: List[str]) -> int:
+        request_id = self._next_id
+        self._next_id = (self._next_id + 1) & 0xFFFFFFFF
+        self._outgoing += wire.encode_frame(request_id, kind, strings)
+        self._in_flight.add(request_id)
+        return request_id
+
+    def _connect(self, start_timeout: float):
+        # a daemon from another build exits when it gets the hello, so the
+        # second attempt goes to a fresh one
+        for _ in range(2):
+            sock = daemon.connect(self.socket_path, start_timeout)
+            self._sock = sock
+            self._reader = wire.FrameReader()
+            try:
+                sock.sendall(wire.encode_hello(daemon.build_stamp(), self.cwd))
+                data = b''
+                while len(data) < len(wire.Magic):
+                    chunk = sock.recv(len(wire.Magic) - len(data))
+                    if chunk == b'':
+                        raise OSError("connection closed during handshake")
+                    data += chunk
+                if data != wire.Magic:
+                    raise OSError("daemon does not speak the wire protocol")
+                self._in_flight.add(0)
+                hello = self.wait(0)
+            except (OSError, daemon.DaemonCommandError) as e:
+                self.close()
+                raise daemon.DaemonUnavailableError("Could not connect to daemon: {!s}".format(e))
+            if hello.result == wire.ResultRestart:
+                _log.debug("Daemon was from a different build; starting a new one")
+                self.close()
+                continue
+            return
+        raise daemon.DaemonUnavailableError("Daemon kept restarting")
+
+    def _check_open(self):
+        if self._sock is None:
+            raise daemon.DaemonCommandError("Connection to daemon is closed")
+
+    def _receive_more(self):
+        self._check_open()
+        try:
+            data = self._sock.recv(65536)
+        except OSError as e:
+            data = b''
+            _log.debug("Error reading from daemon: {!s}".format(e))
+        if data == b'':
+            self.close()
+            msg = "Lost connection to daemon with {:d} commands unanswered".format(len(self._in_flight))
+            raise daemon.DaemonCommandError(msg)
+        try:
+            for request_id, result, strings in self._reader.feed(data):
+                stdout, stderr, message = strings
+                self._received[request_id] = Response(request_id, result, stdout, stderr, message)
+                self._in_flight.discard(request_id)
+        except ValueError as e:
+            self.close()
+            raise daemon.DaemonCommandError("Bad response from daemon: {!s}".format(e))
+
+
+class ProtocolReport:
+    """
+    The results of benchmarking the daemon's protocols against each other.
+    """
+
+    def __init__(self, config: Dict[str, Any]):
+        self.config = config
+        self.results: List[Dict[str, Any]] = []
+
+    def add(self, protocol: str, ops: int, seconds: float, rejected: int):
+        self.results.append({
+            'protocol': protocol,
+            'ops': ops,
+            'seconds': seconds,
+            'throughput': ops / seconds if seconds > 0 else 0.0,
+            'mean': seconds / ops if ops > 0 else 0.0,
+            'rejected': rejected,
+        })
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        Get the report in a form that can be written as JSON for comparing
+        builds.
+        """
+        d = {
+            'config': dict(self.config),
+            'results': [dict(r) for r in self.results]
+        }
+        return d
+
+    def __str__(self):
+        header = "{:>9s} {:>7s} {:>9s} {:>10s} {:>9s} {:>8s}"
+        row = "{:>9s} {:>7d} {:>9.3f} {:>10.1f} {:>9.3f} {:>8d}"
+        msg = header.format('protocol', 'ops', 'seconds', 'ops/s', 'mean ms', 'rejected')
+        for r in self.results:
+            msg += '\n' + row.format(
+                r['protocol'], r['ops'], r['seconds'], r['throughput'], r['mean'] * 1000, r['rejected']
+            )
+        if len(self.results) == 2 and self.results[0]['throughput'] > 0:
+            speedup = self.results[1]['throughput'] / self.results[0]['throughput']
+            msg += '\n\n{:s} is {:.1f}x the throughput of {:s}'.format(
+                self.results[1]['protocol'], speedup, self.results[0]['protocol']
+            )
+        return msg
+
+
+def benchmark(
+    parse: Callable[[List[str]], Tuple[str, Dict[str, Any]]],
+    count: int = 1000,
+    players: int = 4,
+    durability: str = 'atomic',
+    socket_path: Optional[str] = None
+) -> ProtocolReport:
+    """
+    Run the same commands through the daemon once with the CLI's JSON protocol,
+    one connection per command, and once with the wire protocol, all pipelined
+    on one connection. Each player has its own state file in a temporary
+    directory that is removed afterwards.
+
+    :param parse: Parses the command-line arguments of a command into the name
+    of its handler and its parsed arguments, for sending with the JSON
+    protocol. Commands are parsed before timing starts, as the CLI has already
+    parsed its command by the time it contacts the daemon.
+    :param count: The number of commands to run with each protocol.
+    :param players: The number of players that the commands are spread over.
+    :param durability: The durability mode each player's game saves with.
+    :param socket_path: The socket that the daemon listens on. Defaults to
+    daemon.default_socket_path().
+    :return: The results for each protocol.
+    """
+    if count < 1:
+        raise ValueError("count must be at least 1")
+    if players < 1:
+        raise ValueError("players must be at least 1")
+
+    report = ProtocolReport({'count': count, 'players': players, 'durability': durability})
+    work_dir = tempfile.mkdtemp(prefix='cre8-protocol-')
+    try:
+        states = [os.path.join(work_dir, 'player{:d}.p'.format(n)) for n in range(players)]
+        commands = []
+        for n in range(count):
+            argv = ['-s', states[n % players], '--durability', durability]
+            commands.append(argv + BenchmarkCommands[(n // players) % len(BenchmarkCommands)])
+        parsed = [parse(argv) for argv in commands]
+
+        # load every player's game before timing either protocol
+        with Client(socket_path, work_dir) as c:
+            for resp in c.run_many([['-s', s, '--durability', durability, 'status'] for s in states]):
+                resp.check()
+
+        rejected = 0
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+            for handler, args in parsed:
+                try:
+                    daemon.forward(handler, args, socket_path=socket_path)
+                except RulesViolationError:
+                    rejected += 1
+        report.add('json', count, time.perf_counter() - start, rejected)
+
+        start = time.perf_counter()
+        with Client(socket_path, work_dir) as c:
+            responses = c.run_many(commands)
+        elapsed = time.perf_counter() - start
+        for resp in responses:
+            if resp.result == wire.ResultError:
+                resp.check()
+        rejected = sum(1 for resp in responses if resp.result == wire.ResultRulesViolation)
+        report.add('wire', count, elapsed, rejected)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return report
@@ -0,0 +1,106 @@
+"""
+Clocks that give the current time of day to Engines and to saving and loading
+state. Games normally use the real time, but can be given a clock that is
+stopped or that runs faster than real time, so that they can be tested,
+benchmarked, and balanced without waiting for hours to pass.
+"""
+
+import time
+from datetime import datetime, timezone, timedelta
+from typing import Optional
+
+
+class Clock:
+    """
+    Gives the current time. Subclasses must override now().
+    """
+
+    def now(self) -> datetime:
+        """
+        Get the current time as a timezone-aware datetime.
+        """
+        raise NotImplementedError("now() must be implemented by subclasses")
+
+
+class RealClock(Clock):
+    """
+    Gives the real current time in UTC.
+    """
+
+    def now(self) -> datetime:
+        return datetime.now(timezone.utc)
+
+    def __repr__(self):
+        return "RealClock()"
+
+
+class FixedClock(Clock):
+    """
+    Gives the same time until it is set or advanced.
+    """
+
+    def __init__(self, at: Optional[datetime] = None):
+        """
+        :param at: The time to give. Defaults to the real current time.
+        """
+        self._at = at if at is not None else datetime.now(timezone.utc)
+
+    def now(self) -> datetime:
+        return self._at
+
+    def set(self, at: datetime):
+        """
+        Change the time that is given.
+
+        :param at: The new time.
+        """
+        self._at = at
+
+    def advance(self, seconds: float):
+        """
+        Move the time that is given forward.
+
+        :param seconds: How far to move it.
+        """
+        self._at += timedelta(seconds=seconds)
+
+    def __repr__(self):
+        return "FixedClock(at={!r})".format(self._at)
+
+
+class ScaledClock(Clock):
+    """
+    Gives a time that passes a set number of times faster than real time,
+    starting from a given time when the clock is created.
+    """
+
+    def __init__(self, speed: float, start: Optional[datetime] = None):
+        """
+        :param speed: How many seconds pass on this clock for each real second.
+        :param start: The time that the clock gives when it is created. Defaults
+        to the real current time.
+        """
+        if speed <= 0:
+            raise ValueError("speed must be greater than 0")
+        self.speed = speed
+        self.start = start if start is not None else datetime.now(timezone.utc)
+        self._started = time.monotonic()
+
+    @property
+    def elapsed(self) -> float:
+        """
+        The number of seconds that have passed on this clock since it was
+        created.
+        """
+        return (time.monotonic() - self._started) * self.speed
+
+    def now(self) -> datetime:
+        return self.start + timedelta(seconds=self.elapsed)
+
+    def __repr__(self):
+        return "ScaledClock(speed={!r}, start={!r})".format(self.speed, self.start)
+
+
+# the clock used by Engines and by saving and loading state unless they are
+# given a different one
+DefaultClock = RealClock()
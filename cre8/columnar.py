@@ -0,0 +1,652 @@
+"""
+Columnar state for advancing many resident games at once. Instead of calling
+Engine._advance() for each player, which walks their OwnedActivities one
+Execution at a time, the values that advancing needs are kept in flat arrays
+with one row per player, and every due Execution of every player is completed
+in a single pass.
+
+For each owned activity, the number of completions within the idle time and the
+point where automation stops for lack of money or juice have closed forms, so a
+pass does a fixed amount of work per activity in the catalog no matter how many
+players there are or how long they were idle. NumPy is used for the pass when
+it is installed; otherwise it runs over the same arrays in plain Python, which
+is still much cheaper than going through each player's objects.
+
+The arrays are the up-to-date copy of a game after a pass, and its GameState is
+only brought up to date by materialize() when something needs it, such as a
+command for that player. Games whose money is too large for 64-bit integers are
+advanced with Engine._advance() instead.
+"""
+
+import math
+import time
+import array
+import random
+import logging
+from datetime import datetime, timezone, timedelta
+from typing import Any, Dict, List, Optional
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from .engine import Engine, seed_func
+from .activities import Execution, OwnedActivities
+from .clock import Clock, DefaultClock
+from . import activities, metrics
+
+_log = logging.getLogger(__name__)
+
+# money, prices, and incomes at or above this are not put in the arrays, so that
+# a pass can't overflow them
+SafeMoney = 2 ** 53
+
+# how much larger than SafeMoney money can grow during a pass before the game
+# is advanced by its Engine instead
+_MaxMoney = 2 ** 62
+
+_advance_seconds = metrics.registry.histogram(
+    'cre8_columnar_advance_seconds', "Time taken to advance every game in a columnar store at once"
+)
+_scalar_advances = metrics.registry.counter(
+    'cre8_columnar_scalar_advances_total', "Games in a columnar store that had to be advanced one at a time"
+)
+
+# (name, typecode) of the arrays with one entry per player
+_PlayerColumns = (
+    ('live', 'b'),  # whether the row holds a game that can be advanced in the arrays
+    ('stale', 'b'),  # whether the arrays have been advanced past the GameState
+    ('money', 'q'),
+    ('juice', 'd'),
+    ('seeds', 'd'),
+    ('time', 'd'),
+    ('last', 'd'),  # POSIX timestamp of the last advancement
+)
+
+# (name, typecode) of the arrays with one entry per player per activity in the
+# catalog
+_SlotColumns = (
+    ('owned', 'b'),
+    ('changed', 'b'),  # whether the Execution or automation differ from the OwnedActivities
+    ('automated', 'b'),
+    ('running', 'b'),  # whether there is an Execution
+    ('start', 'd'),
+    ('end', 'd'),
+    ('exec_money', 'q'),
+    ('exec_juice', 'd'),
+    ('exec_seeds', 'd'),  # seeds given when the current Execution completes
+    ('exec_bonus', 'q'),
+    ('duration', 'd'),
+    ('next_money', 'q'),  # the values of an Execution started now
+    ('next_juice', 'd'),
+    ('next_seeds', 'd'),
+    ('bonus', 'q'),
+    ('money_cost', 'q'),
+    ('juice_cost', 'd'),
+)
+
+
+class ColumnarGames:
+    """
+    The games of many resident Engines, laid out as arrays so they can all be
+    advanced at once.
+
+    An Engine is added with load(), which copies its game into the arrays, and
+    must be loaded again after anything but this class changes its game. Before
+    anything reads an Engine's game after advance(), materialize() must be
+    called to copy the advanced state back.
+    """
+
+    def __init__(self, use_numpy: Optional[bool] = None, clock: Clock = DefaultClock):
+        """
+        :param use_numpy: Whether to use NumPy for passes. Defaults to using it
+        if it is installed.
+        :param clock: Gives the time that advance() advances games to when it
+        isn't given one.
+        """
+        if use_numpy is None:
+            use_numpy = numpy is not None
+        if use_numpy and numpy is None:
+            raise ValueError("NumPy is not installed")
+        self.use_numpy = use_numpy
+        self.clock = clock
+        # activities are laid out in the order that Engine._advance() visits
+        # them, which is the order of the store
+        self._slots = list(activities.Jobs) + list(activities.Outlets)
+        self._slot_by_id = {act.id: k for k, act in enumerate(self._slots)}
+        self._engines: List[Optional[Engine]] = []
+        self._rows: Dict[int, int] = {}
+        self._free_rows: List[int] = []
+        self._player_cols: Dict[str, array.array] = {name: array.array(code) for name, code in _PlayerColumns}
+        self._slot_cols: Dict[str, array.array] = {name: array.array(code) for name, code in _SlotColumns}
+        self._zero_players = {name: array.array(code, [0]) for name, code in _PlayerColumns}
+        self._zero_slots = {name: array.array(code, [0] * len(self._slots)) for name, code in _SlotColumns}
+
+    def __len__(self):
+        return len(self._rows)
+
+    def __contains__(self, eng: Engine) -> bool:
+        return id(eng) in self._rows
+
+    @property
+    def engines(self) -> List[Engine]:
+        """
+        The Engines whose games are in the arrays.
+        """
+        return [eng for eng in self._engines if eng is not None]
+
+    def load(self, eng: Engine):
+        """
+        Copy an Engine's game into the arrays, adding it if it isn't already in
+        them. Any advancement that hasn't been materialized is lost, so this
+        must only be called when the Engine's game is up to date.
+
+        :param eng: The Engine to load.
+        """
+        row = self._rows.get(id(eng), None)
+        if row is None:
+            row = self._allocate(eng)
+        gs = eng.game
+        pc = self._player_cols
+        sc = self._slot_cols
+        slot_count = len(self._slots)
+        base = row * slot_count
+        for name, _ in _SlotColumns:
+            sc[name][base:base + slot_count] = self._zero_slots[name]
+
+        live = abs(gs.money) < SafeMoney
+        for oa in gs.jobs + gs.outlets:
+            k = self._slot_by_id.get(oa.activity.id, None)
+            duration = oa.activity.duration.total_seconds()
+            if k is None or duration <= 0:
+                # not in the catalog the arrays were laid out for, or would
+                # never finish advancing
+                live = False
+                break
+            money = oa.money_production
+            juice = oa.juice_production
+            cost = oa.money_cost
+            if max(abs(money), abs(cost)) >= SafeMoney:
+                live = False
+                break
+            i = base + k
+            sc['owned'][i] = 1
+            sc['automated'][i] = oa.automated
+            sc['duration'][i] = duration
+            sc['next_money'][i] = money
+            sc['next_juice'][i] = juice
+            sc['bonus'][i] = oa.automation_bonus
+            sc['next_seeds'][i] = seed_func(Execution(0.0, duration, money, juice, oa.automation_bonus))
+            sc['money_cost'][i] = cost
+            sc['juice_cost'][i] = oa.juice_cost
+            ex = oa.execution
+            if ex is not None:
+                if abs(ex.money) >= SafeMoney:
+                    live = False
+                    break
+                sc['running'][i] = 1
+                sc['start'][i] = ex.start
+                sc['end'][i] = ex.end
+                sc['exec_money'][i] = ex.money
+                sc['exec_juice'][i] = ex.juice
+                sc['exec_seeds'][i] = seed_func(ex)
+                sc['exec_bonus'][i] = ex.auto_multiplier
+
+        pc['live'][row] = live
+        pc['stale'][row] = 0
+        if live:
+            pc['money'][row] = gs.money
+            pc['juice'][row] = gs.juice
+            pc['seeds'][row] = gs.seeds
+            pc['time'][row] = gs.time
+            pc['last'][row] = gs.last_advancement.timestamp()
+
+    def materialize(self, eng: Engine) -> bool:
+        """
+        Copy the advanced state of an Engine's game from the arrays back to its
+        GameState, if it has been advanced since it was last loaded or
+        materialized.
+
+        :param eng: The Engine whose game to bring up to date.
+        :return: Whether anything was copied.
+        """
+        row = self._rows[id(eng)]
+        pc = self._player_cols
+        if not pc['stale'][row]:
+            return False
+        sc = self._slot_cols
+        gs = eng.game
+        gs.money = pc['money'][row]
+        gs.juice = pc['juice'][row]
+        gs.seeds = pc['seeds'][row]
+        gs.time = pc['time'][row]
+        gs.last_advancement = datetime.fromtimestamp(pc['last'][row], timezone.utc)
+        base = row * len(self._slots)
+        for oa in gs.jobs + gs.outlets:
+            i = base + self._slot_by_id[oa.activity.id]
+            if not sc['changed'][i]:
+                continue
+            sc['changed'][i] = 0
+            if sc['running'][i]:
+                oa.execution = Execution(
+                    sc['start'][i], sc['end'][i], sc['exec_money'][i], sc['exec_juice'][i], sc['exec_bonus'][i]
+                )
+            else:
+                oa.execution = None
+            oa.automated = bool(sc['automated'][i])
+        pc['stale'][row] = 0
+        eng.after_advance()
+        return True
+
+    def remove(self, eng: Engine) -> bool:
+        """
+        Materialize an Engine's game and take it out of the arrays.
+
+        :param eng: The Engine to remove.
+        :return: Whether it was in the arrays.
+        """
+        row = self._rows.get(id(eng), None)
+        if row is None:
+            return False
+        self.materialize(eng)
+        del self._rows[id(eng)]
+        self._engines[row] = None
+        self._player_cols['live'][row] = 0
+        self._player_cols['stale'][row] = 0
+        self._free_rows.append(row)
+        return True
+
+    def advance(self, now: Optional[datetime] = None) -> int:
+        """
+        Advance every game in the arrays to the given time, completing every
+        Execution that is due.
+
+        :param now: The time to advance to. Defaults to the current time on the
+        clock.
+        :return: The number of Executions that were completed.
+        """
+        if now is None:
+            now = self.clock.now()
+        with _advance_seconds.time():
+            if self.use_numpy:
+                completions, scalar_rows = self._advance_numpy(now.timestamp())
+            else:
+                completions, scalar_rows = self._advance_arrays(now.timestamp())
+
+            for row in scalar_rows:
+                eng = self._engines[row]
+                self.materialize(eng)
+                idle = (now - eng.game.last_advancement).total_seconds()
+                if idle < 0:
+                    continue
+                _scalar_advances.inc()
+                eng._advance(idle, now)
+                eng.after_advance()
+                self.load(eng)
+        return completions
+
+    def _allocate(self, eng: Engine) -> int:
+        if len(self._free_rows) > 0:
+            row = self._free_rows.pop()
+            self._engines[row] = eng
+        else:
+            row = len(self._engines)
+            self._engines.append(eng)
+            for name, _ in _PlayerColumns:
+                self._player_cols[name].extend(self._zero_players[name])
+            for name, _ in _SlotColumns:
+                self._slot_cols[name].extend(self._zero_slots[name])
+        self._rows[id(eng)] = row
+        return row
+
+    def _advance_numpy(self, now_ts: float):
+        np = numpy
+        pc = {name: np.frombuffer(self._player_cols[name], dtype=_dtype(code)) for name, code in _PlayerColumns}
+        slot_count = len(self._slots)
+        player_count = len(self._engines)
+        sc = {
+            name: np.frombuffer(self._slot_cols[name], dtype=_dtype(code)).reshape(player_count, slot_count)
+            for name, code in _SlotColumns
+        }
+        if player_count == 0:
+            return 0, []
+
+        idle = now_ts - pc['last']
+        active = (pc['live'] == 1) & (idle >= 0)
+        game_time = pc['time'] + idle
+
+        # games that could earn too much in one pass to fit in the arrays are
+        # given to their Engines instead
+        possible = np.floor(np.maximum(idle, 0)[:, None] / np.where(sc['duration'] > 0, sc['duration'], 1)) + 1
+        most = pc['money'].astype(np.float64) + (possible * np.abs(sc['next_money'])).sum(axis=1)
+        most += np.abs(sc['exec_money']).sum(axis=1)
+        too_large = active & (most >= _MaxMoney)
+        active &= ~too_large
+        scalar_rows = [int(r) for r in np.nonzero(too_large)[0]]
+
+        adv_money = np.zeros(player_count, dtype=np.int64)
+        adv_juice = np.zeros(player_count, dtype=np.float64)
+        adv_seeds = np.zeros(player_count, dtype=np.float64)
+        game_money = pc['money'].astype(np.int64)
+        used_juice = (sc['running'] * sc['juice_cost']).sum(axis=1)
+        completions = 0
+
+        for k in range(slot_count):
+            rows = np.nonzero(active & (sc['running'][:, k] == 1) & (sc['end'][:, k] <= game_time))[0]
+            if len(rows) == 0:
+                continue
+            end = sc['end'][rows, k]
+            duration = sc['duration'][rows, k]
+            money = sc['next_money'][rows, k]
+            juice = sc['next_juice'][rows, k]
+            cost = sc['money_cost'][rows, k]
+            juice_cost = sc['juice_cost'][rows, k]
+            automated = sc['automated'][rows, k] == 1
+            first_money = sc['exec_money'][rows, k]
+            first_juice = sc['exec_juice'][rows, k]
+
+            # the Execution is cleared before automation checks what is free
+            used_juice[rows] -= juice_cost
+
+            # ends at or before now, spaced by the duration
+            due = np.floor((game_time[rows] - end) / duration).astype(np.int64) + 1
+
+            # the first completion that automation can't afford to follow with
+            # another Execution; after completion j it needs
+            # base + (j - 1) * gain >= 0 of both money and juice
+            money_base = game_money[rows] + adv_money[rows] + first_money - cost
+            money_gain = money - cost
+            money_fail = np.where(
+                money_base < 0, 1,
+                np.where(money_gain >= 0, due + 1, money_base // np.where(money_gain < 0, -money_gain, 1) + 2)
+            )
+            juice_base = pc['juice'][rows] - used_juice[rows] + adv_juice[rows] + first_juice - juice_cost
+            juice_fail = np.where(
+                juice_base < 0, 1,
+                np.where(juice >= 0, due + 1, np.floor(juice_base / np.where(juice < 0, -juice, 1)) + 2)
+            ).astype(np.int64)
+            fail = np.where(automated, np.minimum(np.minimum(money_fail, juice_fail), due + 1), 1)
+
+            halted = fail <= due
+            count = np.where(halted, fail, due)
+            restarts = np.where(halted, count - 1, count)
+
+            adv_money[rows] += first_money + (count - 1) * money
+            adv_juice[rows] += first_juice + (count - 1) * juice
+            adv_seeds[rows] += sc['exec_seeds'][rows, k] + (count - 1) * sc['next_seeds'][rows, k]
+            game_money[rows] -= restarts * cost
+            completions += int(count.sum())
+
+            keep = ~halted
+            sc['changed'][rows, k] = 1
+            sc['running'][rows, k] = keep
+            sc['automated'][rows, k] = automated & keep
+            kept = rows[keep]
+            sc['start'][kept, k] = end[keep] + (due[keep] - 1) * duration[keep]
+            sc['end'][kept, k] = end[keep] + due[keep] * duration[keep]
+            sc['exec_money'][kept, k] = money[keep]
+            sc['exec_juice'][kept, k] = juice[keep]
+            sc['exec_seeds'][kept, k] = sc['next_seeds'][kept, k]
+            sc['exec_bonus'][kept, k] = sc['bonus'][kept, k]
+            used_juice[kept] += juice_cost[keep]
+
+        pc['money'][active] = (game_money + adv_money)[active]
+        pc['juice'][active] += adv_juice[active]
+        pc['seeds'][active] += adv_seeds[active]
+        pc['time'][active] = game_time[active]
+        pc['last'][active] = now_ts
+        pc['stale'][active] = 1
+        return completions, scalar_rows
+
+    def _advance_arrays(self, now_ts: float):
+        pc = self._player_cols
+        sc = self._slot_cols
+        live = pc['live']
+        owned = sc['owned']
+        running = sc['running']
+        end_col = sc['end']
+        slot_count = len(self._slots)
+        completions = 0
+        scalar_rows = []
+
+        for row in range(len(self._engines)):
+            if not live[row]:
+                continue
+            idle = now_ts - pc['last'][row]
+            if idle < 0:
+                continue
+            base = row * slot_count
+            game_time = pc['time'][row] + idle
+
+            most = pc['money'][row]
+            for i in range(base, base + slot_count):
+                if owned[i]:
+                    most += abs(sc['exec_money'][i]) + (idle // sc['duration'][i] + 1) * abs(sc['next_money'][i])
+            if most >= _MaxMoney:
+                scalar_rows.append(row)
+                continue
+
+            game_money = pc['money'][row]
+            juice_total = pc['juice'][row]
+            adv_money = 0
+            adv_juice = 0.0
+            adv_seeds = 0.0
+            used_juice = 0.0
+            for i in range(base, base + slot_count):
+                if running[i]:
+                    used_juice += sc['juice_cost'][i]
+
+            for i in range(base, base + slot_count):
+                if not running[i] or end_col[i] > game_time:
+                    continue
+                end = end_col[i]
+                duration = sc['duration'][i]
+                money = sc['next_money'][i]
+                juice = sc['next_juice'][i]
+                cost = sc['money_cost'][i]
+                juice_cost = sc['juice_cost'][i]
+                first_money = sc['exec_money'][i]
+                first_juice = sc['exec_juice'][i]
+                used_juice -= juice_cost
+
+                due = int(math.floor((game_time - end) / duration)) + 1
+                if sc['automated'][i]:
+                    fail = due + 1
+                    money_base = game_money + adv_money + first_money - cost
+                    if money_base < 0:
+                        fail = 1
+                    elif money < cost:
+                        fail = min(fail, money_base // (cost - money) + 2)
+                    juice_base = juice_total - used_juice + adv_juice + first_juice - juice_cost
+                    if juice_base < 0:
+                        fail = 1
+                    elif juice < 0:
+                        fail = min(fail, int(math.floor(juice_base / -juice)) + 2)
+                else:
+                    fail = 1
+
+                halted = fail <= due
+                count = fail if halted else due
+                restarts = count - 1 if halted else count
+                adv_money += first_money + (count - 1) * money
+                adv_juice += first_juice + (count - 1) * juice
+                adv_seeds += sc['exec_seeds'][i] + (count - 1) * sc['next_seeds'][i]
+                game_money -= restarts * cost
+                completions += count
+
+                sc['changed'][i] = 1
+                if halted:
+                    running[i] = 0
+                    sc['automated'][i] = 0
+                else:
+                    sc['start'][i] = end + (due - 1) * duration
+                    end_col[i] = end + due * duration
+                    sc['exec_money'][i] = money
+                    sc['exec_juice'][i] = juice
+                    sc['exec_seeds'][i] = sc['next_seeds'][i]
+                    sc['exec_bonus'][i] = sc['bonus'][i]
+                    used_juice += juice_cost
+
+            pc['money'][row] = game_money + adv_money
+            pc['juice'][row] = juice_total + adv_juice
+            pc['seeds'][row] += adv_seeds
+            pc['time'][row] = game_time
+            pc['last'][row] = now_ts
+            pc['stale'][row] = 1
+        return completions, scalar_rows
+
+
+def _dtype(typecode: str):
+    return {'b': numpy.int8, 'q': numpy.int64, 'd': numpy.float64}[typecode]
+
+
+class BatchReport:
+    """
+    The results of comparing a columnar pass with advancing each game by its
+    Engine.
+    """
+
+    def __init__(self, config: Dict[str, Any]):
+        self.config = config
+        self.engine_seconds = 0.0
+        self.columnar_seconds = 0.0
+        self.materialize_seconds = 0.0
+        self.completions = 0
+        self.mismatches = 0
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        Get the report in a form that can be written as JSON for comparing
+        builds.
+        """
+        d = {
+            'config': dict(self.config),
+            'engine_seconds': self.engine_seconds,
+            'columnar_seconds': self.columnar_seconds,
+            'materialize_seconds': self.materialize_seconds,
+            'completions': self.completions,
+            'mismatches': self.mismatches,
+        }
+        return d
+
+    def __str__(self):
+        players = self.config['players']
+        msg = "Advanced {:d} games idle for {:.0f}s ({:d} executions completed) using {:s}".format(
+            players, self.config['idle_seconds'], self.completions, self.config['backend']
+        )
+        msg += "\n{:<22s} {:>10s} {:>12s}".format('', 'seconds', 'games/s')
+        rows = (
+            ('engine per game', self.engine_seconds),
+            ('columnar pass', self.columnar_seconds),
+            ('materialize all', self.materialize_seconds),
+        )
+        for name, seconds in rows:
+            rate = players / seconds if seconds > 0 else 0.0
+            msg += "\n{:<22s} {:>10.4f} {:>12.1f}".format(name, seconds, rate)
+        if self.columnar_seconds > 0:
+            msg += "\n\nThe columnar pass was {:.1f}x as fast".format(self.engine_seconds / self.columnar_seconds)
+        msg += "\nGames whose results differed: {:d}".format(self.mismatches)
+        return msg
+
+
+def benchmark(
+    players: int = 2000,
+    idle_seconds: float = 3600.0,
+    seed: Optional[int] = None,
+    use_numpy: Optional[bool] = None
+) -> BatchReport:
+    """
+    Advance the same randomly made games once by calling Engine._advance() for
+    each and once with a single columnar pass, then check that both came out
+    the same. The games are only kept in memory.
+
+    :param players: The number of games to advance.
+    :param idle_seconds: How long each game has been idle for.
+    :param seed: Seed for making the games, so runs can be repeated.
+    :param use_numpy: Whether the columnar pass uses NumPy. Defaults to using it
+    if it is installed.
+    :return: The time each took, and how many games came out differently.
+    """
+    if players < 1:
+        raise ValueError("players must be at least 1")
+    columns = ColumnarGames(use_numpy)
+    config = {
+        'players': players,
+        'idle_seconds': idle_seconds,
+        'seed': seed,
+        'backend': 'numpy' if columns.use_numpy else 'array',
+    }
+    report = BatchReport(config)
+    if seed is None:
+        seed = random.randrange(2 ** 32)
+    now = datetime.now(timezone.utc)
+    rng = random.Random(seed)
+    by_engine = [_random_engine(rng, now - timedelta(seconds=idle_seconds)) for _ in range(players)]
+    rng = random.Random(seed)
+    by_columns = [_random_engine(rng, now - timedelta(seconds=idle_seconds)) for _ in range(players)]
+
+    start = time.perf_counter()
+    for eng in by_engine:
+        eng._advance((now - eng.game.last_advancement).total_seconds())
+    report.engine_seconds = time.perf_counter() - start
+
+    for eng in by_columns:
+        columns.load(eng)
+    start = time.perf_counter()
+    report.completions = columns.advance(now)
+    report.columnar_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for eng in by_columns:
+        columns.materialize(eng)
+    report.materialize_seconds = time.perf_counter() - start
+
+    for expected, actual in zip(by_engine, by_columns):
+        if not _same_game(expected.game, actual.game):
+            report.mismatches += 1
+    return report
+
+
+def _random_engine(rng: random.Random, last_advancement: datetime) -> Engine:
+    eng = Engine(None)
+    gs = eng.game
+    gs.money = rng.randrange(0, 10 ** rng.randrange(1, 8))
+    gs.juice = rng.random() * 10 ** rng.randrange(0, 4)
+    gs.last_advancement = last_advancement
+    gs.time = rng.random() * 10 ** 5
+    for act in list(activities.Jobs) + list(activities.Outlets):
+        oa = gs.owned(act)
+        if oa is None:
+            if rng.random() < 0.5:
+                continue
+            oa = OwnedActivities(act, 0, 0, 0)
+            gs.add_owned(oa)
+        oa.count = rng.randrange(1, 60)
+        oa.active = rng.randrange(0, oa.count + 1)
+        oa.automations = rng.randrange(0, 4)
+        oa.automated = oa.automations > 0 and rng.random() < 0.8
+        if oa.execution is None and oa.active > 0 and rng.random() < 0.9:
+            oa.execute(gs.time - rng.random() * oa.activity.duration.total_seconds())
+    return eng
+
+
+def _same_game(expected, actual) -> bool:
+    if expected.money != actual.money or not _close(expected.time, actual.time):
+        return False
+    if not _close(expected.juice, actual.juice) or not _close(expected.seeds, actual.seeds):
+        return False
+    for oa_e, oa_a in zip(expected.jobs + expected.outlets, actual.jobs + actual.outlets):
+        if oa_e.automated != oa_a.automated or (oa_e.execution is None) != (oa_a.execution is None):
+            return False
+        ex_e, ex_a = oa_e.execution, oa_a.execution
+        if ex_e is not None:
+            if not _close(ex_e.end, ex_a.end) or ex_e.money != ex_a.money or not _close(ex_e.juice, ex_a.juice):
+                return False
+    return True
+
+
+def _close(a: float, b: float) -> bool:
+    # completions are added up in a different order, so float totals can
+    # differ in their last few bits
+    return math.isclose(a, b, rel_tol=1e-9, abs_tol=1e-9)
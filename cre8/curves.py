@@ -0,0 +1,469 @@
+"""
+Typed curves for the values of an Activity that depend on how many of
+something are owned, such as the price of the next instance or the money that
+the next instance produces. Because the form of each typed curve is known, the
+sum of a run of its values and the number of values that fit within a budget
+can be found without evaluating every value.
+
+NumPy is used to evaluate many points at once if it is installed, but is not
+required.
+"""
+
+import math
+import threading
+from fractions import Fraction
+from typing import Callable, Union, Sequence, List, Dict, Any, Optional
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+Number = Union[int, float]
+
+# ways that the values of an ExponentialCurve can be made into ints
+Roundings = ('none', 'round', 'floor')
+
+
+class Curve:
+    """
+    A function of a non-negative int x, such as the number of instances already
+    owned. Subclasses override total() and max_affordable() with closed forms
+    where they can.
+    """
+
+    type_name = ''
+
+    def __call__(self, x: int) -> Number:
+        raise NotImplementedError
+
+    def total(self, start: int, amount: int) -> Number:
+        """
+        Get the sum of the values at start through start+amount-1.
+
+        :param start: The first x to include.
+        :param amount: The number of consecutive values to add up.
+        :return: The sum, which is 0 if amount is less than 1.
+        """
+        return sum(self(x) for x in range(start, start + amount))
+
+    def max_affordable(self, start: int, budget: Number) -> int:
+        """
+        Get the largest amount such that total(start, amount) is no more than
+        budget. Values must be positive.
+
+        :param start: The first x to include.
+        :param budget: The most that the total can be.
+        :return: The amount.
+        """
+        return _search_affordable(self, start, budget, 1)
+
+    def evaluate(self, xs: Sequence[int]) -> Union[List[Number], Any]:
+        """
+        Evaluate the curve at many points at once. If xs is a NumPy array the
+        result is a NumPy array computed with array operations (and so in
+        floating point); otherwise it is a list.
+
+        :param xs: The points to evaluate the curve at.
+        """
+        return [self(x) for x in xs]
+
+    def to_dict(self) -> Dict[str, Any]:
+        raise NotImplementedError
+
+
+class ConstantCurve(Curve):
+    """
+    The same value for every x.
+    """
+
+    type_name = 'constant'
+
+    def __init__(self, value: Number):
+        self.value = value
+
+    def __call__(self, x: int) -> Number:
+        return self.value
+
+    def __repr__(self):
+        return "ConstantCurve({!r})".format(self.value)
+
+    def total(self, start: int, amount: int) -> Number:
+        if amount < 1:
+            return self.value * 0
+        return self.value * amount
+
+    def max_affordable(self, start: int, budget: Number) -> int:
+        if self.value <= 0:
+            raise ValueError("Can't find max affordable of a curve that is not positive: {!r}".format(self))
+        if isinstance(self.value, int) and isinstance(budget, int):
+            return max(budget // self.value, 0)
+        return max(math.floor(budget / self.value), 0)
+
+    def evaluate(self, xs: Sequence[int]) -> Union[List[Number], Any]:
+        if _is_array(xs):
+            return numpy.full(xs.shape, self.value, dtype=float)
+        return [self.value] * len(xs)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {'type': self.type_name, 'value': self.value}
+
+
+class LinearCurve(Curve):
+    """
+    intercept + slope * x
+    """
+
+    type_name = 'linear'
+
+    def __init__(self, intercept: Number, slope: Number):
+        self.intercept = intercept
+        self.slope = slope
+
+    def __call__(self, x: int) -> Number:
+        return self.intercept + self.slope * x
+
+    def __repr__(self):
+        return "LinearCurve(intercept={!r}, slope={!r})".format(self.intercept, self.slope)
+
+    def total(self, start: int, amount: int) -> Number:
+        if amount < 1:
+            return self.intercept * 0
+        # amount * (2*start + amount - 1) is always even, so ints stay exact
+        return self.intercept * amount + self.slope * (amount * (2 * start + amount - 1) // 2)
+
+    def max_affordable(self, start: int, budget: Number) -> int:
+        # solve slope/2 * n**2 + (intercept + slope*start - slope/2) * n = budget
+        a = self.slope / 2
+        b = self.intercept + self.slope * start - self.slope / 2
+        if a == 0:
+            if b <= 0:
+                raise ValueError("Can't find max affordable of a curve that is not positive: {!r}".format(self))
+            estimate = budget / b
+        else:
+            estimate = (-b + math.sqrt(max(b * b + 4 * a * budget, 0.0))) / (2 * a)
+        return _search_affordable(self, start, budget, estimate)
+
+    def evaluate(self, xs: Sequence[int]) -> Union[List[Number], Any]:
+        if _is_array(xs):
+            return self.intercept + self.slope * xs.astype(float)
+        return [self(x) for x in xs]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {'type': self.type_name, 'intercept': self.intercept, 'slope': self.slope}
+
+
+class ExponentialCurve(Curve):
+    """
+    offset + scale * base**x, optionally rounded or floored to an int.
+
+    Sums are found in closed form with the formula for a geometric series. If
+    offset, scale, and base are all ints the sums are exact. Rounded curves are
+    not exactly a geometric series, so their sums are kept as a cache of
+    running totals instead.
+    """
+
+    type_name = 'exponential'
+
+    def __init__(self, offset: Number, scale: Number, base: Number, rounding: str = 'none'):
+        """
+        :param offset: Flat amount added to every value.
+        :param scale: Multiplier applied to the exponential part.
+        :param base: Base of the exponential part. Must be greater than 1.
+        :param rounding: 'none' to leave values as they are, 'round' to round
+        them to the nearest int, or 'floor' to truncate them to an int.
+        """
+        if base <= 1:
+            raise ValueError("base must be greater than 1: {!r}".format(base))
+        if rounding not in Roundings:
+            raise ValueError("rounding must be one of 'none', 'round', or 'floor'")
+        self.offset = offset
+        self.scale = scale
+        self.base = base
+        self.rounding = rounding
+        self._sums: List[int] = [0]
+
+    def __call__(self, x: int) -> Number:
+        value = self.offset + self.scale * (self.base ** x)
+        if self.rounding == 'round':
+            return round(value)
+        if self.rounding == 'floor':
+            return int(value)
+        return value
+
+    def __repr__(self):
+        msg = "ExponentialCurve(offset={!r}, scale={!r}, base={!r}, rounding={!r})"
+        return msg.format(self.offset, self.scale, self.base, self.rounding)
+
+    def total(self, start: int, amount: int) -> Number:
+        if amount < 1:
+            return 0
+        if self.rounding != 'none':
+            return _cached_total(self, self._sums, start, amount)
+        if all(isinstance(v, int) for v in (self.offset, self.scale, self.base)):
+            series = (self.base ** start) * ((self.base ** amount) - 1) // (self.base - 1)
+        else:
+            series = (self.base ** start) * ((self.base ** amount) - 1) / (self.base - 1)
+        return (self.offset * amount) + (self.scale * series)
+
+    def max_affordable(self, start: int, budget: Number) -> int:
+        if self.scale <= 0 or budget <= 0:
+            return _search_affordable(self, start, budget, 1)
+        # ignoring the offset gives an upper bound on how many fit
+        try:
+            ratio = budget * (self.base - 1) / (self.scale * (self.base ** start)) + 1
+            estimate = math.log(ratio, self.base)
+        except OverflowError:
+            estimate = 1
+        return _search_affordable(self, start, budget, estimate)
+
+    def evaluate(self, xs: Sequence[int]) -> Union[List[Number], Any]:
+        if _is_array(xs):
+            values = self.offset + self.scale * numpy.power(float(self.base), xs.astype(float))
+            if self.rounding == 'round':
+                return numpy.round(values)
+            if self.rounding == 'floor':
+                return numpy.trunc(values)
+            return values
+        return [self(x) for x in xs]
+
+    def to_dict(self) -> Dict[str, Any]:
+        d = {'type': self.type_name, 'offset': self.offset, 'scale': self.scale, 'base': self.base}
+        if self.rounding != 'none':
+            d['rounding'] = self.rounding
+        return d
+
+
+class PolynomialCurve(Curve):
+    """
+    coefficients[0] + coefficients[1] * x + coefficients[2] * x**2 + ...
+
+    Sums are found in closed form with Faulhaber's formula, and are exact if
+    every coefficient is an int.
+    """
+
+    type_name = 'polynomial'
+
+    def __init__(self, coefficients: Sequence[Number]):
+        """
+        :param coefficients: The coefficient of each power of x, starting with
+        the constant term.
+        """
+        if len(coefficients) == 0:
+            raise ValueError("coefficients must not be empty")
+        self.coefficients = tuple(coefficients)
+
+    def __call__(self, x: int) -> Number:
+        value = 0
+        for c in reversed(self.coefficients):
+            value = value * x + c
+        return value
+
+    def __repr__(self):
+        return "PolynomialCurve({!r})".format(list(self.coefficients))
+
+    def total(self, start: int, amount: int) -> Number:
+        if amount < 1:
+            return 0
+        result = 0
+        for power, c in enumerate(self.coefficients):
+            if c != 0:
+                power_sum = _power_sum(power, start + amount) - _power_sum(power, start)
+                result += c * power_sum
+        return result
+
+    def evaluate(self, xs: Sequence[int]) -> Union[List[Number], Any]:
+        if _is_array(xs):
+            return numpy.polyval(list(reversed(self.coefficients)), xs.astype(float))
+        return [self(x) for x in xs]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {'type': self.type_name, 'coefficients': list(self.coefficients)}
+
+
+class CustomCurve(Curve):
+    """
+    Any function of x, for values that don't fit one of the typed curves. Sums
+    are kept as a cache of running totals so that each value is only ever
+    computed once.
+    """
+
+    type_name = 'custom'
+
+    def __init__(self, func: Callable[[int], Number], name: Optional[str] = None):
+        """
+        :param func: The function to give the value at each x.
+        :param name: The name that func is registered under, if any. Only curves
+        with a name can be written with to_dict().
+        """
+        self.func = func
+        self.name = name
+        self._sums: List[Number] = [0]
+
+    def __call__(self, x: int) -> Number:
+        return self.func(x)
+
+    def __repr__(self):
+        if self.name is not None:
+            return "CustomCurve(name={!r})".format(self.name)
+        return "CustomCurve({!r})".format(self.func)
+
+    def total(self, start: int, amount: int) -> Number:
+        if amount < 1:
+            return 0
+        return _cached_total(self, self._sums, start, amount)
+
+    def to_dict(self) -> Dict[str, Any]:
+        if self.name is None:
+            raise ValueError("Only custom curves with a registered name can be converted to a dict")
+        return {'type': self.type_name, 'function': self.name}
+
+
+def as_curve(value: Union[Number, Callable[[int], Number], Curve], kind: type) -> Curve:
+    """
+    Make a Curve out of what was given for one of an Activity's values.
+
+    :param value: A Curve, which is returned as-is; a single number, which
+    becomes a ConstantCurve of the given kind; or any other function of x, which
+    becomes a CustomCurve.
+    :param kind: Either int or float; the type that a single number is
+    converted to.
+    """
+    if isinstance(value, Curve):
+        return value
+    if isinstance(value, (int, float)):
+        return ConstantCurve(kind(value))
+    return CustomCurve(value)
+
+
+def from_spec(spec: Union[Number, Dict[str, Any]], kind: type, custom: Dict[str, Callable[[int], Number]]) -> Curve:
+    """
+    Create a Curve from its description in a catalog.
+
+    :param spec: Either a single number for a constant curve or a dict with a
+    'type' of 'constant', 'linear', 'exponential', 'polynomial', or 'custom'
+    along with that curve's parameters.
+    :param kind: Either int or float; the type that a single number is
+    converted to.
+    :param custom: The functions that 'custom' curves can refer to, by name.
+    """
+    if isinstance(spec, (int, float)):
+        return ConstantCurve(kind(spec))
+    curve_type = spec.get('type', None)
+    if curve_type == ConstantCurve.type_name:
+        return ConstantCurve(kind(spec['value']))
+    if curve_type == LinearCurve.type_name:
+        return LinearCurve(spec.get('intercept', 0), spec['slope'])
+    if curve_type == ExponentialCurve.type_name:
+        return ExponentialCurve(spec.get('offset', 0), spec.get('scale', 1), spec['base'], spec.get('rounding', 'none'))
+    if curve_type == PolynomialCurve.type_name:
+        return PolynomialCurve(spec['coefficients'])
+    if curve_type == CustomCurve.type_name:
+        name = spec['function']
+        if name not in custom:
+            raise ValueError("No custom curve function is registered as {!r}".format(name))
+        return CustomCurve(custom[name], name)
+    raise ValueError("Unknown curve type: {!r}".format(curve_type))
+
+
+def _is_array(xs) -> bool:
+    return numpy is not None and isinstance(xs, numpy.ndarray)
+
+
+# held while any curve's running sums are being extended, since curves are
+# shared by every game and Engines can run on several threads
+_sums_lock = threading.Lock()
+
+
+def _cached_total(curve: Curve, sums: List[Number], start: int, amount: int) -> Number:
+    if len(sums) <= start + amount:
+        with _sums_lock:
+            while len(sums) <= start + amount:
+                sums.append(sums[-1] + curve(len(sums) - 1))
+    return sums[start + amount] - sums[start]
+
+
+def _search_affordable(curve: Curve, start: int, budget: Number, estimate: float) -> int:
+    """
+    Find the largest amount whose total is within budget, starting from an
+    estimate of it. The search gallops away from the estimate until the answer
+    is bracketed and then bisects, so a good estimate only takes a few steps.
+    """
+    if curve.total(start, 1) > budget:
+        return 0
+    if not math.isfinite(estimate):
+        estimate = 1
+    guess = max(int(estimate), 1)
+
+    if curve.total(start, guess) <= budget:
+        low = guess
+        step = 1
+        high = low + step
+        while curve.total(start, high) <= budget:
+            low = high
+            step *= 2
+            high = low + step
+    else:
+        high = guess
+        step = 1
+        low = max(high - step, 1)
+        while low > 1 and curve.total(start, low) > budget:
+            high = low
+            step *= 2
+            low = max(high - step, 1)
+
+    # total(low) is affordable and total(high) is not
+    while high - low > 1:
+        mid = (low + high) // 2
+        if curve.total(start, mid) <= budget:
+            low = mid
+        else:
+            high = mid
+    return low
+
+
+# coefficients of the polynomial in n that gives the sum of x**power for x from
+# 0 to n-1, by power
+_PowerSumCoefficients: Dict[int, List[Fraction]] = {}
+
+
+def _power_sum(power: int, n: int) -> Union[int, Fraction]:
+    """
+    Get the sum of x**power for x from 0 to n-1 using Faulhaber's formula.
+    """
+    if n <= 0:
+        return 0
+    coeffs = _PowerSumCoefficients.get(power, None)
+    if coeffs is None:
+        coeffs = _faulhaber(power)
+        _PowerSumCoefficients[power] = coeffs
+    total = Fraction(0)
+    for c in reversed(coeffs):
+        total = total * n + c
+    if total.denominator == 1:
+        return total.numerator
+    return total
+
+
+def _faulhaber(power: int) -> List[Fraction]:
+    """
+    Get the coefficients, lowest power of n first, of the polynomial that gives
+    the sum of x**power for x from 0 to n-1.
+    """
+    bernoulli = _bernoulli_numbers(power)
+    coeffs = [Fraction(0)] * (power + 2)
+    for j in range(power + 1):
+        coeffs[power + 1 - j] = Fraction(math.comb(power + 1, j)) * bernoulli[j] / (power + 1)
+    return coeffs
+
+
+def _bernoulli_numbers(count: int) -> List[Fraction]:
+    """
+    Get the Bernoulli numbers B_0 through B_count, using the convention that
+    B_1 is -1/2.
+    """
+    numbers = [Fraction(1)]
+    for m in range(1, count + 1):
+        total = sum(Fraction(math.comb(m + 1, k)) * numbers[k] for k in range(m))
+        numbers.append(-total / (m + 1))
+    return numbers
@@ -0,0 +1,1081 @@
+"""
+A background process that keeps Engines loaded between CLI commands. The CLI
+connects to it over a Unix domain socket, starting it first if it isn't
+running, and has it run the command instead of loading and saving the state
+file itself. Commands from several CLI processes are run one at a time, so they
+never race on the state file.
+
+The CLI sends each command as a JSON message on a connection of its own.
+Clients that send many commands can instead keep a connection open and use the
+binary protocol in the wire module, sending commands without waiting for the
+answers to earlier ones.
+
+There is one daemon per user. It exits after a while without any commands, or
+when a CLI from a different build of cre8orforge connects to it.
+"""
+
+import io
+import os
+import sys
+import json
+import time
+import errno
+import socket
+import tempfile
+import selectors
+import traceback
+import subprocess
+import contextlib
+import collections
+import logging
+import argparse
+from typing import Dict, Any, Callable, Optional, Tuple, List, Set, Deque
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+from .engine import Engine, RulesViolationError
+from . import logutil, metrics, version, wire, memory, format, columnar, notify, state
+
+_log = logging.getLogger(__name__)
+
+CurrentVersion = 1
+
+# seconds without a command before the daemon exits
+DefaultIdleTimeout = 600.0
+
+# seconds that the CLI waits for a daemon it started to begin accepting commands
+DefaultStartTimeout = 5.0
+
+# seconds that the daemon waits for a connected CLI to finish sending its
+# command before giving up on it; clients using the wire protocol can stay
+# connected for as long as they like
+DefaultReceiveTimeout = 10.0
+
+# seconds between checks of whether loaded Engines are over the memory budget;
+# measuring them walks every object they hold, so it isn't done after every
+# command
+MemoryCheckInterval = 5.0
+
+# seconds between passes that advance every loaded Engine's game at once, so
+# that a command only has to advance its game by the time since the last pass
+DefaultAdvanceInterval = 60.0
+
+# the names of the parsed arguments that pick which Engine runs a command
+EngineArgNames = ('state', 'durability', 'flush_interval', 'save_layout', 'player', 'leaderboard')
+
+# whether this platform and build can use a daemon at all; frozen builds have no
+# separate Python interpreter to start one with
+Supported = hasattr(socket, 'AF_UNIX') and fcntl is not None and not getattr(sys, 'frozen', False)
+
+_request_seconds = metrics.registry.histogram(
+    'cre8_daemon_request_seconds', "Time taken by the daemon to run each forwarded command, by protocol"
+)
+_engine_loads = metrics.registry.counter(
+    'cre8_daemon_engine_loads_total', "Engines loaded by the daemon, by why the load was needed"
+)
+_engine_evictions = metrics.registry.counter(
+    'cre8_daemon_engine_evictions_total', "Engines unloaded by the daemon to stay within its memory budget"
+)
+_resident_bytes = metrics.registry.gauge(
+    'cre8_daemon_resident_bytes', "Approximate memory kept by the daemon's loaded Engines as of the last check"
+)
+
+# the Daemon serving in this process, if there is one
+_serving: Optional['Daemon'] = None
+
+
+class DaemonUnavailableError(Exception):
+    """
+    Raised when the daemon can't be reached or started, in which case the
+    command should be run in-process instead.
+    """
+    pass
+
+
+class DaemonCommandError(Exception):
+    """
+    Raised in the CLI when the daemon ran a command and it failed with an error
+    other than a RulesViolationError.
+    """
+    pass
+
+
+def serving() -> Optional['Daemon']:
+    """
+    Get the Daemon that is running commands in this process, if there is one.
+    """
+    return _serving
+
+
+def default_socket_path() -> str:
+    """
+    Get the socket that the current user's daemon listens on.
+    """
+    runtime_dir = os.environ.get('XDG_RUNTIME_DIR', None)
+    if runtime_dir is None or not os.path.isdir(runtime_dir):
+        runtime_dir = tempfile.gettempdir()
+    return os.path.join(runtime_dir, 'cre8orforge-{:d}.sock'.format(os.getuid()))
+
+
+def build_stamp() -> str:
+    """
+    Get a string that changes whenever the installed code does, so that a daemon
+    started from older code is never sent commands by a newer CLI.
+    """
+    pkg_dir = os.path.dirname(os.path.abspath(__file__))
+    newest = 0
+    for entry in os.scandir(pkg_dir):
+        if entry.name.endswith('.py') or entry.name.endswith('.json'):
+            newest = max(newest, entry.stat().st_mtime_ns)
+    return "{:s}:{:d}".format(version.VERSION, newest)
+
+
+def forward(
+    handler: str,
+    args: Dict[str, Any],
+    stdin_text: Optional[str] = None,
+    socket_path: Optional[str] = None,
+    start_timeout: float = DefaultStartTimeout
+):
+    """
+    Have the daemon run a command, starting the daemon if it isn't running.
+    Whatever the command writes to stdout and stderr is written to this
+    process's stdout and stderr. If the command fails, an exception is raised
+    afterwards; a RulesViolationError if the game didn't allow it or a
+    DaemonCommandError for anything else.
+
+    :param handler: The name of the function in the entrypoint module that runs
+    the command.
+    :param args: The parsed arguments of the command, including global options.
+    Must be serializable as JSON.
+    :param stdin_text: If given, the command reads this as its stdin.
+    :param socket_path: The socket that the daemon listens on. Defaults to
+    default_socket_path().
+    :param start_timeout: How long to wait for a newly started daemon.
+    """
+    if socket_path is None:
+        socket_path = default_socket_path()
+    request = {
+        'v': CurrentVersion,
+        'build': build_stamp(),
+        'cwd': os.getcwd(),
+        'handler': handler,
+        'args': args,
+        'stdin': stdin_text,
+    }
+
+    # a daemon from another build exits when it gets the request, so the second
+    # attempt goes to a fresh one
+    for _ in range(2):
+        sock = connect(socket_path, start_timeout)
+        try:
+            try:
+                _send_message(sock, request)
+            except OSError as e:
+                raise DaemonUnavailableError("Could not send command to daemon: {!s}".format(e))
+            try:
+                response = _recv_message(sock)
+            except (OSError, ValueError) as e:
+                # the command may or may not have run, so it isn't safe to run
+                # it again
+                raise DaemonCommandError("Lost connection to daemon while running command: {!s}".format(e))
+        finally:
+            sock.close()
+        if response.get('restart', False):
+            _log.debug("Daemon was from a different build; starting a new one")
+            continue
+
+        sys.stdout.write(response['stdout'])
+        sys.stderr.write(response['stderr'])
+        error = response.get('error', None)
+        if error is not None:
+            if error['type'] == 'RulesViolationError':
+                raise RulesViolationError(error['message'])
+            msg = "{:s}: {:s}\nDaemon traceback:\n{:s}".format(error['type'], error['message'], error['traceback'])
+            raise DaemonCommandError(msg)
+        return
+    raise DaemonUnavailableError("Daemon kept restarting")
+
+
+def connect(socket_path: Optional[str] = None, start_timeout: float = DefaultStartTimeout) -> socket.socket:
+    """
+    Connect to the daemon, starting it if it isn't running.
+
+    :param socket_path: The socket that the daemon listens on. Defaults to
+    default_socket_path().
+    :param start_timeout: How long to wait for a newly started daemon.
+    :return: The connected socket.
+    """
+    if socket_path is None:
+        socket_path = default_socket_path()
+    try:
+        return _try_connect(socket_path)
+    except (FileNotFoundError, ConnectionRefusedError):
+        pass
+
+    _start_daemon(socket_path)
+    deadline = time.monotonic() + start_timeout
+    delay = 0.005
+    while True:
+        try:
+            return _try_connect(socket_path)
+        except (FileNotFoundError, ConnectionRefusedError) as e:
+            if time.monotonic() >= deadline:
+                raise DaemonUnavailableError("Daemon did not start: {!s}".format(e))
+        time.sleep(delay)
+        delay = min(delay * 2, 0.1)
+
+
+def _try_connect(socket_path: str) -> socket.socket:
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(socket_path)
+    except OSError:
+        sock.close()
+        raise
+    return sock
+
+
+def _start_daemon(socket_path: str):
+    pkg_parent = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(p for p in (pkg_parent, env.get('PYTHONPATH', '')) if p != '')
+    cmd = [sys.executable, '-c', 'from cre8 import daemon; daemon.main()', '--socket', socket_path]
+    _log.debug("Starting daemon: {!r}".format(cmd))
+    try:
+        subprocess.Popen(
+            cmd, env=env, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+            start_new_session=True
+        )
+    except OSError as e:
+        raise DaemonUnavailableError("Could not start daemon: {!s}".format(e))
+
+
+def _send_message(sock: socket.socket, msg: Dict[str, Any]):
+    sock.sendall(_encode_json(msg))
+    sock.shutdown(socket.SHUT_WR)
+
+
+def _recv_message(sock: socket.socket) -> Dict[str, Any]:
+    chunks = []
+    while True:
+        chunk = sock.recv(65536)
+        if not chunk:
+            break
+        chunks.append(chunk)
+    data = b''.join(chunks)
+    if data == b'':
+        raise ValueError("connection closed without a message")
+    return json.loads(data.decode('utf-8'))
+
+
+class _Connection:
+    """
+    A client connected to the daemon, along with what has been read from it and
+    what is waiting to be written to it.
+    """
+
+    def __init__(self, sock: socket.socket):
+        self.sock = sock
+        self.opened = time.monotonic()
+        # 'json' for a CLI sending a single command, 'wire' for a client
+        # sending many; None until its first bytes arrive
+        self.protocol: Optional[str] = None
+        self.inbox = bytearray()
+        self.outbox = bytearray()
+        self.reader: Optional[wire.FrameReader] = None
+        # set by a wire client's hello
+        self.cwd: Optional[str] = None
+        # commands from this connection that have not been answered yet
+        self.pending = 0
+        self.read_closed = False
+        self.close_when_sent = False
+        self.closed = False
+        # the events the connection is registered for with the selector
+        self.events = 0
+
+
+class _Job:
+    """
+    A command waiting for its turn to run.
+    """
+
+    def __init__(
+        self, conn: _Connection, request_id: Optional[int], handler: str, args: Dict[str, Any], cwd: str,
+        stdin: Optional[str]
+    ):
+        self.conn = conn
+        self.request_id = request_id
+        self.handler = handler
+        self.args = args
+        self.cwd = cwd
+        self.stdin = stdin
+
+
+class Daemon:
+    """
+    Accepts commands on a socket and runs them against Engines that are kept
+    loaded between commands.
+
+    Commands are run one at a time in a single thread, since each one takes over
+    the process's stdout, stderr, and working directory while it runs. Each
+    Engine has its own queue of commands, and the queues take turns, so a client
+    that sends many commands for one player doesn't hold up commands for other
+    players. The commands for any one Engine are always run in the order they
+    arrived.
+    """
+
+    def __init__(
+        self,
+        socket_path: str,
+        run: Callable[[Engine, str, Dict[str, Any]], None],
+        parse: Optional[Callable[[List[str]], Tuple[str, Dict[str, Any]]]] = None,
+        idle_timeout: float = DefaultIdleTimeout,
+        memory_budget: Optional[int] = None,
+        advance_interval: Optional[float] = DefaultAdvanceInterval,
+        notify_file: Optional[str] = None
+    ):
+        """
+        :param socket_path: The socket to listen on.
+        :param run: Called to run each command with the Engine it is for, the
+        name of the command's handler, and its parsed arguments.
+        :param parse: Called to parse the command-line arguments of a command
+        sent with the wire protocol into the name of its handler and its parsed
+        arguments. If not given, wire clients can't run commands.
+        :param idle_timeout: Seconds without a command or a connected client
+        before serve() returns.
+        :param memory_budget: If given, the approximate number of bytes that
+        loaded Engines may keep. When they keep more, the ones that were used
+        least recently are saved and unloaded until they are within it.
+        :param advance_interval: Seconds between passes that advance the games
+        of every loaded Engine at once while no commands are waiting. Give None
+        or 0 to only advance games when a command is run for them.
+        :param notify_file: If given, the completion notifications still pending
+        when the daemon exits are written to this file, and read back from it
+        when the next daemon starts. Otherwise they are only kept in memory.
+        """
+        self.socket_path = socket_path
+        self.run = run
+        self.parse = parse
+        self.idle_timeout = idle_timeout
+        self.memory_budget = memory_budget
+        self.advance_interval = advance_interval if advance_interval else None
+        self.notify_file = notify_file
+        self.build = build_stamp()
+        # told about the running executions of every Engine that is loaded, and
+        # keeps their notifications pending after they are unloaded
+        self.notifier = notify.CompletionNotifier(self._on_completion)
+        # loaded Engines by their options, along with the stamp of their state
+        # file as of when it was last read or written by that Engine. Engines
+        # are put back at the end after each use, so the least recently used
+        # one is always first.
+        self._engines: Dict[Tuple, Tuple[Engine, Optional[Tuple[int, int]]]] = {}
+        self._lock_fp = None
+        self._sock: Optional[socket.socket] = None
+        self._selector: Optional[selectors.BaseSelector] = None
+        self._connections: Set[_Connection] = set()
+        # commands waiting to run by the options of the Engine they are for, and
+        # the order in which those Engines get their next turn
+        self._queues: Dict[Tuple, Deque[_Job]] = {}
+        self._turns: Deque[Tuple] = collections.deque()
+        self._last_active = time.monotonic()
+        self._last_memory_check = time.monotonic()
+        # the games of the loaded Engines, kept up to date between commands
+        self._columns: Optional[columnar.ColumnarGames] = None
+        if self.advance_interval is not None:
+            self._columns = columnar.ColumnarGames()
+        self._next_advance = time.monotonic() + (self.advance_interval or 0.0)
+        self._stopping = False
+
+    def resident_engines(self) -> Dict[Tuple, Engine]:
+        """
+        Get the Engines that are loaded and not running a command, by the
+        options that pick each one, as given by engine_key(). Several Engines
+        can be for the same player, such as when one state file is played with
+        different durability settings.
+        """
+        if self._columns is not None:
+            for eng, _ in self._engines.values():
+                self._columns.materialize(eng)
+        return {key: eng for key, (eng, _) in self._engines.items()}
+
+    def memory_report(self, top: int = memory.DefaultTopPlayers) -> memory.MemoryReport:
+        """
+        Estimate the memory kept by each loaded Engine.
+
+        :param top: The number of heaviest players to list.
+        """
+        return memory.report(self.resident_engines(), top, self.memory_budget)
+
+    def serve(self) -> bool:
+        """
+        Run commands until the daemon is idle for too long or a client from a
+        different build connects.
+
+        :return: False if another daemon is already running for the socket, in
+        which case this one does nothing; otherwise True.
+        """
+        global _serving
+        if not self._listen():
+            return False
+        _log.debug("Daemon listening on {:s}".format(self.socket_path))
+        self._load_notifier()
+        _serving = self
+        try:
+            while not self._stopping:
+                timeout = self._next_timeout()
+                idle = time.monotonic() - self._last_active >= self.idle_timeout
+                if idle and len(self._connections) == 0 and len(self._turns) == 0:
+                    _log.debug("Daemon idle for {:.0f}s; exiting".format(self.idle_timeout))
+                    break
+                for key, mask in self._selector.select(timeout):
+                    if key.data is None:
+                        self._accept()
+                        continue
+                    conn = key.data
+                    if mask & selectors.EVENT_READ and not conn.closed:
+                        self._read(conn)
+                    if mask & selectors.EVENT_WRITE and not conn.closed:
+                        self._write(conn)
+                if len(self._turns) > 0 and not self._stopping:
+                    self._run_next()
+                    self._check_memory()
+                elif not self._stopping:
+                    self._advance_due()
+                self.notifier.poll()
+        finally:
+            _serving = None
+            self._shutdown()
+        return True
+
+    def _listen(self) -> bool:
+        # the lock decides which daemon owns the socket if several are started
+        # at once
+        old_umask = os.umask(0o077)
+        try:
+            self._lock_fp = open(self.socket_path + '.lock', 'w')
+        finally:
+            os.umask(old_umask)
+        try:
+            fcntl.flock(self._lock_fp, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError as e:
+            if e.errno not in (errno.EAGAIN, errno.EACCES):
+                raise
+            self._lock_fp.close()
+            self._lock_fp = None
+            return False
+
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(self.socket_path)
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        old_umask = os.umask(0o077)
+        try:
+            self._sock.bind(self.socket_path)
+        finally:
+            os.umask(old_umask)
+        self._sock.listen(64)
+        self._sock.setblocking(False)
+        self._selector = selectors.DefaultSelector()
+        self._selector.register(self._sock, selectors.EVENT_READ, None)
+        return True
+
+    def _stop_listening(self):
+        if self._sock is not None:
+            self._selector.unregister(self._sock)
+            self._sock.close()
+            self._sock = None
+            with contextlib.suppress(FileNotFoundError):
+                os.unlink(self.socket_path)
+
+    def _shutdown(self):
+        self._stop_listening()
+        for eng, _ in self._engines.values():
+            try:
+                self._unload(eng)
+            except Exception:
+                _log.exception("Error closing engine for {!r}".format(eng.state_file))
+        self._engines.clear()
+        self._save_notifier()
+        if self._lock_fp is not None:
+            self._lock_fp.close()
+            self._lock_fp = None
+
+        # answers still waiting to go out are sent only once the lock is
+        # released, so a client told to restart can start a new daemon right
+        # away
+        for conn in list(self._connections):
+            if len(conn.outbox) > 0:
+                try:
+                    conn.sock.settimeout(DefaultReceiveTimeout)
+                    conn.sock.sendall(conn.outbox)
+                except OSError as e:
+                    _log.debug("Could not send response to client: {!s}".format(e))
+            self._close(conn)
+        self._queues.clear()
+        self._turns.clear()
+        if self._selector is not None:
+            self._selector.close()
+            self._selector = None
+
+    def _next_timeout(self) -> Optional[float]:
+        """
+        Get how long to wait for something to happen on the socket before there
+        is other work to do, dropping any CLI that has taken too long to send
+        its command. None means to wait until something happens.
+        """
+        if len(self._turns) > 0:
+            return 0
+        now = time.monotonic()
+        deadlines = []
+        for conn in list(self._connections):
+            # wire clients may stay connected without sending anything
+            if conn.protocol == 'wire' or conn.read_closed:
+                continue
+            deadline = conn.opened + DefaultReceiveTimeout
+            if deadline <= now:
+                _log.warning("Client took too long to send its command; dropping it")
+                self._close(conn)
+            else:
+                deadlines.append(deadline)
+        if len(self._connections) == 0:
+            deadlines.append(self._last_active + self.idle_timeout)
+        if self._columns is not None and len(self._columns) > 0:
+            deadlines.append(self._next_advance)
+        if len(self.notifier) > 0:
+            deadlines.append(now + self.notifier.resolution)
+        if len(deadlines) == 0:
+            return None
+        return max(0.0, min(deadlines) - now)
+
+    def _accept(self):
+        while True:
+            try:
+                sock, _ = self._sock.accept()
+            except (BlockingIOError, InterruptedError):
+                return
+            sock.setblocking(False)
+            conn = _Connection(sock)
+            self._connections.add(conn)
+            self._update_events(conn)
+
+    def _read(self, conn: _Connection):
+        try:
+            data = conn.sock.recv(65536)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError as e:
+            _log.debug("Lost connection to client: {!s}".format(e))
+            self._close(conn)
+            return
+
+        if data == b'':
+            conn.read_closed = True
+            if conn.protocol != 'wire':
+                # the JSON protocol sends one command and then closes its end
+                self._receive_json(conn)
+            self._update_events(conn)
+            return
+
+        if conn.protocol is None:
+            conn.inbox += data
+            data = b''
+            if conn.inbox.startswith(b'{'):
+                conn.protocol = 'json'
+            elif len(conn.inbox) < len(wire.Magic):
+                return
+            elif conn.inbox.startswith(wire.Magic):
+                conn.protocol = 'wire'
+                conn.reader = wire.FrameReader()
+                data = bytes(conn.inbox[len(wire.Magic):])
+                conn.inbox.clear()
+            else:
+                _log.warning("Client sent something that isn't in any known protocol")
+                self._close(conn)
+                return
+
+        elif conn.protocol == 'json':
+            conn.inbox += data
+        if conn.protocol == 'json':
+            return
+
+        try:
+            for request_id, code, strings in conn.reader.feed(data):
+                self._receive_frame(conn, request_id, code, strings)
+                if conn.closed or self._stopping:
+                    return
+        except ValueError as e:
+            _log.warning("Bad frame from client: {!s}".format(e))
+            self._close(conn)
+
+    def _write(self, conn: _Connection):
+        if len(conn.outbox) > 0:
+            try:
+                sent = conn.sock.send(conn.outbox)
+            except (BlockingIOError, InterruptedError):
+                sent = 0
+            except OSError as e:
+                _log.debug("Could not send response to client: {!s}".format(e))
+                self._close(conn)
+                return
+            del conn.outbox[:sent]
+        self._update_events(conn)
+
+    def _send(self, conn: _Connection, data: bytes):
+        if conn.closed:
+            return
+        conn.outbox += data
+        self._write(conn)
+
+    def _update_events(self, conn: _Connection):
+        """
+        Register a connection with the selector for what it is waiting on, or
+        close it if it is done with.
+        """
+        if conn.closed:
+            return
+        if len(conn.outbox) == 0 and (conn.close_when_sent or (conn.read_closed and conn.pending == 0)):
+            self._close(conn)
+            return
+        events = 0
+        if not conn.read_closed:
+            events |= selectors.EVENT_READ
+        if len(conn.outbox) > 0:
+            events |= selectors.EVENT_WRITE
+        if events == conn.events:
+            return
+        if conn.events == 0:
+            self._selector.register(conn.sock, events, conn)
+        elif events == 0:
+            self._selector.unregister(conn.sock)
+        else:
+            self._selector.modify(conn.sock, events, conn)
+        conn.events = events
+
+    def _close(self, conn: _Connection):
+        if conn.closed:
+            return
+        if conn.events != 0 and self._selector is not None:
+            self._selector.unregister(conn.sock)
+            conn.events = 0
+        conn.sock.close()
+        conn.closed = True
+        self._connections.discard(conn)
+        self._last_active = time.monotonic()
+
+    def _restart(self, conn: _Connection, response: bytes):
+        """
+        Answer a client from a different build and exit. Commands that are
+        already queued are run first, since their clients are waiting on them.
+        """
+        _log.debug("Client is from a different build; exiting once queued commands are done")
+        self._stopping = True
+        self._stop_listening()
+        while len(self._turns) > 0:
+            self._run_next()
+        conn.outbox += response
+
+    def _receive_json(self, conn: _Connection):
+        if conn.protocol != 'json':
+            self._close(conn)
+            return
+        try:
+            request = json.loads(conn.inbox.decode('utf-8'))
+        except ValueError as e:
+            _log.warning("Bad request to daemon: {!s}".format(e))
+            self._close(conn)
+            return
+        conn.inbox.clear()
+
+        if not isinstance(request, dict):
+            _log.warning("Bad request to daemon: not a JSON object")
+            self._close(conn)
+            return
+        if request.get('v', None) != CurrentVersion or request.get('build', None) != self.build:
+            self._restart(conn, _encode_json({'restart': True}))
+            return
+        problem = _check_json_request(request)
+        if problem is not None:
+            _log.warning("Bad request to daemon: {:s}".format(problem))
+            self._close(conn)
+            return
+        self._enqueue(_Job(conn, None, request['handler'], request['args'], request['cwd'], request['stdin']))
+
+    def _receive_frame(self, conn: _Connection, request_id: int, code: int, strings: List[str]):
+        if code == wire.KindHello:
+            if conn.cwd is not None or len(strings) != 3:
+                raise ValueError("unexpected hello")
+            client_version, build, cwd = strings
+            if client_version != str(wire.CurrentVersion) or build != self.build:
+                frame = wire.encode_frame(request_id, wire.ResultRestart, ('', '', "Daemon is from a different build"))
+                self._restart(conn, wire.Magic + frame)
+                return
+            conn.cwd = cwd
+            self._send(conn, wire.Magic + wire.encode_frame(request_id, wire.ResultOk, ('', '', '')))
+            return
+        if conn.cwd is None:
+            raise ValueError("frame with code {:d} before hello".format(code))
+        if code == wire.KindAdmin:
+            self._send(conn, self._run_admin(request_id, strings))
+            return
+        if code != wire.KindCommand:
+            raise ValueError("unexpected frame with code {:d}".format(code))
+
+        stdout = io.StringIO()
+        stderr = io.StringIO()
+        try:
+            if self.parse is None:
+                raise ValueError("This daemon can't run commands sent as command-line arguments")
+            with contextlib.redirect_stdout(stdout), contextlib.redirect_stderr(stderr):
+                handler, args = self.parse(strings)
+        except SystemExit as e:
+            # argparse exits after showing help or a usage error
+            if e.code in (0, None):
+                result, message = wire.ResultOk, ''
+            else:
+                result, message = wire.ResultError, "Invalid command: {:s}".format(' '.join(strings))
+            self._send(conn, wire.encode_frame(request_id, result, (stdout.getvalue(), stderr.getvalue(), message)))
+            return
+        except ValueError as e:
+            frame = wire.encode_frame(request_id, wire.ResultError, (stdout.getvalue(), stderr.getvalue(), str(e)))
+            self._send(conn, frame)
+            return
+        self._enqueue(_Job(conn, request_id, handler, args, conn.cwd, None))
+
+    def _run_admin(self, request_id: int, strings: List[str]) -> bytes:
+        """
+        Answer a request about the daemon itself rather than any one game. These
+        are answered right away instead of waiting for a turn.
+        """
+        if len(strings) == 0:
+            return wire.encode_frame(request_id, wire.ResultError, ('', '', "Admin request has no name"))
+        name, params = strings[0], strings[1:]
+        try:
+            if name == 'memory':
+                top = int(params[0]) if len(params) > 0 else memory.DefaultTopPlayers
+                output = json.dumps(self.memory_report(top).to_dict())
+            else:
+                raise ValueError("Unknown admin request {!r}".format(name))
+        except ValueError as e:
+            return wire.encode_frame(request_id, wire.ResultError, ('', '', str(e)))
+        return wire.encode_frame(request_id, wire.ResultOk, (output, '', ''))
+
+    def _enqueue(self, job: _Job):
+        key = engine_key(job.args, job.cwd)
+        queue = self._queues.get(key, None)
+        if queue is None:
+            queue = collections.deque()
+            self._queues[key] = queue
+            self._turns.append(key)
+        queue.append(job)
+        job.conn.pending += 1
+
+    def _run_next(self):
+        """
+        Run the next queued command for the Engine whose turn it is.
+        """
+        key = self._turns.popleft()
+        queue = self._queues[key]
+        job = queue.popleft()
+        if len(queue) > 0:
+            self._turns.append(key)
+        else:
+            del self._queues[key]
+
+        with _request_seconds.time(protocol=job.conn.protocol):
+            stdout, stderr, error = self._run_job(key, job)
+        self._last_active = time.monotonic()
+        job.conn.pending -= 1
+
+        if job.conn.protocol == 'json':
+            job.conn.close_when_sent = True
+            response = _encode_json({'stdout': stdout, 'stderr': stderr, 'error': error})
+        else:
+            if error is None:
+                result, message = wire.ResultOk, ''
+            elif error['type'] == 'RulesViolationError':
+                result, message = wire.ResultRulesViolation, error['message']
+            else:
+                result = wire.ResultError
+                message = "{:s}: {:s}\nDaemon traceback:\n{:s}".format(
+                    error['type'], error['message'], error['traceback']
+                )
+            response = wire.encode_frame(job.request_id, result, (stdout, stderr, message))
+        if job.conn.closed:
+            _log.debug("Client disconnected before its command finished")
+            return
+        self._send(job.conn, response)
+
+    def _run_job(self, key: Tuple, job: _Job) -> Tuple[str, str, Optional[Dict[str, str]]]:
+        args = job.args
+        stdout = io.StringIO()
+        stderr = io.StringIO()
+        error = None
+
+        try:
+            os.chdir(job.cwd)
+        except OSError as e:
+            _log.warning("Can't run a forwarded command in {!r}: {!s}".format(job.cwd, e))
+            message = "Can't run in {!r}: {!s}".format(job.cwd, e)
+            return '', '', {'type': type(e).__name__, 'message': message, 'traceback': ''}
+        logging.getLogger('cre8').setLevel(logutil.TRACE if args.get('log_trace', False) else logging.DEBUG)
+        handlers = logutil.console_handlers(stdout, stderr)
+        root = logging.getLogger()
+        for h in handlers:
+            root.addHandler(h)
+        stdin = io.StringIO(job.stdin if job.stdin is not None else '')
+        eng = None
+        failed = False
+        try:
+            with contextlib.redirect_stdout(stdout), contextlib.redirect_stderr(stderr), _redirect_stdin(stdin):
+                eng = self._engine(key)
+                eng.update()
+                # the command's changes are rolled back if the game refuses
+                # it partway through, as the CLI never saves a refused command
+                with eng.transaction():
+                    self.run(eng, job.handler, args)
+        except RulesViolationError as e:
+            # the transaction left the game as it was before the command, so
+            # the Engine is kept for the next command
+            error = {'type': type(e).__name__, 'message': str(e), 'traceback': ''}
+        except SystemExit as e:
+            # nothing run by the daemon should exit it, since that would stop it
+            # for every player
+            message = "Command tried to exit with status {!r}".format(e.code)
+            error = {'type': type(e).__name__, 'message': message, 'traceback': traceback.format_exc()}
+            failed = True
+            _log.error("Forwarded command tried to exit the daemon")
+        except Exception as e:
+            error = {'type': type(e).__name__, 'message': str(e), 'traceback': traceback.format_exc()}
+            failed = True
+            _log.exception("Error running forwarded command")
+        finally:
+            if eng is not None:
+                self._release(key, eng, failed, stderr)
+            for h in handlers:
+                root.removeHandler(h)
+
+        return stdout.getvalue(), stderr.getvalue(), error
+
+    def _engine(self, key: Tuple) -> Engine:
+        """
+        Get the Engine for a set of options, loading it again if something other
+        than this daemon has written to its state file since it was loaded.
+        """
+        state_file = key[0]
+        entry = self._engines.pop(key, None)
+        if entry is not None:
+            eng, stamp = entry
+            if self._columns is not None:
+                self._columns.remove(eng)
+            if stamp == _file_stamp(state_file):
+                return eng
+            _log.debug("State file {:s} changed outside of the daemon; reloading".format(state_file))
+            eng.close()
+            _engine_loads.inc(reason='changed')
+        else:
+            _engine_loads.inc(reason='new')
+        state_dict = dict(zip(EngineArgNames, key))
+        return Engine(
+            state_dict['state'],
+            durability=state_dict['durability'],
+            flush_interval_ms=state_dict['flush_interval'],
+            save_layout=state_dict['save_layout'],
+            player=state_dict['player'],
+            leaderboard_file=state_dict['leaderboard'],
+            notifier=self.notifier
+        )
+
+    def _release(self, key: Tuple, eng: Engine, failed: bool, stderr: io.StringIO):
+        """
+        Write out an Engine's changes after a command the same way the CLI does
+        when it exits, and keep it loaded for the next command. A command that
+        failed with anything other than a RulesViolationError may have left the
+        Engine half-changed, so its Engine is dropped and the state file is
+        loaded again next time.
+        """
+        try:
+            with contextlib.redirect_stderr(stderr):
+                if failed:
+                    eng.close()
+                else:
+                    eng.flush()
+        except Exception:
+            _log.exception("Error saving state for {!r}".format(eng.state_file))
+            failed = True
+        if not failed:
+            self._engines[key] = (eng, _file_stamp(key[0]))
+            if self._columns is not None:
+                self._columns.load(eng)
+
+    def _check_memory(self):
+        """
+        Unload the least recently used Engines if loaded Engines are keeping
+        more memory than the budget allows. Does nothing if there is no budget
+        or if the last check was too recent.
+        """
+        if self.memory_budget is None or time.monotonic() - self._last_memory_check < MemoryCheckInterval:
+            return
+        sizes = [(key, memory.measure_engine(eng.notify_name, eng).total) for key, (eng, _) in self._engines.items()]
+        total = sum(size for _, size in sizes)
+        for key, size in sizes:
+            if total <= self.memory_budget:
+                break
+            eng, _ = self._engines.pop(key)
+            _log.info("Over memory budget; unloading {:s} ({:s})".format(eng.notify_name, format.byte_size(size)))
+            try:
+                self._unload(eng)
+            except Exception:
+                _log.exception("Error saving state for {!r}".format(eng.state_file))
+            _engine_evictions.inc()
+            total -= size
+        _resident_bytes.set(total)
+        # measuring takes a while with many players, so the interval starts
+        # once it is done
+        self._last_memory_check = time.monotonic()
+
+    def _unload(self, eng: Engine):
+        """
+        Bring an Engine's game up to date from the columnar store and close it.
+        """
+        if self._columns is not None:
+            self._columns.remove(eng)
+        eng.close()
+
+    def _load_notifier(self):
+        """
+        Read back the notifications that were pending when the last daemon
+        exited. Ones that came due since then fire on the next poll.
+        """
+        if self.notify_file is None:
+            return
+        try:
+            self.notifier = notify.load(self.notify_file, self._on_completion)
+        except (state.SerializedStateError, OSError, KeyError) as e:
+            _log.warning("Could not read pending notifications from {:s}: {!s}".format(self.notify_file, e))
+            return
+        _log.debug("Loaded {:d} pending notifications".format(len(self.notifier)))
+
+    def _save_notifier(self):
+        """
+        Write out the notifications that are still pending so the next daemon
+        can pick them up.
+        """
+        if self.notify_file is None:
+            return
+        try:
+            notify.save(self.notify_file, self.notifier)
+        except Exception:
+            _log.exception("Error saving pending notifications to {:s}".format(self.notify_file))
+
+    def _on_completion(self, completion: notify.Completion):
+        _log.info("Notification: {!s}".format(completion))
+
+    def _advance_due(self):
+        """
+        Advance the games of every loaded Engine at once if it is time for the
+        next pass. Their GameStates are only brought up to date when a command
+        is run for them, when they are unloaded, or when they are measured.
+        """
+        if self._columns is None or time.monotonic() < self._next_advance:
+            return
+        if len(self._columns) > 0:
+            completions = self._columns.advance()
+            _log.debug("Advanced {:d} loaded games; {:d} executions completed".format(len(self._columns), completions))
+        self._next_advance = time.monotonic() + self.advance_interval
+
+
+def engine_key(args: Dict[str, Any], cwd: str) -> Tuple:
+    """
+    Get the key that the daemon keeps an Engine under, from the parsed
+    arguments of a command run for it.
+
+    :param args: The parsed arguments, including every one in EngineArgNames.
+    :param cwd: The directory that relative file names in them are relative to.
+    """
+    return tuple(
+        os.path.abspath(os.path.join(cwd, args[n])) if n in ('state', 'leaderboard') else args[n]
+        for n in EngineArgNames
+    )
+
+
+def _check_json_request(request: Dict[str, Any]) -> Optional[str]:
+    """
+    Check that a JSON request has everything needed to run it.
+
+    :return: What is wrong with the request, or None if nothing is.
+    """
+    if not isinstance(request.get('handler', None), str):
+        return "'handler' must be a string"
+    if not isinstance(request.get('cwd', None), str):
+        return "'cwd' must be a string"
+    if not isinstance(request.get('stdin', None), (str, type(None))):
+        return "'stdin' must be a string or null"
+    args = request.get('args', None)
+    if not isinstance(args, dict):
+        return "'args' must be an object"
+    for name in EngineArgNames:
+        if name not in args:
+            return "'args' is missing {!r}".format(name)
+        if not isinstance(args[name], (str, int, float, bool, type(None))):
+            return "'args' has a {!r} that isn't a single value".format(name)
+    for name in ('state', 'leaderboard'):
+        if not isinstance(args[name], str):
+            return "'args' has a {!r} that isn't a string".format(name)
+    return None
+
+
+def _encode_json(msg: Dict[str, Any]) -> bytes:
+    return json.dumps(msg).encode('utf-8') + b'\n'
+
+
+@contextlib.contextmanager
+def _redirect_stdin(stream):
+    old = sys.stdin
+    sys.stdin = stream
+    try:
+        yield
+    finally:
+        sys.stdin = old
+
+
+def _file_stamp(file_name: str) -> Optional[Tuple[int, int]]:
+    try:
+        st = os.stat(file_name)
+    except FileNotFoundError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Keep cre8orforge games loaded between CLI commands")
+    parser.add_argument('--socket', default=default_socket_path(), help="The socket to listen on")
+    idle_help = "Seconds without a command before exiting"
+    parser.add_argument('--idle-timeout', default=DefaultIdleTimeout, type=float, help=idle_help, metavar='SECONDS')
+    budget_help = "Approximate memory that loaded games may use, such as '256M', before the least recently used ones"
+    budget_help += " are unloaded"
+    parser.add_argument('--memory-budget', type=memory.parse_size, help=budget_help, metavar='SIZE')
+    advance_help = "Seconds between passes that advance every loaded game at once; 0 to only advance games when a"
+    advance_help += " command is run for them"
+    parser.add_argument(
+        '--advance-interval', default=DefaultAdvanceInterval, type=float, help=advance_help, metavar='SECONDS'
+    )
+    notify_help = "File that completion notifications still pending on exit are kept in until the next daemon starts;"
+    notify_help += " defaults to the socket path with '.notify' added"
+    parser.add_argument('--notify-file', help=notify_help, metavar='FILE')
+    args = parser.parse_args()
+    notify_file = args.notify_file if args.notify_file is not None else args.socket + '.notify'
+
+    logutil.setup_logging(console_output=False)
+    from . import entrypoint
+    d = Daemon(
+        args.socket, entrypoint.run_forwarded, entrypoint.parse_forwarded, args.idle_timeout, args.memory_budget,
+        args.advance_interval, notify_file
+    )
+    d.serve()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,19 +1,93 @@
 from .activities import OwnedActivities, Activity, Execution
-from . import state, activities, layout
+from . import state, activities, layout, format, metrics, leaderboard, notify
 from .logutil import TRACE
 from .state import GameState
 from .layout import format_timer
-from datetime import datetime, timezone
-from typing import Tuple, Optional, Any
+from .clock import Clock, DefaultClock
+from datetime import datetime, timedelta
+from typing import Tuple, Optional, Any, Dict, Iterator, List
 import sys
 import math
 import logging
+import contextlib
+import functools
+import inspect
+import time
 
 from cre8 import logutil
 
 
 _log = logging.getLogger(__name__)
 
+_action_seconds = metrics.registry.histogram(
+    'cre8_engine_action_seconds', "Time taken by each Engine action"
+)
+_rules_violations = metrics.registry.counter(
+    'cre8_engine_rules_violations_total', "Number of RulesViolationErrors raised by each Engine action"
+)
+_advance_seconds = metrics.registry.histogram(
+    'cre8_engine_advance_seconds', "Time taken to advance game state"
+)
+_advance_completions = metrics.registry.histogram(
+    'cre8_engine_advance_completions', "Number of executions completed by each advance",
+    buckets=metrics.DefaultCountBuckets
+)
+
+
+def _instrumented(action: str):
+    """
+    Decorator for Engine actions that records how long they take and how often
+    they are refused by the rules of the game. Actions that are generators are
+    timed from when they are first advanced until they finish, not counting
+    time spent by the caller between items.
+    """
+    def decorator(func):
+        if inspect.isgeneratorfunction(func):
+            @functools.wraps(func)
+            def gen_wrapper(self, *args, **kwargs):
+                self.finish_catch_up()
+                gen = func(self, *args, **kwargs)
+                elapsed = 0.0
+                try:
+                    while True:
+                        start = time.perf_counter()
+                        try:
+                            item = next(gen)
+                        except StopIteration:
+                            return
+                        except RulesViolationError:
+                            _rules_violations.inc(action=action)
+                            raise
+                        finally:
+                            elapsed += time.perf_counter() - start
+                        yield item
+                finally:
+                    gen.close()
+                    _action_seconds.observe(elapsed, action=action)
+            return gen_wrapper
+
+        @functools.wraps(func)
+        def wrapper(self, *args, **kwargs):
+            self.finish_catch_up()
+            start = time.perf_counter()
+            try:
+                return func(self, *args, **kwargs)
+            except RulesViolationError:
+                _rules_violations.inc(action=action)
+                raise
+            finally:
+                _action_seconds.observe(time.perf_counter() - start, action=action)
+        return wrapper
+    return decorator
+
+
+def _fingerprint(values: Tuple) -> int:
+    """
+    Get a 32-bit fingerprint of a tuple of numbers for the change log. Numbers
+    hash the same in every process, unlike strings, so fingerprints can be saved.
+    """
+    return hash(values) & 0xFFFFFFFF
+
 
 def seed_func(ex: Execution) -> float:
     """
@@ -37,8 +111,8 @@ def seed_func(ex: Execution) -> float:
     # TODO: balance by current 'value'
 
     total = amount + mon_factor + cj_factor
-    msg = "Seed - amount, money, juice, total - {:.6f}, {:.6f}, {:.6f}, {:.6f}"
-    _log.log(TRACE, msg.format(amount, mon_factor, cj_factor, total))
+    msg = "Seed - amount, money, juice, total - %.6f, %.6f, %.6f, %.6f"
+    _log.log(TRACE, msg, amount, mon_factor, cj_factor, total)
     return total
     
 
@@ -67,28 +141,297 @@ class Advancement:
         return fmtstr.format(self.idle_seconds, self.money, self.juice, self.seeds)
 
 
+class CatchUpProgress:
+    """Contains how far along an advancement done a slice at a time has gotten"""
+    def __init__(self, fraction: float, advancement: Advancement, completions: int, done: bool):
+        """
+        :param fraction: How much of the advancement is done, from 0.0 to 1.0.
+        :param advancement: The totals earned so far. They are only applied to
+        the game state once the advancement is done.
+        :param completions: The number of executions completed so far.
+        :param done: Whether the advancement is finished and has been applied.
+        """
+        self.fraction = fraction
+        self.advancement = advancement
+        self.completions = completions
+        self.done = done
+
+    def __str__(self):
+        fmtstr = "CatchUpProgress<{:.1f}%, completions: {:d}, done: {!s}, {!s}>"
+        return fmtstr.format(self.fraction * 100, self.completions, self.done, self.advancement)
+
+    def __repr__(self):
+        fmtstr = "CatchUpProgress(fraction={!r}, advancement={!r}, completions={!r}, done={!r})"
+        return fmtstr.format(self.fraction, self.advancement, self.completions, self.done)
+
+
+class StatusDelta:
+    """Contains the parts of the status that changed since a given state version"""
+    def __init__(
+        self, since: int, version: int, time: float, scalars: Dict[str, Any], cards: Dict[Tuple[str, int], str]
+    ):
+        """
+        :param since: The state version that changes are relative to.
+        :param version: The current state version.
+        :param time: The current game time. It moves on every update, so it is
+        always given rather than counted as a change.
+        :param scalars: Maps the name of each changed value in
+        state.TrackedScalars to its current value.
+        :param cards: Maps the activity type and store index of each changed
+        activity card to the current text of the card.
+        """
+        self.since = since
+        self.version = version
+        self.time = time
+        self.scalars = scalars
+        self.cards = cards
+
+    def __str__(self):
+        msg = "Version: {:d}\nTime: {:.4f}".format(self.version, self.time)
+        if len(self.scalars) == 0 and len(self.cards) == 0:
+            return msg + "\n(no changes)"
+        for name, value in self.scalars.items():
+            if name == 'money':
+                value = format.money(value, full=True)
+            elif isinstance(value, float):
+                value = "{:.4f}".format(value)
+            msg += "\n{:s}: {!s}".format(name, value)
+        for (target_type, target_idx), card in self.cards.items():
+            msg += "\n{:s} {:d}:\n".format(target_type, target_idx)
+            msg += layout.bar() + '\n' + card + '\n' + layout.bar()
+        return msg
+
+    def __repr__(self):
+        fmtstr = "StatusDelta(since={!r}, version={!r}, time={!r}, scalars={!r}, cards={!r})"
+        return fmtstr.format(self.since, self.version, self.time, self.scalars, self.cards)
+
+
+# how often saves are written in 'relaxed' durability mode, in milliseconds
+DefaultFlushIntervalMs = 1000
+
+# number of cards on each page of the status and store when they are paged
+DefaultPageSize = 10
+
+# number of executions completed by each slice of a catch-up that is done a
+# slice at a time, unless a different limit is given
+DefaultCatchUpCompletions = 5000
+
+
+class _ListingView:
+    """
+    The filters and page that pick which activities the status or store shows.
+    Views with the same settings are equal, so they can be used to cache what
+    was rendered for them.
+    """
+    def __init__(
+        self,
+        target_type: Optional[str],
+        running: bool,
+        automated: bool,
+        affordable: bool,
+        page: Optional[int],
+        page_size: int
+    ):
+        if target_type not in (None, 'job', 'outlet'):
+            raise ValueError("target_type must be one of 'job' or 'outlet'")
+        if page is not None and page < 1:
+            raise ValueError("page must be at least 1")
+        if page_size < 1:
+            raise ValueError("page_size must be at least 1")
+        self.target_type = target_type
+        self.running = running
+        self.automated = automated
+        self.affordable = affordable
+        self.page = page
+        self.page_size = page_size
+
+    @property
+    def types(self) -> Tuple[str, ...]:
+        if self.target_type is None:
+            return 'job', 'outlet'
+        return self.target_type,
+
+    def page_count(self, total: int) -> int:
+        return max(math.ceil(total / self.page_size), 1)
+
+    def footer_lines(self, total: int) -> Iterator[str]:
+        """
+        Get the lines that end a paged listing. Listings that aren't paged have
+        none.
+
+        :param total: The number of activities across every page.
+        """
+        if self.page is None:
+            return
+        yield '\n'
+        yield "Page {:d} of {:d} ({:d} total)\n".format(self.page, self.page_count(total), total)
+
+    def _key(self) -> Tuple:
+        return self.target_type, self.running, self.automated, self.affordable, self.page, self.page_size
+
+    def __eq__(self, other):
+        return isinstance(other, _ListingView) and self._key() == other._key()
+
+    def __hash__(self):
+        return hash(self._key())
+
+
 class Engine:
-    def __init__(self, state_file: Optional[str] = 'st8cre8.p'):
+    def __init__(
+        self,
+        state_file: Optional[str] = 'st8cre8.p',
+        durability: str = 'atomic',
+        flush_interval_ms: int = DefaultFlushIntervalMs,
+        save_layout: str = 'pickle',
+        player: Optional[str] = None,
+        leaderboard_file: str = leaderboard.DefaultLeaderboardFile,
+        notifier: Optional[notify.CompletionNotifier] = None,
+        defer_catch_up: bool = False,
+        clock: Clock = DefaultClock
+    ):
+        """
+        Create a new Engine and load its state, creating a new game if needed.
+        
+        :param state_file: The file that game state is saved to and loaded from.
+        Set to None to not save state at all.
+        :param durability: The durability mode used when saving; see
+        state.save() for the meaning of each. In 'relaxed' mode, saves are also
+        coalesced so that state is written at most once every flush_interval_ms.
+        :param flush_interval_ms: The minimum time between writes of state in
+        'relaxed' mode. Ignored in other modes.
+        :param save_layout: Either 'pickle' to save state as a single pickle, or
+        'hot' to use the hot layout, where saves that only change frequently
+        updated fields are written in place. Either layout can be loaded
+        regardless of this setting.
+        :param player: The name to show for this game on the leaderboards. If
+        given, the player's scores are updated in leaderboard_file every time
+        state is written. If None, the leaderboards are not updated.
+        :param leaderboard_file: The file that the leaderboards are kept in.
+        :param notifier: If given, it is kept up to date with when each of this
+        game's running executions will complete. Its notifications are for the
+        player name if one is given and the state file otherwise.
+        :param defer_catch_up: Whether to leave the time that passed since the
+        state was last saved unadvanced on load, so that it can be caught up a
+        slice at a time with catch_up(). Actions, saves, and anything else that
+        reads the game before then finish the catch-up all at once first.
+        :param clock: Gives the current time for advancing, saving, and loading
+        the game. Give a clock.ScaledClock or clock.FixedClock to run the game
+        faster than real time.
+        """
+        if durability not in state.DurabilityModes:
+            raise ValueError("durability must be one of 'relaxed', 'atomic', or 'durable'")
+        if save_layout not in state.SaveLayouts:
+            raise ValueError("save_layout must be one of 'pickle' or 'hot'")
+        
         self.state_file = state_file
-        self.game = GameState()
+        self.durability = durability
+        self.flush_interval_ms = flush_interval_ms
+        self.save_layout = save_layout
+        self.player = player
+        self.leaderboard_file = leaderboard_file
+        self.notifier = notifier
+        self.clock = clock
+        self.game = GameState(clock)
+        self._hot_file: Optional[state.HotStateFile] = None
+        self._leaderboard: Optional[leaderboard.LeaderboardFile] = None
+        self._transaction_depth = 0
+        self._save_deferred = False
+        self._dirty = False
+        self._last_flush = -math.inf
+        # number of times state has been written since the engine was created
+        self.flush_count = 0
+        self.render_cache = layout.RenderCache()
+        # seconds since the state was last saved that are still to be advanced
+        # if that was deferred, and the advancement of them once it starts
+        self._catch_up_seconds: Optional[float] = None
+        self._catch_up: Optional[Iterator[CatchUpProgress]] = None
         
-        _ = self._load_or_create_state()
+        _ = self._load_or_create_state(defer_catch_up)
         _log.debug("t={:.4f} - Engine initialized".format(self.game.time))
         
-    def update(self):
+    def update(self) -> Advancement:
         """
         Update the engine state but do not save automatically.
+        
+        Returns the advancement that was made.
         """
+        self.finish_catch_up()
         
-        now_time = datetime.now(timezone.utc)
+        now_time = self.clock.now()
         if self.game.last_advancement > now_time:
             errmsg = "Game state was last advanced in the future, the system clock may"
             errmsg += " have been tampered with."
             raise ValueError(errmsg)
         
         seconds_since_adv = (now_time - self.game.last_advancement).total_seconds()
-        self._advance(seconds_since_adv)
+        # the time that idle was measured up to is recorded, rather than reading
+        # the clock again, so that no time is lost between updates
+        adv = self._advance(seconds_since_adv, now_time)
+        self.after_advance()
+        return adv
+
+    @property
+    def catching_up(self) -> bool:
+        """
+        Whether the time since the state was last saved has not yet been fully
+        advanced, because it was deferred when the state was loaded.
+        """
+        return self._catch_up_seconds is not None
+
+    def catch_up(
+        self, max_seconds: Optional[float] = None, max_completions: Optional[int] = DefaultCatchUpCompletions
+    ) -> Iterator[CatchUpProgress]:
+        """
+        Advance the time since the state was last saved a slice at a time. Each
+        item is produced after a slice is done; the last one is produced after
+        the advancement has been applied to the game state and has done set. If
+        there is nothing to catch up, a single finished item is produced.
+
+        The limits are only used by the first call; later calls continue the
+        same catch-up.
 
+        :param max_seconds: The most simulated time that a slice covers, summed
+        over every owned activity. None for no limit.
+        :param max_completions: The most executions that a slice completes. None
+        for no limit.
+        """
+        if self._catch_up_seconds is None:
+            yield CatchUpProgress(1.0, Advancement(0.0, 0, 0, 0.0), 0, True)
+            return
+        if self._catch_up is None:
+            self._catch_up = self._advance_slices(self._catch_up_seconds, max_seconds, max_completions)
+        for progress in self._catch_up:
+            if progress.done:
+                self._catch_up_seconds = None
+                self._catch_up = None
+                self.after_advance()
+            yield progress
+
+    def finish_catch_up(self) -> Optional[Advancement]:
+        """
+        Finish a deferred catch-up all at once. Does nothing if there isn't one.
+
+        :return: The whole advancement, or None if there was nothing to catch
+        up.
+        """
+        if self._catch_up_seconds is None:
+            return None
+        progress = None
+        for progress in self.catch_up(max_completions=None):
+            pass
+        return progress.advancement
+
+    def after_advance(self):
+        """
+        Bring everything that is worked out from the game state up to date after
+        the game has been advanced. update() does this itself; it only needs to
+        be called after advancing the game some other way, such as with
+        columnar.ColumnarGames.
+        """
+        self._track_changes()
+        self._watch_executions()
+
+    @_instrumented('prestige')
     def prestige(self) -> str:
         """
         Set everyfin over and convert seeds to ideas. Called 'meditate' in the parlance of the game.
@@ -104,7 +447,7 @@ class Engine:
             raise RulesViolationError("You can't prestige until you have at least 1 seed.")
             
         amount = int(gs.seeds)
-        self.game = gs.prestiged()
+        self.game = gs.prestiged(self.clock)
         
         s = 's' if amount != 1 else ''
         idea_count = str(amount) if amount != 1 else 'an'
@@ -116,12 +459,55 @@ class Engine:
         self.save()
         return msg
 
+    @_instrumented('history')
+    def history(self, last: int = 10) -> str:
+        """
+        Show how previous runs (the time between meditations) went.
+        
+        :param last: The number of most recent runs to list and to average over.
+        :return: Message for user.
+        """
+        if last < 1:
+            raise RulesViolationError("You can't look at fewer than 1 run!")
+        hist = self.game.history
+        runs = hist.runs
+
+        _log.debug("t={:.4f} - Action 'history'".format(self.game.time))
+        
+        s = 's' if hist.prestiges != 1 else ''
+        msg = "{:d} meditation{:s} over {:s}, making {:s} and {:.4f}J in total".format(
+            hist.prestiges, s, format_timer(timedelta(seconds=hist.time)), format.money(hist.money, full=True), hist.juice
+        )
+        if runs.total_runs == 0:
+            return msg
+        
+        def run_text(duration: float, money: float, juice: float, seeds: float, ideas: float) -> str:
+            text = "{:s} for {:s} and {:.4f}J, {:.0f}S->{:.0f}(i)"
+            return text.format(format_timer(timedelta(seconds=duration)), format.money(int(money)), juice, seeds, ideas)
+        
+        msg += "\n\nBest runs:"
+        for column, label in (('money', 'Money'), ('juice', 'Juice'), ('seeds', 'Seeds')):
+            run_num, value = runs.best(column)
+            value_text = format.money(int(value)) if column == 'money' else "{:.4f}".format(value)
+            msg += "\n{:s}: {:s} in run {:d}".format(label, value_text, run_num)
+        
+        window = min(last, runs.total_runs)
+        averages = [runs.moving_average(name, window) for name in state.RunColumnNames]
+        msg += "\n\nAverage of last {:d}: ".format(window) + run_text(*averages)
+        
+        msg += "\n\nRecent runs:"
+        recent = [r for r in runs.records() if r[1] == 1][-last:]
+        for first_run, _, values in recent:
+            msg += "\n{:d}. ".format(first_run) + run_text(*(values[name] for name in state.RunColumnNames))
+        return msg
+
     def get_state(self, attribute: str) -> Any:
         """
         Directly obtain an attribute from the user state. Does not apply any advancement. Useful for testing/debugging.
         
         :param attribute: The state attribute to obtain. Can be one of "money", "juice", "seeds", or "ideas".
         """
+        self.finish_catch_up()
         gs = self.game
 
         _log.log(TRACE, "t={:.4f} - Action 'get_state' for {!r}".format(self.game.time, attribute))
@@ -143,6 +529,7 @@ class Engine:
         else:
             raise ValueError("should never happen")
         
+    @_instrumented('set_state')
     def set_state(
         self,
         money: Optional[int] = None,
@@ -177,6 +564,7 @@ class Engine:
         self.save()
         return gs.status_line
 
+    @_instrumented('deactivate')
     def deactivate(self, category: str, target_type: str, target_idx: int, amount: int = 1) -> str:
         """
         Turn one or more items to deactive state.
@@ -221,12 +609,13 @@ class Engine:
             raise ValueError("should never happen")
         
         msg += layout.bar() + '\n'
-        msg += layout.make_act_card(target, gs.time)
+        msg += self.render_cache.act_card(target, gs.time)
         msg += '\n' + layout.bar() + '\n'
         
         self.save()
         return msg
         
+    @_instrumented('activate')
     def activate(
         self,
         category: str,
@@ -298,13 +687,14 @@ class Engine:
             raise ValueError("should never happen")
         
         msg += layout.bar() + '\n'
-        msg += layout.make_act_card(target, gs.time)
+        msg += self.render_cache.act_card(target, gs.time)
         msg += '\n' + layout.bar() + '\n'
         
         self.save()
         return msg
 
-    def buy(self, category: str, target_type: str, target_idx: int) -> str:
+    @_instrumented('buy')
+    def buy(self, category: str, target_type: str, target_idx: int, amount: Optional[int] = 1) -> str:
         """
         Purchase somefin from the shop, glu8!
         
@@ -316,11 +706,14 @@ class Engine:
         target of the purchased item is.
         :param target_idx: The index from the store in the target_type group that
         points to the specific target of the purchase.
+        :param amount: The number of instances to buy at once. Set to None to
+        buy as many as can be afforded. Automations can only be bought one at a
+        time.
         """
         gs = self.game
         msg = ""
 
-        logged_values = "{!r} in {!r}[{!r}]".format(category, target_type, target_idx)
+        logged_values = "x{!r} {!r} in {!r}[{!r}]".format(amount, category, target_type, target_idx)
         _log.debug("t={:.4f} - Action 'buy'; ".format(self.game.time) + logged_values)
         
         if category not in ('instance', 'automation'):
@@ -329,38 +722,46 @@ class Engine:
             raise ValueError("target_type must be one of 'job' or 'outlet'")
         
         if category == 'instance':
-            if target_type == 'job':
-                idx = activities.index_of_job(target_idx, gs.jobs)
-                if idx < 0:
-                    # TODO: when buying a new one, make sure everyfin up to then is also added to make indexes
-                    # consistent w full job list glub
-                    target = OwnedActivities(activities.Jobs[target_idx], 0, 0, 0)
-                    gs.jobs.append(target)
-                else:
-                    target = gs.jobs[idx]
-            elif target_type == 'outlet':
-                idx = activities.index_of_outlet(target_idx, gs.outlets)
-                if idx < 0:
-                    # TODO: when buying a new one, make sure everyfin up to then is also added to make indexes
-                    # consistent w full outlets list glub
-                    target = OwnedActivities(activities.Outlets[target_idx], 0, 0, 0)
-                    gs.outlets.append(target)
-                else:
-                    target = gs.outlets[idx]
-            else:
-                raise ValueError("should never happen")
+            target, act_def = self._find_target(target_type, target_idx)
+            # a new item is only added to the game once the purchase has been
+            # checked, so that a refused one leaves nothing behind
+            is_new = target is None
+            if is_new:
+                target = OwnedActivities(act_def, 0, 0, 0)
 
-            if target.price > gs.money:
+            if amount is not None and amount < 1:
+                raise RulesViolationError("You can't buy less than 1 item!")
+            # pricing a huge amount on an exponential curve can take forever or
+            # overflow, so the amount is checked against what money can buy first
+            try:
+                affordable = target.activity.max_affordable(target.count, gs.money)
+                if amount is None:
+                    amount = affordable
+                if amount < 1 or amount > affordable:
+                    raise RulesViolationError("You don't have enough money for that")
+                total_price = target.activity.total_price(target.count, amount)
+            except OverflowError:
+                raise RulesViolationError("You don't have enough money for that")
+            if total_price > gs.money:
                 raise RulesViolationError("You don't have enough money for that")
             
-            gs.money -= target.price
-            target.count += 1
-            target.active += 1
+            if is_new:
+                gs.add_owned(target)
+            gs.money -= total_price
+            target.count += amount
+            target.active += amount
             if gs.free_juice < 0:
-                target.active -= 1
-            msg += "Bought {!r}; you now have {:d} of them.".format(target.name, target.count)
+                target.active -= amount
+            if amount == 1:
+                msg += "Bought {!r}; you now have {:d} of them.".format(target.name, target.count)
+            else:
+                msg_line = "Bought {:d}x {!r} for {:s}; you now have {:d} of them."
+                msg += msg_line.format(amount, target.name, format.money(total_price), target.count)
                 
         elif category == 'automation':
+            if amount != 1:
+                raise RulesViolationError("Automations can only be bought one at a time.")
+
             target, act_def = self._find_target(target_type, target_idx)
             if target is None:
                 msg = "You don't own any of {!r}; buy at least one first".format(act_def.name)
@@ -391,6 +792,7 @@ class Engine:
         self.save()
         return msg
         
+    @_instrumented('click')
     def click(self, target_type: str, target_idx: int) -> str:
         """
         Click on one of the things. target_idx is relative to global job and outlet list, NOT
@@ -447,6 +849,7 @@ class Engine:
         if target_type not in ('job', 'outlet'):
             raise ValueError("target_type must be one of 'job' or 'outlet'")
 
+        self.finish_catch_up()
         target, _ = self._find_target(target_type, target_idx)
         if target is None:
             return 0
@@ -459,82 +862,254 @@ class Engine:
         if target_type not in ('job', 'outlet'):
             raise ValueError("target_type must be one of 'job' or 'outlet'")
 
+        self.finish_catch_up()
         target, _ = self._find_target(target_type, target_idx)
         if target is None:
             return False
         return target.automated
 
-    def show_store(self) -> str:
+    def show_store(self, **kwargs) -> str:
+        """
+        Render the store. Accepts the same filtering and paging arguments as
+        iter_store_lines().
+        """
+        return ''.join(self.iter_store_lines(**kwargs))
+
+    @_instrumented('store')
+    def iter_store_lines(
+        self,
+        target_type: Optional[str] = None,
+        running: bool = False,
+        automated: bool = False,
+        affordable: bool = False,
+        page: Optional[int] = None,
+        page_size: int = DefaultPageSize
+    ) -> Iterator[str]:
+        """
+        Render the store a line at a time. Each line ends with a newline, so
+        joining them gives the same text as show_store().
+
+        Listings are filtered and paged before any of them are rendered, so only
+        the listings that are shown are ever rendered.
+
+        :param target_type: Only show 'job' or 'outlet' listings. If None, both
+        are shown.
+        :param running: Only show listings for activities that have an execution
+        running.
+        :param automated: Only show listings for activities whose automation is
+        on.
+        :param affordable: Only show listings for activities whose next instance
+        can be bought with the current money.
+        :param page: The page of listings to show, starting from 1. If None,
+        every listing is shown.
+        :param page_size: The number of listings on each page.
+        """
         gs = self.game
-        msg = ""
 
         _log.debug("t={:.4f} - Action 'store'".format(self.game.time))
-        
-        msg += gs.status_line + '\n\n'
-        msg += "Store:\n"
-        msg += "\nJobs:\n"
-        
-        msg += layout.bar() + '\n'
-        for j in activities.Jobs:
-            # we need to get the current number of owned instances of the item
-            # to calculate prices
-            cur_idx = activities.index_of_job(j, gs.jobs)
-            if cur_idx < 0:
-                cur_count = 0
-                auto_count = 0
-            else:
-                cur_count = gs.jobs[cur_idx].count
-                auto_count = gs.jobs[cur_idx].automations
-        
-            msg += layout.make_act_store_listing(j, cur_count, auto_count)
-            msg += '\n' + layout.bar() + '\n'
-            
-        msg += '\nOutlets:\n'
-        msg += layout.bar() + '\n'
-        for o in activities.Outlets:
-            # we need to get the current number of owned instances of the item
-            # to calculate prices
-            cur_idx = activities.index_of_outlet(o, gs.outlets)
-            if cur_idx < 0:
-                cur_count = 0
-                auto_count = 0
-            else:
-                cur_count = gs.outlets[cur_idx].count
-                auto_count = gs.outlets[cur_idx].count
-        
-            msg += layout.make_act_store_listing(o, cur_count, auto_count)
-            msg += '\n' + layout.bar() + '\n'
-            
-        self.save()
-        return msg
 
-    def status(self) -> str:
+        view = _ListingView(target_type, running, automated, affordable, page, page_size)
+        entries, total = self._select_entries(view, store=True)
+        render = functools.partial(self._render_store, view, entries, total)
+        # the status line shows the game time, so only the listings below it are
+        # cached; none of them change as time passes
+        yield gs.status_line + '\n'
+        yield from self.render_cache.page_lines(('store', view), gs.state_version, None, render)
+
+    def status(self, **kwargs) -> str:
+        """
+        Render the status. Accepts the same filtering and paging arguments as
+        iter_status_lines().
+        """
+        return ''.join(self.iter_status_lines(**kwargs))
+
+    @_instrumented('status')
+    def iter_status_lines(
+        self,
+        target_type: Optional[str] = None,
+        running: bool = False,
+        automated: bool = False,
+        affordable: bool = False,
+        page: Optional[int] = None,
+        page_size: int = DefaultPageSize
+    ) -> Iterator[str]:
+        """
+        Render the status a line at a time. Each line ends with a newline, so
+        joining them gives the same text as status().
+
+        Cards are filtered and paged before any of them are rendered, so only
+        the cards that are shown are ever rendered.
+
+        :param target_type: Only show 'job' or 'outlet' cards. If None, both are
+        shown.
+        :param running: Only show cards for activities that have an execution
+        running.
+        :param automated: Only show cards for activities whose automation is on.
+        :param affordable: Only show cards for activities whose next instance can
+        be bought with the current money.
+        :param page: The page of cards to show, starting from 1. If None, every
+        card is shown.
+        :param page_size: The number of cards on each page.
+        """
         gs = self.game
-        msg = ""
 
         _log.log(TRACE, "t={:.4f} - Action 'status'".format(self.game.time))
+
+        view = _ListingView(target_type, running, automated, affordable, page, page_size)
+        entries, total = self._select_entries(view, store=False)
+        render = functools.partial(self._render_status, view, entries, total)
+        # the status line shows the game time, so only the cards below it are
+        # cached, and only cards with an execution running change as time passes
+        any_running = any(owned is not None and owned.execution is not None for _, _, owned in entries)
+        yield gs.status_line + '\n'
+        yield from self.render_cache.page_lines(
+            ('status', view), gs.state_version, gs.time if any_running else None, render
+        )
         
-        msg += gs.status_line
-        msg += "\n\nJobs:\n"
+    @property
+    def dirty(self) -> bool:
+        """
+        Whether the game state has changes that have not yet been written.
+        """
+        return self._dirty
+    
+    @property
+    def notify_name(self) -> str:
+        """
+        The name that completion notifications for this game are given under.
+        """
+        if self.player is not None:
+            return self.player
+        return self.state_file if self.state_file is not None else ''
+    
+    def status_delta(self, since: int) -> StatusDelta:
+        """
+        Get only the parts of the status that have changed since a previous state
+        version, so that a client which already shows the status at that version
+        can update it in place.
         
-        msg += layout.bar() + '\n'
-        for job in gs.jobs:
-            msg += layout.make_act_card(job, gs.time)
-            msg += '\n' + layout.bar() + '\n'
+        :param since: The state version the client last saw. Give 0 to get
+        everything.
+        :return: The changed values and cards along with the current version.
+        """
+        self.finish_catch_up()
+        gs = self.game
+
+        _log.log(TRACE, "t={:.4f} - Action 'status_delta' since {!r}".format(self.game.time, since))
         
-        msg += '\n\nOutlets:\n'
-        msg += layout.bar() + '\n'
-        for out in gs.outlets:
-            msg += layout.make_act_card(out, gs.time)
-            msg += '\n' + layout.bar() + '\n'
+        scalars = {}
+        for name in state.TrackedScalars:
+            changed_at, _ = gs.change_log.get(name, (0, 0))
+            if changed_at > since:
+                scalars[name] = getattr(gs, name)
         
-        return msg
+        cards = {}
+        for target_type, owned_list in (('job', gs.jobs), ('outlet', gs.outlets)):
+            for oa in owned_list:
+                changed_at, _ = gs.change_log.get(state.card_change_key(oa.activity), (0, 0))
+                if changed_at > since:
+                    key = (target_type, activities.store_index(oa.activity))
+                    cards[key] = self.render_cache.act_card(oa, gs.time)
+        
+        return StatusDelta(since, gs.state_version, gs.time, scalars, cards)
         
     def save(self):
+        """
+        Mark the game state as changed and write it out. In 'relaxed' durability
+        mode the write is skipped if the last one was too recent; call flush() or
+        flush_due() later to make sure it happens.
+        """
+        self.finish_catch_up()
+        self._track_changes()
+        self._watch_executions()
+        if self._transaction_depth > 0:
+            self._save_deferred = True
+            return
+        self._dirty = True
+        if self.durability == 'relaxed':
+            self.flush_due()
+        else:
+            self.flush()
+    
+    def flush_due(self):
+        """
+        Write out unsaved changes if at least flush_interval_ms has passed since
+        the last write.
+        """
+        elapsed_ms = (time.monotonic() - self._last_flush) * 1000
+        if self._dirty and elapsed_ms >= self.flush_interval_ms:
+            self.flush()
+    
+    def flush(self):
+        """
+        Immediately write out unsaved changes. Does nothing if there aren't any.
+        """
+        if not self._dirty:
+            return
         if self.state_file is not None:
-            state.save(self.state_file, self.game)
+            hot_file = None
+            if self.save_layout == 'hot':
+                if self._hot_file is None or self._hot_file.file_name != self.state_file:
+                    if self._hot_file is not None:
+                        self._hot_file.close()
+                    self._hot_file = state.HotStateFile(self.state_file)
+                hot_file = self._hot_file
+            state.save(self.state_file, self.game, self.durability, hot_file, self.clock)
+            self.flush_count += 1
+        if self.player is not None:
+            if self._leaderboard is None or self._leaderboard.file_name != self.leaderboard_file:
+                self._leaderboard = leaderboard.LeaderboardFile(self.leaderboard_file)
+            self._leaderboard.update(self.player, self.game, self.durability)
+        self._dirty = False
+        self._last_flush = time.monotonic()
+
+    def close(self):
+        """
+        Write out unsaved changes and release the state file. The Engine should
+        not be used afterwards.
+        """
+        self.flush()
+        if self._hot_file is not None:
+            self._hot_file.close()
+            self._hot_file = None
+
+    @contextlib.contextmanager
+    def transaction(self):
+        """
+        Context manager that groups several actions together. Calls to save()
+        made within the context are deferred until it exits, at which point a
+        single save is done if any were requested. If an exception (such as a
+        RulesViolationError) is raised within the context, the game state is
+        rolled back to what it was on entry, nothing is saved, and the exception
+        is re-raised.
+        
+        Transactions can be nested; only the outermost one saves, but each one
+        rolls back its own changes.
+        """
+        self.finish_catch_up()
+        snapshot = self.game.copy(self.clock)
+        self._transaction_depth += 1
+        _log.debug("t={:.4f} - Transaction started (depth {:d})".format(self.game.time, self._transaction_depth))
+        try:
+            yield self
+        except BaseException:
+            self.game = snapshot
+            # the snapshot's state version may already have been reused for
+            # rendering state that is now discarded
+            self.render_cache.clear()
+            self._transaction_depth -= 1
+            if self._transaction_depth == 0:
+                self._save_deferred = False
+            _log.debug("t={:.4f} - Transaction rolled back".format(self.game.time))
+            raise
+
+        self._transaction_depth -= 1
+        _log.debug("t={:.4f} - Transaction committed".format(self.game.time))
+        if self._transaction_depth == 0 and self._save_deferred:
+            self._save_deferred = False
+            self.save()
     
-    def _load_or_create_state(self) -> Optional[Advancement]:
+    def _load_or_create_state(self, defer_catch_up: bool = False) -> Optional[Advancement]:
         """Get a ready-to-use GameState. If loaded from disk, advancement is done so that the
         returned game state is updated with everything that needed to have been done since
         the last run.
@@ -543,6 +1118,9 @@ class Engine:
         If no state file exists, a new one is created and set as value of self.game.
         
         Will print to stdout if needs confirmation from user to override.
+        
+        If defer_catch_up is set, advancement is left for catch_up() and None is
+        returned.
         """
         self.game = None
         
@@ -550,7 +1128,7 @@ class Engine:
 
         if self.state_file is not None:
             try:
-                self.game, idle_seconds = state.load(self.state_file)
+                self.game, idle_seconds = state.load(self.state_file, self.clock)
             except state.SerializedStateError as e:
                 print(str(e), file=sys.stderr)
                 overwrite = input("Run anyways and overwrite the existing file (Y/N)? ")
@@ -560,81 +1138,260 @@ class Engine:
                     raise
 
         if self.game is None:
-            self.game = GameState()
-            self.game.jobs.append(OwnedActivities(activities.from_id(0), 1, 1, 0))
+            self.game = GameState(self.clock)
+            self.game.add_owned(OwnedActivities(activities.from_id(0), 1, 1, 0))
+            self._track_changes()
+            self._watch_executions()
+            return None
+        elif defer_catch_up:
+            # executions aren't watched until they are caught up, since until
+            # then the ones that already finished still look like they are due
+            self._catch_up_seconds = idle_seconds
+            self._track_changes()
             return None
         else:
             adv = self._advance(idle_seconds)
+            self._track_changes()
+            self._watch_executions()
             return adv
 
-    def _advance(self, idle_seconds: float) -> Advancement:
+    def _select_entries(
+        self, view: '_ListingView', store: bool
+    ) -> Tuple[List[Tuple[str, Activity, Optional[OwnedActivities]]], int]:
+        """
+        Get the activities that a view of the status or store shows, in the order
+        they are shown, without rendering anything.
+
+        :param view: The filters and page to apply.
+        :param store: Whether to select from every Activity in the store rather
+        than only the owned ones.
+        :return: The type, Activity, and OwnedActivities (or None if not owned)
+        of each activity on the page, along with the number of activities that
+        pass the filters across every page.
+        """
+        gs = self.game
+        selected = []
+        for target_type in view.types:
+            if store:
+                catalog = activities.Jobs if target_type == 'job' else activities.Outlets
+                items = [(act, gs.owned(act)) for act in catalog]
+            else:
+                owned_list = gs.jobs if target_type == 'job' else gs.outlets
+                items = [(oa.activity, oa) for oa in owned_list]
+
+            for act, oa in items:
+                if view.running and (oa is None or oa.execution is None):
+                    continue
+                if view.automated and (oa is None or not oa.automated):
+                    continue
+                if view.affordable and act.price(oa.count if oa is not None else 0) > gs.money:
+                    continue
+                selected.append((target_type, act, oa))
+
+        if view.page is None:
+            return selected, len(selected)
+        page_count = view.page_count(len(selected))
+        if view.page > page_count:
+            msg = "There {:s} only {:d} page{:s} to show.".format(
+                "is" if page_count == 1 else "are", page_count, "" if page_count == 1 else "s"
+            )
+            raise RulesViolationError(msg)
+        start = (view.page - 1) * view.page_size
+        return selected[start:start + view.page_size], len(selected)
+
+    def _render_store(
+        self, view: '_ListingView', entries: List[Tuple[str, Activity, Optional[OwnedActivities]]], total: int
+    ) -> Iterator[str]:
+        yield '\n'
+        yield "Store:\n"
+        for target_type in view.types:
+            yield '\n'
+            yield ("Jobs:\n" if target_type == 'job' else "Outlets:\n")
+            yield layout.bar() + '\n'
+            for entry_type, act, owned in entries:
+                if entry_type != target_type:
+                    continue
+                # we need to get the current number of owned instances of the
+                # item to calculate prices
+                if owned is None:
+                    cur_count = 0
+                    auto_count = 0
+                else:
+                    cur_count = owned.count
+                    auto_count = owned.automations
+
+                for line in self.render_cache.store_listing_lines(act, cur_count, auto_count):
+                    yield line + '\n'
+                yield layout.bar() + '\n'
+        yield from view.footer_lines(total)
+
+    def _render_status(
+        self, view: '_ListingView', entries: List[Tuple[str, Activity, Optional[OwnedActivities]]], total: int
+    ) -> Iterator[str]:
+        gs = self.game
+
+        for idx, target_type in enumerate(view.types):
+            if idx > 0:
+                yield '\n'
+            yield '\n'
+            yield ("Jobs:\n" if target_type == 'job' else "Outlets:\n")
+            yield layout.bar() + '\n'
+            for entry_type, _, owned in entries:
+                if entry_type != target_type:
+                    continue
+                for line in self.render_cache.act_card_lines(owned, gs.time):
+                    yield line + '\n'
+                yield layout.bar() + '\n'
+        yield from view.footer_lines(total)
+
+    def _track_changes(self):
+        """
+        Compare each tracked value and activity card against its fingerprint in
+        the change log. If any have changed, the state version is incremented and
+        the changed ones are recorded as changing at the new version.
+        """
+        gs = self.game
+        current = {}
+        # cards are fingerprinted by what goes into them rather than by
+        # rendering them, so that nothing is rendered on every update
+        for name in state.TrackedScalars:
+            current[name] = _fingerprint((getattr(gs, name),))
+        for oa in gs.jobs + gs.outlets:
+            current[state.card_change_key(oa.activity)] = _fingerprint(self.render_cache.card_key(oa, gs.time))
+        
+        changed = [k for k, fp in current.items() if k not in gs.change_log or gs.change_log[k][1] != fp]
+        if len(changed) > 0:
+            gs.state_version += 1
+            for k in changed:
+                gs.change_log[k] = (gs.state_version, current[k])
+    
+    def _watch_executions(self):
+        """
+        Give the current game state to the notifier, if there is one, so that its
+        notifications match the executions that are running now.
+        """
+        if self.notifier is not None:
+            self.notifier.watch(self.notify_name, self.game)
+    
+    def _advance(self, idle_seconds: float, advanced_at: Optional[datetime] = None) -> Advancement:
         """
         Advance the game state based on how much time has passed since shutdown.
         
         Advancements are applied to the game state and an object representing the
         advancement is returned in case the caller wishes to know.
+
+        :param idle_seconds: How much time has passed since shutdown.
+        :param advanced_at: The time to record as when the game was last
+        advanced. Defaults to the current time on the clock.
+        """
+        progress = None
+        for progress in self._advance_slices(idle_seconds, advanced_at=advanced_at):
+            pass
+        return progress.advancement
+
+    def _advance_slices(
+        self,
+        idle_seconds: float,
+        max_seconds: Optional[float] = None,
+        max_completions: Optional[int] = None,
+        advanced_at: Optional[datetime] = None
+    ) -> Iterator[CatchUpProgress]:
         """
+        Advance the game state the same way as _advance(), stopping after each
+        slice of work to produce how far along it is. The game state is only
+        partly advanced in between: each completed execution is cleared and
+        automated ones are restarted, with their cost taken from money, as the
+        slices go, but the money, juice, and seeds that were made are only added
+        and game time only moves forward after the last slice. The game must not
+        be read or changed until then.
+        
+        :param idle_seconds: How much time has passed since shutdown.
+        :param max_seconds: The most simulated time that a slice covers, summed
+        over every owned activity. None for no limit.
+        :param max_completions: The most executions that a slice completes. None
+        for no limit.
+        :param advanced_at: The time to record as when the game was last
+        advanced. Defaults to the current time on the clock.
+        """
+        if advanced_at is None:
+            advanced_at = self.clock.now()
+        start = time.perf_counter()
+        elapsed = 0.0
+        completions = 0
+        slice_completions = 0
+        slice_seconds = 0.0
         adv = Advancement(idle_seconds, 0, 0, 0.0)
-        now = self.game.time + idle_seconds
+        begin = self.game.time
+        now = begin + idle_seconds
+        owned = self.game.jobs + self.game.outlets
+        # these are logged with arguments rather than formatted here, so that
+        # records dropped by logutil.RepeatLimitFilter are never formatted
         _log.log(logutil.TRACE, "Starting advance")
-        for oa in self.game.jobs + self.game.outlets:
-            _log.log(logutil.TRACE, "ADV: Checking OA {!r}".format(oa))
+        for k, oa in enumerate(owned):
+            _log.log(logutil.TRACE, "ADV: Checking OA %r", oa)
+            # how far this activity has been advanced
+            covered = begin
             while oa.execution is not None and oa.execution.remaining(now).total_seconds() <= 0:
                 cur_exec = oa.execution
-                _log.log(logutil.TRACE, "ADV->OA: Completing Execution: {!r}".format(cur_exec))
+                _log.log(logutil.TRACE, "ADV->OA: Completing Execution: %r", cur_exec)
                 
                 adv.money += cur_exec.money
                 adv.juice += cur_exec.juice
                 adv.seeds += seed_func(cur_exec)
+                completions += 1
                 
                 oa.execution = None
                 
                 # if automated, get set up to calculate next execution.
                 if oa.automated:
-                    _log.log(logutil.TRACE, "ADV->OA: is automated so starting new execution".format(cur_exec))
+                    _log.log(logutil.TRACE, "ADV->OA: is automated so starting new execution")
                     # make sure running the next execution doesn't violate constraints
                     
                     free_juice = self.game.free_juice + adv.juice
                     free_money = self.game.money + adv.money
-                    _log.log(logutil.TRACE, "ADV->OA: free money: {:d}, free juice: {:.8f}".format(free_money, free_juice))
+                    _log.log(logutil.TRACE, "ADV->OA: free money: %d, free juice: %.8f", free_money, free_juice)
                     if free_juice >= oa.juice_cost and free_money >= oa.money_cost:
                         _log.log(logutil.TRACE, "ADV->OA: requirements met, starting auto-execution")
                         oa.execute(cur_exec.end)
                         self.game.money -= oa.money_cost
-                        _log.log(logutil.TRACE, "ADV->OA: subtracted price: {!s}".format(oa.price))
+                        _log.log(logutil.TRACE, "ADV->OA: subtracted price: %s", oa.price)
                     else:
                         _log.log(logutil.TRACE, "ADV->OA: requirements not met, halting auto")
                         oa.automated = False
                 else:
-                    _log.log(logutil.TRACE, "ADV->OA: not automated so cleared execution".format(cur_exec))
-            _log.log(logutil.TRACE, "ADV: Done with OA".format(oa))
+                    _log.log(logutil.TRACE, "ADV->OA: not automated so cleared execution")
+
+                slice_completions += 1
+                slice_seconds += max(cur_exec.end - covered, 0.0)
+                covered = max(covered, cur_exec.end)
+                full = max_completions is not None and slice_completions >= max_completions
+                full = full or (max_seconds is not None and slice_seconds >= max_seconds)
+                if full:
+                    activity_done = (covered - begin) / idle_seconds if idle_seconds > 0 else 1.0
+                    fraction = (k + min(activity_done, 1.0)) / len(owned)
+                    elapsed += time.perf_counter() - start
+                    yield CatchUpProgress(min(fraction, 1.0), adv, completions, False)
+                    start = time.perf_counter()
+                    slice_completions = 0
+                    slice_seconds = 0.0
+            _log.log(logutil.TRACE, "ADV: Done with OA")
                 
         self.game.time += adv.idle_seconds
         self.game.money += adv.money
         self.game.juice += adv.juice
         self.game.seeds += adv.seeds
-        self.game.last_advancement = datetime.now(timezone.utc)
-        _log.log(logutil.TRACE, "Ending advance, calculated: {!r}".format(adv))
-        return adv
+        self.game.last_advancement = advanced_at
+        _log.log(logutil.TRACE, "Ending advance, calculated: %r", adv)
+        _advance_completions.observe(completions)
+        _advance_seconds.observe(elapsed + time.perf_counter() - start)
+        yield CatchUpProgress(1.0, adv, completions, True)
     
     def _find_target(self, target_type: str, target_idx: int) -> Tuple[Optional[OwnedActivities], Activity]:
-        gs = self.game
-        
         if target_type == 'job':
-            job_def = activities.Jobs[target_idx]
-            idx = activities.index_of_job(target_idx, gs.jobs)
-            if idx < 0:
-                return None, job_def
-            target = gs.jobs[idx]
-            return target, job_def
+            act_def = activities.Jobs[target_idx]
         elif target_type == 'outlet':
-            outlet_def = activities.Outlets[target_idx]
-            idx = activities.index_of_outlet(target_idx, gs.outlets)
-            if idx < 0:
-                return None, outlet_def
-            target = gs.outlets[idx]
-            return target, outlet_def
+            act_def = activities.Outlets[target_idx]
         else:
             raise ValueError("target_type must be one of 'job' or 'outlet'")
 
-        
\ No newline at end of file
+        return self.game.owned(act_def), act_def
@@ -2,26 +2,272 @@
 Handy functions for both styles of launchers (CLI and GUI) to use.
 """
 
+import os
 import logging
 import argparse
+import shlex
+import json
 import sys
+import functools
+from typing import Optional, Tuple, Dict, Any, Callable
 
-from . import logutil, engine, gui, version
+from . import logutil, engine, version, metrics, profiling, state, leaderboard, format, trace, loadgen, daemon, client, memory
+from . import columnar, simulation, watch
 
 _log = logging.getLogger(__name__)
 _log.setLevel(logging.DEBUG)
 
+# names of the parsed arguments that are global options or bookkeeping rather
+# than arguments of the command itself
+_GlobalArgNames = (
+    'state', 'log_trace', 'durability', 'flush_interval', 'save_layout', 'profile', 'player', 'leaderboard', 'trace',
+    'no_daemon', 'command', 'debug_command', 'func', 'recorder'
+)
+
+# command handlers that can't be run from a recorded trace
+_UnreplayableHandlers = (
+    'exec_gui', 'exec_batch', 'exec_debug_replay', 'exec_debug_load', 'exec_debug_protocol', 'exec_debug_columnar',
+    'exec_simulate', 'exec_watch'
+)
+
+# names of the parsed arguments that are global options a line of a batch file
+# can't give
+_BatchGlobalArgNames = (
+    'state', 'log_trace', 'durability', 'flush_interval', 'save_layout', 'profile', 'player', 'leaderboard', 'trace',
+    'no_daemon'
+)
+
+# parser for commands sent to the daemon with the wire protocol, built the first
+# time one arrives
+_forward_parser: Optional[argparse.ArgumentParser] = None
+
+# command handlers that always run in the CLI's own process instead of the
+# daemon, either because they are interactive or because they would keep the
+# daemon busy for a long time
+_LocalHandlers = (
+    'exec_gui', 'exec_debug_replay', 'exec_debug_load', 'exec_debug_protocol', 'exec_debug_columnar', 'exec_simulate',
+    'exec_watch'
+)
+
+# command handlers that catch up the time since the game was last saved
+# themselves, a slice at a time, instead of having it done when it is loaded
+_DeferredCatchUpHandlers = ('exec_gui',)
+
 
 def execute(default_args=list()):
-    parser = argparse.ArgumentParser(description="Create vast new worlds by idling")
+    parser = _build_parser()
+
+    if len(sys.argv) > 1:
+        argv = sys.argv[1:]
+    else:
+        argv = default_args
+    args = parser.parse_args(_expand_bare_profile(argv))
+
+    if args.log_trace:
+        logging.getLogger('cre8').setLevel(logutil.TRACE)
+
+    if _should_forward(args):
+        try:
+            _forward_command(args)
+            return
+        except daemon.DaemonUnavailableError as e:
+            _log.debug("Running command in this process instead of the daemon: {!s}".format(e))
+    
+    eng = engine.Engine(
+        args.state,
+        durability=args.durability,
+        flush_interval_ms=args.flush_interval,
+        save_layout=args.save_layout,
+        player=args.player,
+        leaderboard_file=args.leaderboard,
+        defer_catch_up=args.func.__name__ in _DeferredCatchUpHandlers
+    )
+    args.recorder = _make_recorder(args)
+    try:
+        if args.profile is None:
+            _run_command(eng, args, args.recorder)
+        else:
+            profiler = profiling.Profiler(args.profile, args.command)
+            try:
+                with profiler:
+                    _run_command(eng, args, args.recorder)
+            finally:
+                print("Wrote {:s} profile to {:s}".format(args.profile, profiler.finish()), file=sys.stderr)
+    finally:
+        eng.flush()
+
+
+def _should_forward(args) -> bool:
+    """
+    Check whether a parsed command should be run by the daemon.
+    """
+    if args.no_daemon or args.profile is not None or not daemon.Supported:
+        return False
+    return args.func.__name__ not in _LocalHandlers
+
+
+def _forward_command(args):
+    """
+    Have the daemon run a parsed command. Raises DaemonUnavailableError if the
+    daemon can't be reached, in which case the command has not been run.
+    """
+    cmd_args = {k: v for k, v in vars(args).items() if k not in ('func', 'recorder')}
+    stdin_text = None
+    if args.command == 'batch' and args.file == '-':
+        stdin_text = sys.stdin.read()
+    daemon.forward(args.func.__name__, cmd_args, stdin_text)
+
+
+def parse_forwarded(argv):
+    """
+    Parse the command-line arguments of a command sent to the daemon with the
+    wire protocol. Like the CLI, argparse exits with SystemExit if they are not
+    valid or ask for help.
+
+    :param argv: The command-line arguments, including global options.
+    :return: The name of the function in this module that runs the command and
+    the parsed arguments to give to run_forwarded().
+    """
+    # clients tend to send the same few commands over and over, so parsing is
+    # skipped for ones that were seen recently
+    handler, cmd_args = _parse_forwarded_cached(tuple(argv))
+    return handler, dict(cmd_args)
+
+
+@functools.lru_cache(maxsize=256)
+def _parse_forwarded_cached(argv: Tuple[str, ...]) -> Tuple[str, Dict[str, Any]]:
+    global _forward_parser
+    if _forward_parser is None:
+        _forward_parser = _build_parser()
+    args = _forward_parser.parse_args(_expand_bare_profile(argv))
+    if args.func.__name__ in _LocalHandlers or args.profile is not None:
+        raise ValueError("{!r} can't be run by the daemon".format(args.command))
+    return args.func.__name__, {k: v for k, v in vars(args).items() if k not in ('func', 'recorder')}
+
+
+def run_forwarded(eng: engine.Engine, handler: str, cmd_args):
+    """
+    Run a command that was forwarded to the daemon by a CLI process.
+
+    :param eng: The Engine for the command's global options.
+    :param handler: The name of the function in this module that runs the
+    command.
+    :param cmd_args: The parsed arguments of the command, including global
+    options.
+    """
+    func = globals().get(handler, None)
+    if func is None or not handler.startswith('exec_') or handler in _LocalHandlers:
+        raise ValueError("{!r} can't be run by the daemon".format(handler))
+    args = argparse.Namespace(**cmd_args)
+    args.func = func
+    args.recorder = _make_recorder(args)
+    _run_command(eng, args, args.recorder)
+
+
+def _make_recorder(args) -> Optional[trace.TraceRecorder]:
+    if args.trace is None:
+        return None
+    return trace.TraceRecorder(args.trace, args.player if args.player is not None else args.state)
+
+
+def _run_command(eng: engine.Engine, args, recorder: Optional[trace.TraceRecorder]):
+    """
+    Run a parsed command, recording it to the trace if there is a recorder.
+    Batches are not recorded themselves; the commands within them are.
+    """
+    if recorder is None or args.command == 'batch':
+        args.func(eng, args)
+        return
+
+    command = args.command
+    if command == 'debug':
+        command += ' ' + args.debug_command
+    cmd_args = {k: v for k, v in vars(args).items() if k not in _GlobalArgNames}
+    with recorder.record(command, args.func.__name__, cmd_args):
+        args.func(eng, args)
+
+
+def _replay_command(eng: engine.Engine, entry: trace.TraceEntry):
+    """
+    Run a command from a recorded trace.
+    """
+    func = globals().get(entry.handler, None)
+    if func is None or not entry.handler.startswith('exec_') or entry.handler in _UnreplayableHandlers:
+        raise ValueError("{!r} can't be replayed".format(entry.command))
+    func(eng, argparse.Namespace(**entry.args))
+
+
+def _expand_bare_profile(argv):
+    """
+    Give an explicit mode to a bare --profile so that argparse doesn't try to
+    use the command that follows it as the mode.
+    """
+    expanded = list(argv)
+    for idx, arg in enumerate(expanded):
+        if arg == '--':
+            break
+        if arg == '--profile':
+            next_arg = expanded[idx + 1] if idx + 1 < len(expanded) else None
+            if next_arg not in profiling.ProfileModes:
+                expanded[idx] = '--profile=cpu'
+    return expanded
+
+
+class _BatchLineParser(argparse.ArgumentParser):
+    """
+    Parser for the lines of a batch file. A bad line raises ValueError instead
+    of exiting, since batches can be run by the daemon, where exiting would stop
+    it for every player.
+    """
+
+    def exit(self, status=0, message=None):
+        raise ValueError(message.strip() if message else "Batch lines can't ask for help; the batch was not run")
+
+    def error(self, message):
+        raise ValueError(message)
+
+
+def _build_parser(parser_class=argparse.ArgumentParser) -> argparse.ArgumentParser:
+    parser = parser_class(description="Create vast new worlds by idling")
     parser.add_argument('-s', '--state', default='st8cre8.p', help="Give location of state file")
     parser.add_argument('-t', '--log-trace', action='store_true', help="Include trace-level logs in logfile")
+    durability_help = "How carefully to write the state file. 'relaxed' writes in place and coalesces saves, 'atomic'"
+    durability_help += " writes a temp file then swaps it in, and 'durable' also syncs to disk."
+    parser.add_argument(
+        '--durability', default='atomic', choices=state.DurabilityModes, help=durability_help
+    )
+    flush_help = "In relaxed durability mode, the minimum number of milliseconds between writes of the state file"
+    parser.add_argument(
+        '--flush-interval', default=engine.DefaultFlushIntervalMs, type=int, metavar='MS', help=flush_help
+    )
+    layout_help = "How to lay out the state file. 'hot' lets saves that only change frequently updated values be"
+    layout_help += " written in place; either layout can be read back no matter which is selected."
+    parser.add_argument('--save-layout', default='pickle', choices=state.SaveLayouts, help=layout_help)
+    profile_help = "Profile the command for CPU time (the default) or memory allocations and write a report next to"
+    profile_help += " the logfile."
+    parser.add_argument(
+        '--profile', nargs='?', const='cpu', choices=profiling.ProfileModes, metavar='cpu|mem', help=profile_help
+    )
+    player_help = "Name to show on the leaderboards; if given, your scores are updated every time the game is saved"
+    parser.add_argument('-p', '--player', help=player_help, metavar='NAME')
+    leaderboard_help = "Give location of the leaderboard file shared by all players"
+    parser.add_argument('--leaderboard', default=leaderboard.DefaultLeaderboardFile, help=leaderboard_help, metavar='FILE')
+    trace_help = "Append a record of each command run to the given trace file, for replaying later with"
+    trace_help += " 'debug replay'"
+    parser.add_argument('--trace', help=trace_help, metavar='FILE')
+    no_daemon_help = "Run the command in this process instead of having the background daemon that keeps the game"
+    no_daemon_help += " loaded between commands run it"
+    parser.add_argument('--no-daemon', action='store_true', help=no_daemon_help)
     subparsers = parser.add_subparsers(required=True, dest="command")
     
     gui_parser = subparsers.add_parser('gui', help="Start the game GUI")
     gui_parser.set_defaults(func=exec_gui)
     
     status_parser = subparsers.add_parser('status', help="Show current status of the game")
+    status_since_help = "Only show the values and cards that changed since the given state version, along with the"
+    status_since_help += " current version and game time"
+    status_parser.add_argument('--since', help=status_since_help, type=int, metavar='VERSION')
+    _add_view_args(status_parser, 'cards')
     status_parser.set_defaults(func=exec_status)
     
     click_parser = subparsers.add_parser('click', help="Click on one of your many lovely items")
@@ -31,12 +277,27 @@ def execute(default_args=list()):
     click_parser.set_defaults(func=exec_click)
     
     store_parser = subparsers.add_parser('store', help="Show the items available to buy")
+    _add_view_args(store_parser, 'listings')
     store_parser.set_defaults(func=exec_store)
 
+    watch_help = "Show the status of the game live, redrawing only what changes, until Ctrl-C is pressed"
+    watch_parser = subparsers.add_parser('watch', help=watch_help)
+    watch_fps_help = "Frames drawn per second"
+    watch_parser.add_argument('--fps', help=watch_fps_help, type=float, default=watch.DefaultFps)
+    watch_frames_help = "Stop after drawing this many frames"
+    watch_parser.add_argument('--frames', help=watch_frames_help, type=int)
+    _add_view_args(watch_parser, 'cards')
+    watch_parser.set_defaults(func=exec_watch)
+
     buy_parser = subparsers.add_parser('buy', help="Buy a job or outlet")
     buy_parser.add_argument('type', help="The kind of thing you want to buy", choices=['job', 'outlet'])
     buy_activity_help = "The index of the item to buy from the full list of all items in the store"
     buy_parser.add_argument('activity', help=buy_activity_help, type=int)
+    buy_amount_group = buy_parser.add_mutually_exclusive_group()
+    buy_count_help = "The number of instances to buy"
+    buy_amount_group.add_argument('-c', '--count', help=buy_count_help, type=int, default=1)
+    buy_max_help = "Buy as many instances as you can afford"
+    buy_amount_group.add_argument('-m', '--max', help=buy_max_help, action='store_true')
     buy_parser.set_defaults(func=exec_buy, category='instance')
     
     buyauto_parser = subparsers.add_parser('buyauto', help="Buy automation for a job or outlet")
@@ -44,7 +305,7 @@ def execute(default_args=list()):
     buyauto_parser.add_argument('type', help=buyauto_type_help, choices=['job', 'outlet'])
     buyauto_activity_help = "The index of the item to buy for from the full list of all items in the store"
     buyauto_parser.add_argument('activity', help=buyauto_activity_help, type=int)
-    buyauto_parser.set_defaults(func=exec_buy, category='automation')
+    buyauto_parser.set_defaults(func=exec_buy, category='automation', count=1, max=False)
     
     auto_parser = subparsers.add_parser('automate', help="Turn on automation for a job or outlet")
     auto_type_help = "The kind of activity you want to activate automation for."
@@ -78,6 +339,11 @@ def execute(default_args=list()):
     prest_parser = subparsers.add_parser('meditate', help=prest_help)
     prest_parser.set_defaults(func=exec_prestige)
 
+    hist_parser = subparsers.add_parser('history', help="Show how your previous runs between meditations went")
+    hist_last_help = "The number of most recent runs to list and to average over"
+    hist_parser.add_argument('-n', '--last', help=hist_last_help, type=_positive_int, default=10)
+    hist_parser.set_defaults(func=exec_history)
+
     # debug stuff
     debug_parser = subparsers.add_parser('debug', help="execute debugging and testing commands")
     debug_subs = debug_parser.add_subparsers(required=True, dest="debug_command")
@@ -100,20 +366,245 @@ def execute(default_args=list()):
     debug_ideas.add_argument('-s', '--set', help="Set ideas to the given value", type=int, dest='amount')
     debug_ideas.set_defaults(func=exec_debug_ideas)
 
+    debug_stats = debug_subs.add_parser('stats', help="Show runtime metrics collected by this process")
+    debug_stats_prom_help = "Also write the metrics to the given file in Prometheus text format"
+    debug_stats.add_argument('-p', '--prometheus', help=debug_stats_prom_help, metavar='FILE')
+    debug_stats.set_defaults(func=exec_debug_stats)
+
+    board_help = "Show the players with the highest scores on a leaderboard"
+    board_parser = subparsers.add_parser('leaderboard', help=board_help)
+    board_name_help = "The board to show: " + ', '.join("'{:s}' ({:s})".format(n, d.lower()) for n, d in leaderboard.Boards)
+    board_parser.add_argument(
+        'board', help=board_name_help, nargs='?', default='money', choices=leaderboard.BoardNames
+    )
+    board_parser.add_argument('-n', '--top', help="The number of players to show", type=_positive_int, default=10)
+    board_parser.set_defaults(func=exec_leaderboard)
+
+    debug_replay_help = "Replay a recorded trace as fast as possible and report how long each kind of command took"
+    debug_replay = debug_subs.add_parser('replay', help=debug_replay_help)
+    debug_replay.add_argument('file', help="The trace file to replay")
+    debug_replay_save_help = "State file that every player in the trace starts from instead of a new game"
+    debug_replay.add_argument('-f', '--from-save', help=debug_replay_save_help, metavar='FILE')
+    debug_replay_json_help = "Also write the report to the given file as JSON"
+    debug_replay.add_argument('-j', '--json', help=debug_replay_json_help, metavar='FILE')
+    debug_replay.set_defaults(func=exec_debug_replay)
+
+    debug_load_help = "Run virtual players against engines in this process, ramping up how many there are, and"
+    debug_load_help += " report throughput and latency at each step"
+    debug_load = debug_subs.add_parser('load', help=debug_load_help)
+    debug_load_players_help = "The number of players at the last step; the ramp doubles the number of players up to"
+    debug_load_players_help += " this"
+    debug_load.add_argument('-n', '--players', help=debug_load_players_help, type=int, default=16)
+    debug_load_step_help = "How long to run each step for"
+    debug_load.add_argument('--step-seconds', help=debug_load_step_help, type=float, default=5.0, metavar='SECONDS')
+    debug_load_rate_help = "Commands per second issued by each player; 0 issues them as fast as possible"
+    debug_load.add_argument('-r', '--rate', help=debug_load_rate_help, type=float, default=10.0)
+    debug_load_mix_help = "Relative weight of each command as name=weight pairs separated by commas. Defaults to "
+    debug_load_mix_help += ','.join('{:s}={:d}'.format(k, v) for k, v in loadgen.DefaultMix.items())
+    debug_load.add_argument('-m', '--mix', help=debug_load_mix_help)
+    debug_load.add_argument('--seed', help="Seed for choosing commands so that runs can be repeated", type=int)
+    debug_load_json_help = "Also write the report to the given file as JSON"
+    debug_load.add_argument('-j', '--json', help=debug_load_json_help, metavar='FILE')
+    debug_load.set_defaults(func=exec_debug_load)
+
+    debug_memory_help = "Show roughly how much memory each loaded game is using. When run by the daemon, this covers"
+    debug_memory_help += " every game it has loaded."
+    debug_memory = debug_subs.add_parser('memory', help=debug_memory_help)
+    debug_memory_top_help = "The number of players with the heaviest games to show"
+    debug_memory.add_argument(
+        '-n', '--top', help=debug_memory_top_help, type=_non_negative_int, default=memory.DefaultTopPlayers
+    )
+    debug_memory_json_help = "Also write the report to the given file as JSON"
+    debug_memory.add_argument('-j', '--json', help=debug_memory_json_help, metavar='FILE')
+    debug_memory.set_defaults(func=exec_debug_memory)
+
+    debug_protocol_help = "Run the same commands through the daemon with the CLI's protocol and with the pipelined"
+    debug_protocol_help += " wire protocol and report the throughput of each"
+    debug_protocol = debug_subs.add_parser('protocol', help=debug_protocol_help)
+    debug_protocol_count_help = "The number of commands to run with each protocol"
+    debug_protocol.add_argument('-n', '--count', help=debug_protocol_count_help, type=int, default=1000)
+    debug_protocol_players_help = "The number of players that the commands are spread over"
+    debug_protocol.add_argument('-p', '--players', help=debug_protocol_players_help, type=int, default=4)
+    debug_protocol_json_help = "Also write the report to the given file as JSON"
+    debug_protocol.add_argument('-j', '--json', help=debug_protocol_json_help, metavar='FILE')
+    debug_protocol.set_defaults(func=exec_debug_protocol)
+
+    debug_columnar_help = "Advance many randomly made games one at a time and with a single columnar pass, as the"
+    debug_columnar_help += " daemon does for the games it has loaded, and report the time each took"
+    debug_columnar = debug_subs.add_parser('columnar', help=debug_columnar_help)
+    debug_columnar_players_help = "The number of games to advance"
+    debug_columnar.add_argument('-n', '--players', help=debug_columnar_players_help, type=int, default=2000)
+    debug_columnar_idle_help = "Seconds that each game has been idle for"
+    debug_columnar.add_argument('-i', '--idle', help=debug_columnar_idle_help, type=float, default=3600.0)
+    debug_columnar_seed_help = "Seed for making the games, so that runs can be repeated"
+    debug_columnar.add_argument('--seed', help=debug_columnar_seed_help, type=int)
+    debug_columnar_json_help = "Also write the report to the given file as JSON"
+    debug_columnar.add_argument('-j', '--json', help=debug_columnar_json_help, metavar='FILE')
+    debug_columnar.set_defaults(func=exec_debug_columnar)
+
+    simulate_help = "Run a copy of the game faster than real time and report how fast it went. The game itself is not"
+    simulate_help += " changed."
+    simulate_parser = subparsers.add_parser('simulate', help=simulate_help)
+    simulate_speed_help = "How many times faster than real time to run, such as '1000x', or 'max' to run as fast as"
+    simulate_speed_help += " possible"
+    simulate_parser.add_argument(
+        '--speed', help=simulate_speed_help, type=simulation.parse_speed, default=simulation.DefaultSpeed
+    )
+    simulate_duration_help = "How much simulated time to run for, such as '2w', '1d12h', or '90m'"
+    simulate_parser.add_argument(
+        '--duration', help=simulate_duration_help, type=simulation.parse_duration, default=simulation.parse_duration('1d')
+    )
+    simulate_step_help = "Simulated seconds between updates of the game"
+    simulate_parser.add_argument(
+        '--step', help=simulate_step_help, type=float, default=simulation.DefaultStep, metavar='SECONDS'
+    )
+    simulate_fresh_help = "Run a new game instead of a copy of the current one"
+    simulate_parser.add_argument('--fresh', help=simulate_fresh_help, action='store_true')
+    simulate_json_help = "Also write the report to the given file as JSON"
+    simulate_parser.add_argument('-j', '--json', help=simulate_json_help, metavar='FILE')
+    simulate_parser.set_defaults(func=exec_simulate)
+
     version_help = "Show the current version of cre8orforge and then exit."
     version_parser = subparsers.add_parser('version', help=version_help)
     version_parser.set_defaults(func=exec_version)
 
-    if len(sys.argv) > 1:
-        args = parser.parse_args()
-    else:
-        args = parser.parse_args(default_args)
+    batch_help = "Run several commands, one per line, against the same game and save once at the end"
+    batch_parser = subparsers.add_parser('batch', help=batch_help)
+    batch_file_help = "File to read commands from. Give '-' to read them from stdin. Lines can't give global options"
+    batch_file_help += " or run gui, batch, watch, simulate, or debug replay, load, protocol, or columnar."
+    batch_parser.add_argument('file', help=batch_file_help, nargs='?', default='-')
+    batch_parser.set_defaults(func=exec_batch)
 
-    if args.log_trace:
-        logging.getLogger('cre8').setLevel(logutil.TRACE)
+    return parser
+
+
+def _add_view_args(parser: argparse.ArgumentParser, items: str):
+    """
+    Add the options for filtering and paging the cards shown by status or
+    store.
     
-    eng = engine.Engine(args.state)
-    args.func(eng, args)
+    :param parser: The parser of the command to add the options to.
+    :param items: What the command calls the things it shows, such as 'cards'.
+    """
+    parser.add_argument(
+        '--type', help="Only show {:s} for the given kind of activity".format(items), choices=['job', 'outlet'],
+        dest='target_type'
+    )
+    running_help = "Only show {:s} for activities that are running".format(items)
+    parser.add_argument('--running', help=running_help, action='store_true')
+    automated_help = "Only show {:s} for activities whose automation is on".format(items)
+    parser.add_argument('--automated', help=automated_help, action='store_true')
+    affordable_help = "Only show {:s} for activities you can afford to buy another of".format(items)
+    parser.add_argument('--affordable', help=affordable_help, action='store_true')
+    page_help = "Only show the given page of {:s}, starting from 1".format(items)
+    parser.add_argument('--page', help=page_help, type=_positive_int)
+    page_size_help = "The number of {:s} on each page when --page is given".format(items)
+    parser.add_argument(
+        '--page-size', help=page_size_help, type=_positive_int, default=engine.DefaultPageSize, metavar='N'
+    )
+
+
+def _int_at_least(minimum: int) -> Callable[[str], int]:
+    """
+    Make an argparse type for command-line arguments that must be whole numbers
+    no smaller than a minimum.
+    """
+    def parse(text: str) -> int:
+        try:
+            value = int(text)
+        except ValueError:
+            raise argparse.ArgumentTypeError("{!r} is not a whole number".format(text))
+        if value < minimum:
+            raise argparse.ArgumentTypeError("must be at least {:d}, not {:d}".format(minimum, value))
+        return value
+    return parse
+
+
+_positive_int = _int_at_least(1)
+_non_negative_int = _int_at_least(0)
+
+
+def _view_kwargs(args):
+    """
+    Get the filtering and paging arguments for Engine.iter_status_lines() or
+    Engine.iter_store_lines() from the parsed arguments of a command.
+    """
+    kwargs = {
+        'target_type': getattr(args, 'target_type', None),
+        'running': getattr(args, 'running', False),
+        'automated': getattr(args, 'automated', False),
+        'affordable': getattr(args, 'affordable', False),
+        'page': getattr(args, 'page', None),
+        'page_size': getattr(args, 'page_size', engine.DefaultPageSize),
+    }
+    return kwargs
+
+
+def exec_batch(eng: engine.Engine, args):
+    if args.file == '-':
+        lines = sys.stdin.read().splitlines()
+    else:
+        with open(args.file, 'r') as fp:
+            lines = fp.read().splitlines()
+
+    # parse every command before running any so a typo doesn't leave the batch
+    # half-done
+    parser = _build_parser(_BatchLineParser)
+    commands = []
+    for line in lines:
+        line = line.strip()
+        if line == '' or line.startswith('#'):
+            continue
+        try:
+            cmd_args = parser.parse_args(shlex.split(line))
+        except ValueError as e:
+            raise ValueError("Bad batch line {!r}: {!s}".format(line, e)) from e
+        # interactive and long-running commands would keep the daemon busy
+        # forever when it runs the batch
+        if cmd_args.func.__name__ in _UnreplayableHandlers:
+            raise ValueError("{!r} can't be run from within a batch".format(line))
+        # the batch runs against the game it was started for, so global options
+        # on its lines would be ignored
+        changed = [name for name in _BatchGlobalArgNames if getattr(cmd_args, name) != parser.get_default(name)]
+        if len(changed) > 0:
+            msg = "Global options can't be given within a batch; give them to the batch command instead: {!r}"
+            raise ValueError(msg.format(line))
+        commands.append(cmd_args)
+
+    _log.debug("Running batch of {:d} commands".format(len(commands)))
+    try:
+        with eng.transaction():
+            for cmd_args in commands:
+                _run_command(eng, cmd_args, args.recorder)
+    except engine.RulesViolationError as e:
+        msg = str(e) + "\nBatch stopped; none of its changes were saved."
+        raise engine.RulesViolationError(msg) from e
+
+
+def exec_leaderboard(eng: engine.Engine, args):
+    # make sure the player's own scores are current before showing them
+    if eng.player is not None:
+        eng.save()
+    lb = leaderboard.LeaderboardFile(args.leaderboard).refresh()
+    print(dict(leaderboard.Boards)[args.board] + ':')
+    entries = lb.top(args.board, args.top)
+    if len(entries) == 0:
+        print("(no players yet)")
+    for rank, (player, score) in enumerate(entries, start=1):
+        if args.board in ('money', 'lifetime'):
+            score_text = format.money(score, full=True)
+        else:
+            score_text = "{:d}".format(score)
+        print("{:d}. {:s} - {:s}".format(rank, player, score_text))
+
+
+def exec_simulate(eng: engine.Engine, args):
+    game = None if args.fresh else eng.game
+    report = simulation.run(args.duration, args.speed, args.step, game)
+    print(report)
+    if args.json is not None:
+        with open(args.json, 'w') as fp:
+            json.dump(report.to_dict(), fp, indent=2)
 
 
 def exec_version(eng: engine.Engine, args):
@@ -122,10 +613,74 @@ def exec_version(eng: engine.Engine, args):
 
 # noinspection PyUnusedLocal
 def exec_gui(eng: engine.Engine, args):
+    # tkinter is only imported when it's needed so that other commands start
+    # faster
+    from . import gui
     window = gui.Gui(eng)
     window.run()
 
 
+# noinspection PyUnusedLocal
+def exec_debug_replay(eng: engine.Engine, args):
+    report = trace.replay(trace.read_trace(args.file), _replay_command, args.from_save, eng.durability)
+    print(report)
+    if args.json is not None:
+        with open(args.json, 'w') as fp:
+            json.dump(report.to_dict(), fp, indent=2)
+
+
+def exec_debug_load(eng: engine.Engine, args):
+    mix = None
+    if args.mix is not None:
+        mix = loadgen.parse_mix(args.mix)
+    report = loadgen.run_load(args.players, args.step_seconds, args.rate, mix, eng.durability, args.seed)
+    print(report)
+    if args.json is not None:
+        with open(args.json, 'w') as fp:
+            json.dump(report.to_dict(), fp, indent=2)
+
+
+def exec_debug_memory(eng: engine.Engine, args):
+    d = daemon.serving()
+    if d is None:
+        report = memory.report({eng.state_file: eng}, args.top)
+    else:
+        # the daemon doesn't count the engine running this command as loaded
+        engines = d.resident_engines()
+        engines[daemon.engine_key(vars(args), os.getcwd())] = eng
+        report = memory.report(engines, args.top, d.memory_budget)
+    print(report)
+    if args.json is not None:
+        with open(args.json, 'w') as fp:
+            json.dump(report.to_dict(), fp, indent=2)
+
+
+def exec_debug_protocol(eng: engine.Engine, args):
+    if not daemon.Supported:
+        raise engine.RulesViolationError("The daemon can't be used on this platform.")
+    report = client.benchmark(parse_forwarded, args.count, args.players, eng.durability)
+    print(report)
+    if args.json is not None:
+        with open(args.json, 'w') as fp:
+            json.dump(report.to_dict(), fp, indent=2)
+
+
+# noinspection PyUnusedLocal
+def exec_debug_columnar(eng: engine.Engine, args):
+    report = columnar.benchmark(args.players, args.idle, args.seed)
+    print(report)
+    if args.json is not None:
+        with open(args.json, 'w') as fp:
+            json.dump(report.to_dict(), fp, indent=2)
+
+
+# noinspection PyUnusedLocal
+def exec_debug_stats(eng: engine.Engine, args):
+    print(metrics.registry.format_text())
+    if args.prometheus is not None:
+        metrics.registry.write_prometheus(args.prometheus)
+
+
 def exec_debug_seeds(eng: engine.Engine, args):
     if args.amount is not None:
         print(eng.set_state(seeds=args.amount))
@@ -163,10 +718,19 @@ def exec_prestige(eng: engine.Engine, args):
     print(eng.prestige())
 
 
+def exec_history(eng: engine.Engine, args):
+    print(eng.history(args.last))
+
+
 # noinspection PyUnusedLocal
 def exec_status(eng: engine.Engine, args):
-    print(eng.status())
-    eng.save()
+    if args.since is None:
+        _print_lines(eng.iter_status_lines(**_view_kwargs(args)))
+    else:
+        print(eng.status_delta(args.since))
+        # the reported version has to be saved so that the next delta is
+        # relative to it
+        eng.save()
 
 
 def exec_click(eng: engine.Engine, args):
@@ -175,11 +739,28 @@ def exec_click(eng: engine.Engine, args):
 
 # noinspection PyUnusedLocal
 def exec_store(eng: engine.Engine, args):
-    print(eng.show_store())
+    _print_lines(eng.iter_store_lines(**_view_kwargs(args)))
+
+
+def _print_lines(lines):
+    """
+    Write lines to stdout as they are produced, followed by a blank line the same
+    as print() would give if they were joined first.
+    """
+    out = sys.stdout
+    for line in lines:
+        out.write(line)
+    out.write('\n')
+
+
+def exec_watch(eng: engine.Engine, args):
+    report = watch.run(eng, args.fps, args.frames, view=_view_kwargs(args))
+    _log.debug(str(report))
 
 
 def exec_buy(eng: engine.Engine, args):
-    print(eng.buy(args.category, args.type, args.activity))
+    amount = None if args.max else args.count
+    print(eng.buy(args.category, args.type, args.activity, amount))
     
     
 def exec_auto(eng: engine.Engine, args):
@@ -228,8 +228,22 @@ def format_timer(remaining_duration: timedelta):
         text = '{:d}s'.format(secs)
         
     return text
-    
-    
+
+
+def byte_size(amt: int) -> str:
+    """
+    Format a number of bytes with the largest binary unit that keeps it at 1 or
+    more, such as '12.3KiB'.
+    """
+    size = float(amt)
+    for unit in ('B', 'KiB', 'MiB', 'GiB'):
+        if abs(size) < 1024 or unit == 'GiB':
+            if unit == 'B':
+                return '{:d}B'.format(amt)
+            return '{:.1f}{:s}'.format(size, unit)
+        size /= 1024
+
+
 def pad_left(width: int, text: str, pad_char: str = ' ') -> str:
     """
     Add spacing before text to reach the desired length.
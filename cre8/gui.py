@@ -2,19 +2,23 @@ import logging
 import traceback
 
 from .activities import Jobs, Outlets
-from .engine import Engine, RulesViolationError
+from .engine import Engine, RulesViolationError, CatchUpProgress, DefaultCatchUpCompletions
 from . import tutorial
 from . import layout
+from . import profiling
+from . import notify
+from . import format
 from .version import VERSION
 import tkinter as tk
 from tkinter import ttk
 from tkinter import messagebox
 import math
+from datetime import timedelta
 
 from .components import modal
 from .components import flow
 
-from typing import Tuple, Optional, Union, Callable, Any
+from typing import Tuple, Optional, Union, Callable, Any, Iterable, Iterator
 
 Numeric = Union[int, float, str]
 
@@ -423,7 +427,14 @@ class ActivityValueComponent(tk.Frame):
 
 
 class Gui:
-    def __init__(self, g: Engine, output_lines: int = 7):
+    def __init__(
+        self,
+        g: Engine,
+        output_lines: int = 7,
+        profile_ticks: int = 100,
+        notify_min_seconds: float = 60,
+        catch_up_completions: int = DefaultCatchUpCompletions
+    ):
         self.debug_money: Counter
         self.debug_juice: DoubleCounter
         self.debug_seeds: DoubleCounter
@@ -437,6 +448,25 @@ class Gui:
         
         self.update_main_content = True
         self.g = g
+        
+        # completions of activities that take at least this many seconds are
+        # announced in the output
+        self.notify_min_seconds = notify_min_seconds
+        if self.g.notifier is None:
+            self.g.notifier = notify.CompletionNotifier(self._on_completion, clock=self.g.clock)
+            self.g.notifier.watch(self.g.notify_name, self.g.game)
+        
+        # number of _update ticks that a profile started from the menu covers
+        self.profile_ticks = profile_ticks
+        self._tick_profiler: Optional[profiling.Profiler] = None
+        self._profile_ticks_left = 0
+        
+        # number of executions completed between redraws while catching up a
+        # game that was loaded with its catch-up deferred
+        self.catch_up_completions = catch_up_completions
+        self._catch_up_engine: Optional[Engine] = None
+        self._catch_up_slices: Optional[Iterator[CatchUpProgress]] = None
+        
         self.root = tk.Tk()
         self.root.title("Cre8or Forge v" + VERSION)
         self.root.report_callback_exception = self.on_error
@@ -456,6 +486,10 @@ class Gui:
         
         mb = self._build_menubar(self.root)
         self.root.config(menu=mb)
+        
+        # covers the entry frames while the game is being caught up, so that it
+        # can't be played until it is
+        self.catch_up_frame, self.catch_up_label, self.catch_up_bar = self._build_catch_up_frame(self.root)
 
         # do a single update to get window size then set it as the minimum
         # so user cant resize smaller than the elements
@@ -481,7 +515,16 @@ class Gui:
             
         old_filename = self.g.state_file
             
-        self.g = Engine(state_file=None)
+        self.g = Engine(
+            state_file=None,
+            durability=self.g.durability,
+            flush_interval_ms=self.g.flush_interval_ms,
+            save_layout=self.g.save_layout,
+            player=self.g.player,
+            leaderboard_file=self.g.leaderboard_file,
+            notifier=self.g.notifier,
+            clock=self.g.clock
+        )
         self.g.state_file = old_filename
         self.g.save()
         
@@ -489,6 +532,7 @@ class Gui:
         
     def save_game(self):
         self.g.save()
+        self.g.flush()
         
         self.write_output("Manually saved the game.\n\n(Note: This game should autosave on its own)")
         
@@ -505,8 +549,12 @@ class Gui:
         modal.message("About", msg)
         
     def run(self):
-        self.root.after(0, self._update)
+        if self.g.catching_up:
+            self._start_catch_up()
+        else:
+            self.root.after(0, self._update)
         self.root.mainloop()
+        self.g.flush()
         
     def write_output(self, text: str):
         self.output.config(state=tk.NORMAL)
@@ -515,10 +563,14 @@ class Gui:
         self.output.config(state=tk.DISABLED)
         
     def write_main_content(self, text: str):
+        self.write_main_content_lines((text,))
+        
+    def write_main_content_lines(self, lines: Iterable[str]):
         scroll_top, _ = self.main_content.yview()
         self.main_content.config(state=tk.NORMAL)
         self.main_content.delete("0.0", tk.END)
-        self.main_content.insert("0.0", text)
+        for line in lines:
+            self.main_content.insert(tk.END, line)
         self.main_content.config(state=tk.DISABLED)
         self.main_content.yview_moveto(scroll_top)
         
@@ -583,7 +635,88 @@ class Gui:
         tut.transient(self.root)
         tut.wait_window(tut)
     
+    def profile_ticks_for(self, mode: str):
+        """
+        Profile the next several GUI update ticks. Once done, the report location
+        is written to the output.
+        
+        :param mode: Either 'cpu' or 'mem'.
+        """
+        if self._tick_profiler is not None:
+            self.write_output("A profile is already running; wait for it to finish first.")
+            return
+        
+        self._tick_profiler = profiling.Profiler(mode, 'gui')
+        self._profile_ticks_left = self.profile_ticks
+        msg = "Profiling {:s} usage for the next {:d} ticks..."
+        self.write_output(msg.format(mode, self.profile_ticks))
+    
     def _update(self):
+        if self._tick_profiler is None:
+            self._update_tick()
+        else:
+            with self._tick_profiler:
+                self._update_tick()
+            self._profile_ticks_left -= 1
+            if self._profile_ticks_left <= 0:
+                path = self._tick_profiler.finish()
+                self._tick_profiler = None
+                self.write_output("Wrote profile to:\n" + path)
+        
+        self.g.flush_due()
+        self.g.notifier.poll()
+        self.root.after(100, self._update)
+    
+    def _start_catch_up(self):
+        """
+        Show the catch-up panel and start advancing the game a slice at a time,
+        redrawing between slices so the window stays responsive.
+        """
+        self._catch_up_engine = self.g
+        self._catch_up_slices = self.g.catch_up(max_completions=self.catch_up_completions)
+        self.catch_up_frame.grid()
+        self.catch_up_frame.lift()
+        self.write_main_content("Catching up...")
+        self.root.after(0, self._catch_up_tick)
+    
+    def _catch_up_tick(self):
+        # the game may have been replaced or caught up all at once by something
+        # like a save from the menu
+        if self.g is not self._catch_up_engine or not self.g.catching_up:
+            self._end_catch_up()
+            return
+        
+        progress = next(self._catch_up_slices)
+        adv = progress.advancement
+        text = "Catching up... {:.0f}%\n\n".format(progress.fraction * 100)
+        text += "Away for {:s}\n".format(format.format_timer(timedelta(seconds=adv.idle_seconds)))
+        text += "Completed: {:d}\n".format(progress.completions)
+        text += "Money: {:s}\n".format(format.money(adv.money))
+        text += "Juice: {:.4f}J\n".format(adv.juice)
+        text += "Seeds: {:.4f}S".format(adv.seeds)
+        self.catch_up_label.config(text=text)
+        self.catch_up_bar['value'] = progress.fraction * 100
+        self.write_main_content(text)
+        
+        if not progress.done:
+            self.root.after(1, self._catch_up_tick)
+            return
+        self._end_catch_up()
+        msg = "While you were away for {:s}, you made {:s}, {:.4f}J, and {:.4f}S."
+        away = format.format_timer(timedelta(seconds=adv.idle_seconds))
+        self.write_output(msg.format(away, format.money(adv.money), adv.juice, adv.seeds))
+    
+    def _end_catch_up(self):
+        self._catch_up_engine = None
+        self._catch_up_slices = None
+        self.catch_up_frame.grid_remove()
+        self.root.after(0, self._update)
+    
+    def _on_completion(self, completion: notify.Completion):
+        if completion.activity.duration.total_seconds() >= self.notify_min_seconds:
+            self.write_output("{:s} finished!".format(completion.activity.name))
+    
+    def _update_tick(self):
         if self.in_debug_mode:
             self.write_main_content("In debug mode. Switch back to the game to resume display")
             self.update_main_content = True
@@ -597,16 +730,14 @@ class Gui:
             self.debug_ideas.set(self.g.get_state('ideas'))
         
             if self.in_play_mode:
-                self.write_main_content(self.g.status())
+                self.write_main_content_lines(self.g.iter_status_lines())
                 self.update_main_content = True  # this must be here in case a swap to store mode occurs
             elif self.in_store_mode:
                 if self.update_main_content:
-                    self.write_main_content(self.g.show_store())
+                    self.write_main_content_lines(self.g.iter_store_lines())
                     self.update_main_content = False
             else:
                 raise ValueError("Should never happen")
-        
-        self.root.after(100, self._update)
 
     # noinspection PyMethodMayBeStatic
     def _build_main_content_frame(self, master) -> Tuple[tk.Widget, tk.Text]:
@@ -855,6 +986,21 @@ class Gui:
         return debug_entry_frame
 
     # noinspection PyMethodMayBeStatic
+    def _build_catch_up_frame(self, master) -> Tuple[tk.Widget, tk.Label, ttk.Progressbar]:
+        """
+        Return the catch-up panel, placed over the entry frames but hidden until
+        it is shown with grid(). Additionally, return the Label that shows the
+        totals so far and the Progressbar.
+        """
+        frm = tk.Frame(master=master, relief=tk.RIDGE, borderwidth=3)
+        frm.grid(row=0, column=1, sticky="nsew")
+        lbl = tk.Label(master=frm, justify=tk.LEFT, anchor=tk.NW, text="Catching up...")
+        lbl.pack(side=tk.TOP, fill=tk.BOTH, expand=True, padx=5, pady=5)
+        bar = ttk.Progressbar(master=frm, orient=tk.HORIZONTAL, mode='determinate', maximum=100)
+        bar.pack(side=tk.BOTTOM, fill=tk.X, padx=5, pady=5)
+        frm.grid_remove()
+        return frm, lbl, bar
+        
     def _build_output_frame(self, master, output_lines) -> Tuple[tk.Widget, tk.Text]:
         """
         Return the fully-configured output frame with geometry manager
@@ -878,6 +1024,11 @@ class Gui:
         file.add_separator()
         file.add_command(label="Quit", command=self.root.destroy)
         
+        debug = tk.Menu(menubar, tearoff=0)
+        menubar.add_cascade(label="Debug", menu=debug)
+        debug.add_command(label="Profile CPU...", command=lambda: self.profile_ticks_for('cpu'))
+        debug.add_command(label="Profile Memory...", command=lambda: self.profile_ticks_for('mem'))
+        
         help = tk.Menu(menubar, tearoff=0)
         menubar.add_cascade(label="Help", menu=help)
         help.add_command(label="Tutorial", command=self.tutorial)
@@ -1,11 +1,22 @@
 import math
+import time
+from typing import Dict, Tuple, Callable, Hashable, Iterator, Iterable, Optional
 from .format import format_timer, pad_middle, pad_right, pad_left
-from . import format
+from . import format, metrics
 from .activities import Activity, OwnedActivities
 
 DefaultTextCardWidth = 65
 _RightColumnWidth = 14
 
+# width of the game-time buckets that cards with a running execution and whole
+# pages are cached in, in seconds
+DefaultTimeBucket = 0.1
+
+_render_seconds = metrics.registry.histogram('cre8_layout_render_seconds', "Time taken to render each card")
+_cache_lookups = metrics.registry.counter(
+    'cre8_layout_cache_lookups_total', "Lookups in the render cache by what was looked up and whether it was a hit"
+)
+
 
 def progress_bar(
     width: int,
@@ -41,6 +52,21 @@ def make_act_store_listing(act: Activity, count: int, auto_count: int, width=Def
     Create a card for the store that shows the price, consumption, and production
     of the next purchased instance of the Activity.
     
+    :param act: The Activity to make the store card for.
+    :param count: The current number of owned instances of that activity.
+    :param auto_count: Amount of automations that are currently purchased.
+    :param width: The width of the card to produce.
+    """
+    return '\n'.join(iter_act_store_listing_lines(act, count, auto_count, width))
+
+
+def iter_act_store_listing_lines(
+    act: Activity, count: int, auto_count: int, width=DefaultTextCardWidth
+) -> Iterator[str]:
+    """
+    Create the lines of a card for the store, as make_act_store_listing() does.
+    The lines do not end with a newline.
+    
     :param act: The Activity to make the store card for.
     :param count: The current number of owned instances of that activity.
     :param auto_count: Amount of automations that are currently purchased.
@@ -51,6 +77,7 @@ def make_act_store_listing(act: Activity, count: int, auto_count: int, width=Def
     # | 999h60m55s                   + $100/C (0.003J) | x4          |
     # +--------------------------------------------------------------+
     global _RightColumnWidth
+    start = time.perf_counter()
     
     # actual avail is width minus 2 for the borders and minus 2 for padding
     lc_text_space = width - _RightColumnWidth - 2 - 2
@@ -87,17 +114,28 @@ def make_act_store_listing(act: Activity, count: int, auto_count: int, width=Def
     rc_bot_text = pad_right(rc_text_space, "{:d}(i)".format(act.auto_price(auto_count)))
     
     # now put 'em all together!!!!!!!!
-    full_text = ''
-    full_text += '| ' + lc_top_text + ' | ' + rc_top_text + ' |\n'
-    full_text += '| ' + lc_bot_text + ' | ' + rc_bot_text + ' |'    
+    yield '| ' + lc_top_text + ' | ' + rc_top_text + ' |'
+    yield '| ' + lc_bot_text + ' | ' + rc_bot_text + ' |'
     
-    return full_text
+    _render_seconds.observe(time.perf_counter() - start, card='store')
 
 
 def make_act_card(oa: OwnedActivities, t: float, width=DefaultTextCardWidth) -> str:
     """
     Create a card that shows the status of an OwnedActivities.
     
+    :param oa: The OwnedActivities to make the card for.
+    :param t: The current game time represented in seconds since start.
+    :param width: The width of the card to produce.
+    """
+    return '\n'.join(iter_act_card_lines(oa, t, width))
+
+
+def iter_act_card_lines(oa: OwnedActivities, t: float, width=DefaultTextCardWidth) -> Iterator[str]:
+    """
+    Create the lines of a card that shows the status of an OwnedActivities, as
+    make_act_card() does. The lines do not end with a newline.
+    
     :param oa: The OwnedActivities to make the card for.
     :param t: The current game time represented in seconds since start.
     :param width: The width of the card to produce.
@@ -108,6 +146,7 @@ def make_act_card(oa: OwnedActivities, t: float, width=DefaultTextCardWidth) ->
     # | |                                 | 999h60m55s |      RUNNING |
     # +------------------------------------------------+--------------+
     global _RightColumnWidth
+    start = time.perf_counter()
     
     # LEFT COLUMN
     
@@ -158,10 +197,167 @@ def make_act_card(oa: OwnedActivities, t: float, width=DefaultTextCardWidth) ->
             rc_bot_text = pad_left(rc_text_space, "(off)")
 
     # now put 'em all together!!!!!!!!
-    full_text = ''
-    full_text += '| ' + lc_top_text + ' | ' + rc_top_text + ' |\n'
-    full_text += '| ' + lc_mid_text + ' | ' + rc_mid_text + ' |\n'
-    full_text += '| ' + lc_bot_text + ' | ' + rc_bot_text + ' |'
-    return full_text
+    yield '| ' + lc_top_text + ' | ' + rc_top_text + ' |'
+    yield '| ' + lc_mid_text + ' | ' + rc_mid_text + ' |'
+    yield '| ' + lc_bot_text + ' | ' + rc_bot_text + ' |'
+    _render_seconds.observe(time.perf_counter() - start, card='status')
+
+
+class RenderCache:
+    """
+    Caches rendered activity cards, store listings, and whole pages so that
+    showing the same state more than once does not render it again.
+    
+    Cards and listings are cached by everything that goes into them, so a card
+    for an activity that has no running execution is reused for as long as the
+    activity is unchanged. Cards with a running execution show time-dependent
+    progress and are only reused within the same time bucket. Whole pages are
+    cached by the state version they were rendered at and the time bucket. Only
+    the most recent entry for each activity and page is kept.
+    """
+    
+    def __init__(self, time_bucket: float = DefaultTimeBucket):
+        """
+        :param time_bucket: Width of the time buckets, in seconds of game time.
+        Within a bucket, a card with a running execution is shown as it was when
+        first rendered in that bucket.
+        """
+        if time_bucket <= 0:
+            raise ValueError("time_bucket must be greater than 0")
+        self.time_bucket = time_bucket
+        self.hits = 0
+        self.misses = 0
+        self._entries: Dict[Tuple[str, Hashable], Tuple[Hashable, Tuple[str, ...]]] = {}
+    
+    def bucket(self, t: float) -> int:
+        """
+        Get the time bucket that a game time falls in.
+        """
+        return math.floor(t / self.time_bucket)
+    
+    def act_card(self, oa: OwnedActivities, t: float) -> str:
+        """
+        Get the card for an OwnedActivities, as created by make_act_card().
+        
+        :param oa: The OwnedActivities to get the card for.
+        :param t: The current game time represented in seconds since start.
+        """
+        return '\n'.join(self.act_card_lines(oa, t))
+    
+    def act_card_lines(self, oa: OwnedActivities, t: float) -> Tuple[str, ...]:
+        """
+        Get the lines of the card for an OwnedActivities, as created by
+        iter_act_card_lines().
+        
+        :param oa: The OwnedActivities to get the card for.
+        :param t: The current game time represented in seconds since start.
+        """
+        key = self.card_key(oa, t)
+        return self._get('card', oa.activity.id, key, lambda: tuple(iter_act_card_lines(oa, t)))
+    
+    def card_key(self, oa: OwnedActivities, t: float) -> Tuple:
+        """
+        Get everything that goes into the card for an OwnedActivities. The card
+        is the same whenever the key is.
+        
+        :param oa: The OwnedActivities to get the key for.
+        :param t: The current game time represented in seconds since start.
+        """
+        key = (oa.count, oa.active, oa.automations, oa.automated)
+        if oa.execution is not None:
+            key += (oa.execution.start, oa.execution.end, self.bucket(t))
+        return key
+    
+    def store_listing(self, act: Activity, count: int, auto_count: int) -> str:
+        """
+        Get the store listing for an Activity, as created by
+        make_act_store_listing().
+        
+        :param act: The Activity to get the store listing for.
+        :param count: The current number of owned instances of that activity.
+        :param auto_count: Amount of automations that are currently purchased.
+        """
+        return '\n'.join(self.store_listing_lines(act, count, auto_count))
+    
+    def store_listing_lines(self, act: Activity, count: int, auto_count: int) -> Tuple[str, ...]:
+        """
+        Get the lines of the store listing for an Activity, as created by
+        iter_act_store_listing_lines().
+        
+        :param act: The Activity to get the store listing for.
+        :param count: The current number of owned instances of that activity.
+        :param auto_count: Amount of automations that are currently purchased.
+        """
+        key = (count, auto_count)
+        return self._get('listing', act.id, key, lambda: tuple(iter_act_store_listing_lines(act, count, auto_count)))
+    
+    def page(
+        self, name: Hashable, version: int, t: Optional[float], render: Callable[[], Iterable[str]]
+    ) -> str:
+        """
+        Get a whole page of output, rendering it only if it has not already been
+        rendered at the same state version and time bucket.
+        
+        :param name: The name of the page, such as 'status' or 'store'. Pages
+        that show different views of the same state need different names.
+        :param version: The state version of the game state shown on the page.
+        :param t: The current game time represented in seconds since start, or
+        None if nothing on the page changes as time passes.
+        :param render: Called with no arguments to render the lines of the page
+        on a miss.
+        """
+        return ''.join(self.page_lines(name, version, t, render))
+    
+    def page_lines(
+        self, name: Hashable, version: int, t: Optional[float], render: Callable[[], Iterable[str]]
+    ) -> Iterator[str]:
+        """
+        Get the lines of a whole page of output as page() does, but yield each
+        line as soon as it is rendered. A page is only cached once all of its
+        lines have been taken.
+        
+        :param name: The name of the page, such as 'status' or 'store'. Pages
+        that show different views of the same state need different names.
+        :param version: The state version of the game state shown on the page.
+        :param t: The current game time represented in seconds since start, or
+        None if nothing on the page changes as time passes.
+        :param render: Called with no arguments to render the lines of the page
+        on a miss.
+        """
+        key = (version, self.bucket(t) if t is not None else None)
+        entry = self._entries.get(('page', name), None)
+        if entry is not None and entry[0] == key:
+            self.hits += 1
+            _cache_lookups.inc(kind='page', result='hit')
+            yield from entry[1]
+            return
+        
+        self.misses += 1
+        _cache_lookups.inc(kind='page', result='miss')
+        lines = []
+        for line in render():
+            lines.append(line)
+            yield line
+        self._entries[('page', name)] = (key, tuple(lines))
+    
+    def clear(self):
+        """
+        Drop everything that is cached. This must be done if the state version
+        could go backwards, such as when game state is rolled back.
+        """
+        self._entries.clear()
+    
+    def _get(
+        self, kind: str, ident: Hashable, key: Hashable, render: Callable[[], Tuple[str, ...]]
+    ) -> Tuple[str, ...]:
+        entry = self._entries.get((kind, ident), None)
+        if entry is not None and entry[0] == key:
+            self.hits += 1
+            _cache_lookups.inc(kind=kind, result='hit')
+            return entry[1]
         
-    
\ No newline at end of file
+        self.misses += 1
+        _cache_lookups.inc(kind=kind, result='miss')
+        lines = render()
+        self._entries[(kind, ident)] = (key, lines)
+        return lines
@@ -0,0 +1,298 @@
+"""
+Leaderboards that rank players against each other. Each board is kept as an
+index that is sorted by score and updated in place as players save, so finding
+the top players never requires reading every player's state file. The indexes
+are persisted to a single file that all players share.
+"""
+
+import os
+import bisect
+import pickle
+from typing import Dict, List, Tuple, Optional, Union
+
+from .state import GameState
+from . import state, metrics
+
+CurrentVersion = 1
+
+DefaultLeaderboardFile = 'leaderboard.p'
+
+# the name of each board along with a description of what it ranks
+Boards = (
+    ('money', "Richest this run"),
+    ('lifetime', "Most money over all runs"),
+    ('prestiges', "Most meditations"),
+    ('ideas', "Most ideas"),
+)
+
+BoardNames = tuple(name for name, _ in Boards)
+
+Score = Union[int, float]
+
+_update_seconds = metrics.registry.histogram(
+    'cre8_leaderboard_update_seconds', "Time taken to update a player's scores in the leaderboard"
+)
+
+
+def scores_for(gs: GameState) -> Dict[str, Score]:
+    """
+    Get the score that a GameState has on each board.
+
+    :param gs: The GameState to score.
+    :return: A dict mapping each name in BoardNames to the score on that board.
+    """
+    scores = {
+        'money': gs.money,
+        'lifetime': gs.history.money,
+        'prestiges': gs.history.prestiges,
+        'ideas': gs.ideas,
+    }
+    return scores
+
+
+class SortedIndex:
+    """
+    Players ordered by score, highest first. Ties are ordered by player name.
+    Finding a player's position is an O(log n) search and getting the top k
+    players is O(k). Adding, updating, or removing a player is O(n), since it
+    inserts into or deletes from the middle of a list, although that is a
+    single memmove and stays cheap for leaderboards of a few thousand players.
+    """
+
+    def __init__(self):
+        # scores are negated so that the natural ascending order of the list
+        # puts the highest score first
+        self._entries: List[Tuple[Score, str]] = []
+        self._scores: Dict[str, Score] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, player: str) -> bool:
+        return player in self._scores
+
+    def score(self, player: str) -> Optional[Score]:
+        """
+        Get the score of a player, or None if they are not in the index.
+        """
+        return self._scores.get(player, None)
+
+    def update(self, player: str, score: Score) -> bool:
+        """
+        Set the score of a player, adding them to the index if needed.
+
+        :param player: The name of the player.
+        :param score: The player's new score.
+        :return: Whether the index changed.
+        """
+        old_score = self._scores.get(player, None)
+        if old_score == score:
+            return False
+        if old_score is not None:
+            self._remove_entry(player, old_score)
+        bisect.insort(self._entries, (-score, player))
+        self._scores[player] = score
+        return True
+
+    def remove(self, player: str) -> bool:
+        """
+        Remove a player from the index.
+
+        :param player: The name of the player.
+        :return: Whether the player was in the index.
+        """
+        old_score = self._scores.pop(player, None)
+        if old_score is None:
+            return False
+        self._remove_entry(player, old_score)
+        return True
+
+    def rank(self, player: str) -> Optional[int]:
+        """
+        Get the position of a player, where 1 is the highest score.
+
+        :param player: The name of the player.
+        :return: The rank of the player, or None if they are not in the index.
+        """
+        score = self._scores.get(player, None)
+        if score is None:
+            return None
+        return bisect.bisect_left(self._entries, (-score, player)) + 1
+
+    def top(self, k: int) -> List[Tuple[str, Score]]:
+        """
+        Get the players with the highest scores.
+
+        :param k: The maximum number of players to get.
+        :return: Tuples of player name and score, highest score first.
+        """
+        return [(player, -neg_score) for neg_score, player in self._entries[:k]]
+
+    def to_list(self) -> List[Tuple[str, Score]]:
+        return self.top(len(self._entries))
+
+    @staticmethod
+    def from_list(entries: List[Tuple[str, Score]]) -> 'SortedIndex':
+        """
+        Create a SortedIndex from the output of to_list(). The entries must
+        already be in order.
+        """
+        idx = SortedIndex()
+        idx._entries = [(-score, player) for player, score in entries]
+        idx._scores = {player: score for player, score in entries}
+        return idx
+
+    def _remove_entry(self, player: str, score: Score):
+        pos = bisect.bisect_left(self._entries, (-score, player))
+        del self._entries[pos]
+
+
+class Leaderboard:
+    """
+    Holds a SortedIndex for each of the boards in Boards.
+    """
+
+    def __init__(self):
+        self.indexes: Dict[str, SortedIndex] = {name: SortedIndex() for name in BoardNames}
+
+    def update(self, player: str, gs: GameState) -> bool:
+        """
+        Update every board with the current scores of a player.
+
+        :param player: The name of the player.
+        :param gs: The player's current GameState.
+        :return: Whether any board changed.
+        """
+        with _update_seconds.time():
+            changed = False
+            for name, score in scores_for(gs).items():
+                if self.indexes[name].update(player, score):
+                    changed = True
+        return changed
+
+    def remove(self, player: str) -> bool:
+        """
+        Remove a player from every board.
+
+        :param player: The name of the player.
+        :return: Whether the player was on any board.
+        """
+        removed = False
+        for idx in self.indexes.values():
+            if idx.remove(player):
+                removed = True
+        return removed
+
+    def top(self, board: str, k: int) -> List[Tuple[str, Score]]:
+        """
+        Get the players with the highest scores on a board.
+
+        :param board: The name of the board; one of BoardNames.
+        :param k: The maximum number of players to get.
+        :return: Tuples of player name and score, highest score first.
+        """
+        if board not in self.indexes:
+            raise ValueError("board must be one of {:s}".format(', '.join(repr(b) for b in BoardNames)))
+        if k < 0:
+            raise ValueError("k must not be negative")
+        return self.indexes[board].top(k)
+
+    def to_dict(self):
+        d = {name: idx.to_list() for name, idx in self.indexes.items()}
+        return d
+
+    @staticmethod
+    def from_dict(d) -> 'Leaderboard':
+        lb = Leaderboard()
+        for name in BoardNames:
+            if name in d:
+                lb.indexes[name] = SortedIndex.from_list(d[name])
+        return lb
+
+
+def save(file_name: str, lb: Leaderboard, durability: str = 'atomic'):
+    """
+    Write a Leaderboard so it can be read later with a call to load().
+
+    :param file_name: The file to write to.
+    :param lb: The Leaderboard to write.
+    :param durability: How hard to try to keep the file intact; see
+    state.save().
+    """
+    formatted_data = {
+        'meta': {
+            'version': CurrentVersion
+        },
+        'boards': lb.to_dict()
+    }
+    state._write_file(file_name, pickle.dumps(formatted_data), durability)
+
+
+def load(file_name: str) -> Leaderboard:
+    """
+    Read a Leaderboard written by save().
+
+    :param file_name: The file to read from.
+    :return: The Leaderboard. If the file does not exist, an empty one is
+    returned.
+    """
+    try:
+        with open(file_name, 'rb') as fp:
+            data = pickle.load(fp)
+    except FileNotFoundError:
+        return Leaderboard()
+    except (pickle.PickleError, EOFError) as e:
+        raise state.SerializedStateError("Could not read leaderboard file: {!s}".format(str(e)))
+
+    version = data['meta']['version']
+    if version != CurrentVersion:
+        msg = "Leaderboard file is version {:d} but this build of cre8orforge only reads version {:d}"
+        raise state.SerializedStateError(msg.format(version, CurrentVersion))
+    return Leaderboard.from_dict(data['boards'])
+
+
+class LeaderboardFile:
+    """
+    Keeps a Leaderboard loaded from a file between updates, reading the file
+    again only if something else has written to it since it was last read.
+    Updates from several processes at once are not merged; whichever writes last
+    wins, and the other players' scores are corrected the next time they save.
+    """
+
+    def __init__(self, file_name: str):
+        self.file_name = file_name
+        self.leaderboard = Leaderboard()
+        self._stamp: Optional[Tuple[int, int]] = None
+
+    def update(self, player: str, gs: GameState, durability: str = 'atomic'):
+        """
+        Update the scores of a player and write the file if any changed.
+
+        :param player: The name of the player.
+        :param gs: The player's current GameState.
+        :param durability: How hard to try to keep the file intact; see
+        state.save().
+        """
+        self.refresh()
+        if self.leaderboard.update(player, gs):
+            save(self.file_name, self.leaderboard, durability)
+            self._stamp = self._file_stamp()
+
+    def refresh(self) -> Leaderboard:
+        """
+        Read the file again if it has changed since it was last read.
+
+        :return: The current Leaderboard.
+        """
+        stamp = self._file_stamp()
+        if stamp != self._stamp:
+            self.leaderboard = load(self.file_name)
+            self._stamp = stamp
+        return self.leaderboard
+
+    def _file_stamp(self) -> Optional[Tuple[int, int]]:
+        try:
+            st = os.stat(self.file_name)
+        except FileNotFoundError:
+            return None
+        return st.st_mtime_ns, st.st_size
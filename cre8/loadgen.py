@@ -0,0 +1,298 @@
+"""
+Synthetic load generation. Virtual players, each with their own Engine and
+state file, issue a random mix of commands at a set rate while the number of
+players is ramped up, so that the point where a single host stops keeping up
+can be found.
+"""
+
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+import logging
+from typing import Dict, Any, List, Optional, Sequence
+
+from .engine import Engine, RulesViolationError
+from . import activities, metrics
+
+_log = logging.getLogger(__name__)
+
+# relative weight of each kind of command in the default mix
+DefaultMix = {
+    'status': 40,
+    'click': 25,
+    'buy': 15,
+    'store': 10,
+    'automate': 10,
+}
+
+# the percentiles of command latency given in load reports
+ReportPercentiles = (0.50, 0.95, 0.99)
+
+# money and ideas that each virtual player starts with so that buying and
+# automating are not rejected right away
+DefaultStartMoney = 10 ** 6
+DefaultStartIdeas = 100
+
+
+def parse_mix(text: str) -> Dict[str, int]:
+    """
+    Parse a command mix given as comma-separated name=weight pairs, such as
+    "status=40,click=25".
+
+    :param text: The text to parse.
+    :return: The weight of each command.
+    """
+    mix = {}
+    for part in text.split(','):
+        name, sep, weight = part.partition('=')
+        name = name.strip()
+        if sep == '' or name not in DefaultMix:
+            msg = "mix must be name=weight pairs where each name is one of {:s}"
+            raise ValueError(msg.format(', '.join(repr(n) for n in DefaultMix)))
+        mix[name] = int(weight)
+    if sum(mix.values()) <= 0:
+        raise ValueError("mix must have at least one command with a weight above 0")
+    return mix
+
+
+def ramp(max_players: int) -> List[int]:
+    """
+    Get the number of players at each step of a ramp that doubles up to
+    max_players.
+    """
+    if max_players < 1:
+        raise ValueError("max_players must be at least 1")
+    steps = []
+    players = 1
+    while players < max_players:
+        steps.append(players)
+        players *= 2
+    steps.append(max_players)
+    return steps
+
+
+class VirtualPlayer:
+    """
+    Issues randomly chosen commands against its own Engine.
+    """
+
+    def __init__(self, eng: Engine, mix: Dict[str, int], rng: random.Random):
+        self.eng = eng
+        self.rng = rng
+        self._commands = list(mix.keys())
+        self._weights = list(mix.values())
+
+    def next_command(self) -> str:
+        return self.rng.choices(self._commands, self._weights)[0]
+
+    def run_command(self, command: str):
+        """
+        Run a single command the way the CLI would. Raises RulesViolationError if
+        the game doesn't allow it.
+
+        :param command: One of the names in DefaultMix.
+        """
+        eng = self.eng
+        eng.update()
+        if command == 'status':
+            eng.status()
+        elif command == 'store':
+            eng.show_store()
+        elif command == 'click':
+            idx = activities.store_index(self.rng.choice(eng.game.jobs).activity)
+            eng.click('job', idx)
+        elif command == 'buy':
+            target_type, target_idx = self._random_target()
+            eng.buy('instance', target_type, target_idx, 1)
+        elif command == 'automate':
+            target_type, target_idx = self._random_target()
+            catalog = activities.Jobs if target_type == 'job' else activities.Outlets
+            target = eng.game.owned(catalog[target_idx])
+            if target is None or target.automations < 1:
+                eng.buy('automation', target_type, target_idx)
+            elif target.automated:
+                eng.deactivate('automation', target_type, target_idx)
+            else:
+                eng.activate('automation', target_type, target_idx)
+        else:
+            raise ValueError("Unknown command {!r}".format(command))
+
+    def _random_target(self):
+        # cheaper activities are the ones players mostly deal with
+        if self.rng.random() < 0.7:
+            return 'job', min(int(self.rng.expovariate(1.0)), len(activities.Jobs) - 1)
+        return 'outlet', min(int(self.rng.expovariate(1.0)), len(activities.Outlets) - 1)
+
+
+class LoadStep:
+    """
+    The results of running a fixed number of players for a while.
+    """
+
+    def __init__(self, players: int):
+        self.players = players
+        self.seconds = 0.0
+        self.latencies: List[float] = []
+        self.rejected = 0
+        self.errors = 0
+        self.saves = 0
+
+    def to_dict(self) -> Dict[str, Any]:
+        pcts = metrics.percentiles(self.latencies, ReportPercentiles)
+        ops = len(self.latencies)
+        d = {
+            'players': self.players,
+            'seconds': self.seconds,
+            'ops': ops,
+            'throughput': ops / self.seconds if self.seconds > 0 else 0.0,
+            'rejected': self.rejected,
+            'errors': self.errors,
+            'saves': self.saves,
+            'saves_per_second': self.saves / self.seconds if self.seconds > 0 else 0.0,
+        }
+        for q, value in zip(ReportPercentiles, pcts):
+            d['p{:d}'.format(round(q * 100))] = value
+        return d
+
+
+class LoadReport:
+    """
+    The results of each step of a load test.
+    """
+
+    def __init__(self, config: Dict[str, Any]):
+        self.config = config
+        self.steps: List[LoadStep] = []
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        Get the report in a form that can be written as JSON for comparing
+        builds.
+        """
+        d = {
+            'config': dict(self.config),
+            'steps': [step.to_dict() for step in self.steps]
+        }
+        return d
+
+    def __str__(self):
+        header = "{:>7s} {:>8s} {:>10s} {:>9s} {:>9s} {:>9s} {:>8s} {:>8s} {:>7s}"
+        row = "{:>7d} {:>8d} {:>10.1f} {:>9.3f} {:>9.3f} {:>9.3f} {:>8.1f} {:>8d} {:>7d}"
+        msg = header.format('players', 'ops', 'ops/s', 'p50 ms', 'p95 ms', 'p99 ms', 'saves/s', 'rejected', 'errors')
+        for step in self.steps:
+            d = step.to_dict()
+            msg += '\n' + row.format(
+                d['players'], d['ops'], d['throughput'], d['p50'] * 1000, d['p95'] * 1000, d['p99'] * 1000,
+                d['saves_per_second'], d['rejected'], d['errors']
+            )
+        return msg
+
+
+def run_load(
+    max_players: int,
+    step_seconds: float = 5.0,
+    rate: float = 10.0,
+    mix: Optional[Dict[str, int]] = None,
+    durability: str = 'atomic',
+    seed: Optional[int] = None,
+    steps: Optional[Sequence[int]] = None
+) -> LoadReport:
+    """
+    Run a load test against Engines in this process. Each virtual player runs in
+    its own thread and saves to its own state file in a temporary directory
+    that is removed afterwards.
+
+    :param max_players: The number of players at the last step. The ramp
+    doubles the number of players at each step up to this.
+    :param step_seconds: How long to run each step for.
+    :param rate: The number of commands each player issues per second. Give 0 to
+    have every player issue commands as fast as it can.
+    :param mix: The relative weight of each command; see DefaultMix.
+    :param durability: The durability mode each Engine saves with.
+    :param seed: Seed for choosing commands, so runs can be repeated.
+    :param steps: The number of players at each step, instead of the doubling
+    ramp.
+    :return: The results of each step.
+    """
+    if mix is None:
+        mix = DefaultMix
+    if steps is None:
+        steps = ramp(max_players)
+    config = {
+        'max_players': max(steps),
+        'step_seconds': step_seconds,
+        'rate': rate,
+        'mix': dict(mix),
+        'durability': durability,
+        'seed': seed,
+    }
+    report = LoadReport(config)
+    rng = random.Random(seed)
+
+    tmp_dir = tempfile.mkdtemp(prefix='cre8-load-')
+    try:
+        players = []
+        for idx in range(max(steps)):
+            eng = Engine(os.path.join(tmp_dir, 'player{:d}.p'.format(idx)), durability=durability)
+            eng.game.money = DefaultStartMoney
+            eng.game.ideas = DefaultStartIdeas
+            players.append(VirtualPlayer(eng, mix, random.Random(rng.random())))
+
+        for player_count in steps:
+            _log.debug("Starting load step with {:d} players".format(player_count))
+            report.steps.append(_run_step(players[:player_count], step_seconds, rate))
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    return report
+
+
+def _run_step(players: List[VirtualPlayer], seconds: float, rate: float) -> LoadStep:
+    step = LoadStep(len(players))
+    stop = threading.Event()
+    saves_before = [p.eng.flush_count for p in players]
+    # each thread only touches its own lists, so no locking is needed
+    results: List[Dict[str, Any]] = [{'latencies': [], 'rejected': 0, 'errors': 0} for _ in players]
+
+    def work(player: VirtualPlayer, result: Dict[str, Any]):
+        interval = 1.0 / rate if rate > 0 else 0.0
+        next_time = time.monotonic()
+        while not stop.is_set():
+            command = player.next_command()
+            start = time.perf_counter()
+            try:
+                player.run_command(command)
+            except RulesViolationError:
+                result['rejected'] += 1
+            except Exception:
+                _log.exception("Error in virtual player running {!r}".format(command))
+                result['errors'] += 1
+            result['latencies'].append(time.perf_counter() - start)
+
+            if interval > 0:
+                next_time += interval
+                delay = next_time - time.monotonic()
+                if delay > 0:
+                    stop.wait(delay)
+                else:
+                    # fell behind; don't try to make up for it with a burst
+                    next_time = time.monotonic()
+
+    threads = [threading.Thread(target=work, args=(p, r), daemon=True) for p, r in zip(players, results)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    stop.wait(seconds)
+    stop.set()
+    for t in threads:
+        t.join()
+    step.seconds = time.perf_counter() - start
+
+    for result in results:
+        step.latencies.extend(result['latencies'])
+        step.rejected += result['rejected']
+        step.errors += result['errors']
+    step.saves = sum(p.eng.flush_count - before for p, before in zip(players, saves_before))
+    return step
@@ -1,9 +1,27 @@
 import logging
 import logging.handlers
 import sys
+import time
+import atexit
+import threading
+from typing import List, Optional, TextIO, Tuple
 
 TRACE = logging.DEBUG - 1
 
+LogFileName = 'debug.log'
+
+# records from a single line of code at TRACE level that are written to the log
+# file in each interval before the rest are sampled
+DefaultTraceBurst = 100
+
+# seconds in each interval of trace rate limiting; suppressed records are
+# summarized at the end of each one
+DefaultTraceInterval = 5.0
+
+# once a line of code is over its burst, one in this many of its records is
+# still written
+DefaultTraceSample = 1000
+
 logging.addLevelName(TRACE, 'TRACE')
 
 
@@ -75,24 +93,168 @@ class _ExactLevelFilter(logging.Filter):
             return 0
     
 
+class RepeatLimitFilter(logging.Filter):
+    """
+    Limits how many low-level records from the same line of code get through,
+    so that logging in a hot loop doesn't push everything else out of the log.
+
+    In each interval, the first records from a line of code are let through,
+    after which only a sample of them are. Once an interval is over, the next
+    record at any level first logs a single record for each line that had
+    records suppressed, saying how many. Records are told apart by where they
+    were logged rather than by their message, so their messages are never
+    formatted unless they are let through; for that to save anything, hot
+    loops must log with arguments instead of formatting messages themselves.
+
+    The filter can be shared by handlers that are logged to from several
+    threads.
+    """
+
+    def __init__(
+        self,
+        level: int = TRACE,
+        burst: int = DefaultTraceBurst,
+        interval: float = DefaultTraceInterval,
+        sample: int = DefaultTraceSample,
+        summary_logger: str = __name__
+    ):
+        """
+        :param level: Records at this level and below are limited; all others
+        are always let through.
+        :param burst: The number of records from each line of code let through
+        in each interval before sampling starts.
+        :param interval: Seconds in each interval.
+        :param sample: Once sampling starts, one in this many records is let
+        through. Give 0 to let none through.
+        :param summary_logger: The name of the logger that summaries of the
+        suppressed records are logged to at DEBUG level.
+        """
+        super().__init__()
+        if burst < 0:
+            raise ValueError("burst must be at least 0")
+        if interval <= 0:
+            raise ValueError("interval must be greater than 0")
+        if sample < 0:
+            raise ValueError("sample must be at least 0")
+        self.level = level
+        self.burst = burst
+        self.interval = interval
+        self.sample = sample
+        self.summary_logger = summary_logger
+        self._lock = threading.Lock()
+        self._window_start = time.monotonic()
+        # (seen, suppressed, file name, message template) by the file and line
+        # that records came from
+        self._counts = {}
+        # the thread that is logging summaries, whose records are let through
+        self._summarizing: Optional[int] = None
+
+    def filter(self, record):
+        """
+        Check whether to include the given log record in the output.
+        :type record: ``logging.LogRecord``
+        :param record: The record to check.
+        :rtype: ``int``
+        :return: 0 indicates the log record should be discarded; non-zero indicates that the record should be
+        logged.
+        """
+        if self._summarizing == threading.get_ident():
+            return 1
+        now = time.monotonic()
+        if now - self._window_start >= self.interval:
+            self._summarize(self._end_window(now, due_only=True))
+        if record.levelno > self.level:
+            return 1
+
+        site = (record.pathname, record.lineno)
+        with self._lock:
+            seen, suppressed, filename, template = self._counts.get(site, (0, 0, record.filename, record.msg))
+            seen += 1
+            keep = seen <= self.burst or (self.sample > 0 and (seen - self.burst) % self.sample == 0)
+            if not keep:
+                suppressed += 1
+            self._counts[site] = (seen, suppressed, filename, template)
+        return 1 if keep else 0
+
+    def flush(self, now: Optional[float] = None):
+        """
+        Log a summary of each line of code whose records were suppressed since
+        the last one and start a new interval.
+
+        :param now: The current time from time.monotonic(), if already known.
+        """
+        if now is None:
+            now = time.monotonic()
+        self._summarize(self._end_window(now, due_only=False))
+
+    def _end_window(self, now: float, due_only: bool) -> Optional[Tuple[dict, float]]:
+        """
+        Start a new interval, taking the counts of the one that ended and how
+        long it was. If due_only is set, nothing is done and None is returned
+        unless the interval is over, so that only one thread ends it.
+        """
+        with self._lock:
+            elapsed = now - self._window_start
+            if due_only and elapsed < self.interval:
+                return None
+            counts = self._counts
+            self._counts = {}
+            self._window_start = now
+        return counts, elapsed
+
+    def _summarize(self, ended: Optional[Tuple[dict, float]]):
+        # summaries are logged without holding the lock, since they pass back
+        # through this filter
+        if ended is None:
+            return
+        counts, elapsed = ended
+        summary_log = logging.getLogger(self.summary_logger)
+        self._summarizing = threading.get_ident()
+        try:
+            for (_, lineno), (_, suppressed, filename, template) in counts.items():
+                if suppressed == 0:
+                    continue
+                msg = "Suppressed {:,d} records like {!r} from {:s}:{:d} in {:.1f}s"
+                summary_log.debug(msg.format(suppressed, str(template), filename, lineno, elapsed))
+        finally:
+            self._summarizing = None
+
+
 def setup_logging(console_output=True):
     # ensure the package-level logger is at least at debug level and the root-level logger is all
     logging.getLogger('cre8').setLevel(logging.DEBUG)
 
-    file_handler = logging.handlers.RotatingFileHandler('debug.log', maxBytes=25*1024*1024, backupCount=5)
+    file_handler = logging.handlers.RotatingFileHandler(LogFileName, maxBytes=25*1024*1024, backupCount=5)
     file_handler.setLevel(TRACE)
     file_handler.setFormatter(logging.Formatter("[%(asctime)s] %(levelname)s: %(message)s"))
+    # a long catch-up logs several trace records per execution it completes,
+    # which would otherwise rotate everything else out of the log
+    repeat_filter = RepeatLimitFilter()
+    file_handler.addFilter(repeat_filter)
+    atexit.register(repeat_filter.flush)
     logging.getLogger().addHandler(file_handler)
 
     if console_output:
-        stderr_handler = logging.StreamHandler(stream=sys.stderr)
-        stderr_handler.setLevel(logging.WARNING)
-        stderr_handler.setFormatter(logging.Formatter("%(levelname)s: %(message)s"))
-        logging.getLogger().addHandler(stderr_handler)
-
-        lev_filter = _ExactLevelFilter(['INFO'])
-        stdout_handler = logging.StreamHandler(stream=sys.stdout)
-        stdout_handler.setLevel(lev_filter.min_level())
-        stdout_handler.setFormatter(logging.Formatter("%(message)s"))
-        stdout_handler.addFilter(lev_filter)
-        logging.getLogger().addHandler(stdout_handler)
\ No newline at end of file
+        for handler in console_handlers(sys.stdout, sys.stderr):
+            logging.getLogger().addHandler(handler)
+
+
+def console_handlers(stdout: TextIO, stderr: TextIO) -> List[logging.Handler]:
+    """
+    Create the handlers that show log messages to the user: INFO messages are
+    written as-is to stdout and WARNING and above are written to stderr.
+
+    :param stdout: The stream to write INFO messages to.
+    :param stderr: The stream to write WARNING and higher messages to.
+    :return: The handlers, which have not yet been added to any logger.
+    """
+    stderr_handler = logging.StreamHandler(stream=stderr)
+    stderr_handler.setLevel(logging.WARNING)
+    stderr_handler.setFormatter(logging.Formatter("%(levelname)s: %(message)s"))
+
+    lev_filter = _ExactLevelFilter(['INFO'])
+    stdout_handler = logging.StreamHandler(stream=stdout)
+    stdout_handler.setLevel(lev_filter.min_level())
+    stdout_handler.setFormatter(logging.Formatter("%(message)s"))
+    stdout_handler.addFilter(lev_filter)
+    return [stderr_handler, stdout_handler]
\ No newline at end of file
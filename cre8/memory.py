@@ -0,0 +1,203 @@
+"""
+Approximate accounting of the memory kept by loaded Engines, for finding which
+players' games are heavy when many of them are resident in the daemon.
+
+Sizes come from walking everything reachable from an Engine and adding up
+sys.getsizeof() of each object, so they are estimates; they leave out allocator
+overhead and anything shared by every game, such as the activity catalog. Each
+object is counted towards the nearest cre8orforge object that holds it, so the
+strings in a RenderCache count towards 'RenderCache' and an Execution's floats
+count towards 'Execution'.
+"""
+
+import re
+import sys
+import types
+import array
+import logging
+import collections
+from typing import Any, Dict, Hashable, Iterable, List, Optional, Tuple
+
+from . import activities, curves, format
+
+_log = logging.getLogger(__name__)
+
+# number of players shown in a report unless asked for more or fewer
+DefaultTopPlayers = 10
+
+# objects that are never counted because they are shared by every game or are
+# part of the program rather than anyone's data
+_SharedTypes = (
+    type, types.ModuleType, types.FunctionType, types.BuiltinFunctionType, types.MethodType, types.CodeType,
+    types.GeneratorType, logging.Logger, activities.Activity, curves.Curve
+)
+
+_SizeUnits = {'': 1, 'k': 1024, 'm': 1024 ** 2, 'g': 1024 ** 3}
+
+
+def parse_size(text: str) -> int:
+    """
+    Parse a number of bytes with an optional binary unit, such as '512', '64M',
+    or '1.5GiB'.
+
+    :param text: The size to parse.
+    :return: The number of bytes.
+    """
+    m = re.fullmatch(r'\s*(\d+(?:\.\d+)?)\s*([kmgKMG]?)(?:i?[bB])?\s*', text)
+    if m is None:
+        raise ValueError("{!r} is not a size such as '512', '64M', or '1.5GiB'".format(text))
+    return int(float(m.group(1)) * _SizeUnits[m.group(2).lower()])
+
+
+def retained_size(root: Any, ignore: Iterable[Any] = ()) -> Tuple[int, Dict[str, int]]:
+    """
+    Estimate the memory kept by an object and everything reachable from it.
+
+    :param root: The object to measure.
+    :param ignore: Objects that are not counted, nor is anything reachable only
+    through them.
+    :return: The total size in bytes, and how much of it is held by each kind
+    of cre8orforge object.
+    """
+    seen = set(id(obj) for obj in ignore)
+    by_type: Dict[str, int] = collections.defaultdict(int)
+    total = 0
+    stack = [(root, type(root).__name__)]
+    while len(stack) > 0:
+        obj, owner = stack.pop()
+        if id(obj) in seen or isinstance(obj, _SharedTypes):
+            continue
+        seen.add(id(obj))
+        if type(obj).__module__.startswith('cre8.'):
+            owner = type(obj).__name__
+        size = sys.getsizeof(obj)
+        total += size
+        by_type[owner] += size
+        for child in _children(obj):
+            stack.append((child, owner))
+    return total, dict(by_type)
+
+
+def _children(obj: Any) -> Iterable[Any]:
+    if isinstance(obj, (str, bytes, bytearray, int, float, complex, bool, array.array, memoryview)) or obj is None:
+        return ()
+    if isinstance(obj, dict):
+        return [item for pair in obj.items() for item in pair]
+    if isinstance(obj, (list, tuple, set, frozenset, collections.deque)):
+        return obj
+    children = []
+    obj_dict = getattr(obj, '__dict__', None)
+    if obj_dict is not None:
+        children.append(obj_dict)
+    for cls in type(obj).__mro__:
+        for slot in cls.__dict__.get('__slots__', ()):
+            if hasattr(obj, slot):
+                children.append(getattr(obj, slot))
+    return children
+
+
+class PlayerMemory:
+    """
+    The memory kept by one player's loaded Engine.
+    """
+
+    def __init__(self, name: str, total: int, by_type: Dict[str, int]):
+        self.name = name
+        self.total = total
+        self.by_type = by_type
+
+    @property
+    def heaviest_type(self) -> str:
+        return max(self.by_type, key=lambda t: self.by_type[t]) if len(self.by_type) > 0 else ''
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {'name': self.name, 'bytes': self.total, 'by_type': dict(self.by_type)}
+
+
+class MemoryReport:
+    """
+    The memory kept by every loaded Engine in a process, by player and by the
+    kind of object that holds it.
+    """
+
+    def __init__(self, players: List[PlayerMemory], top: int = DefaultTopPlayers, budget: Optional[int] = None):
+        """
+        :param players: The memory kept by each player.
+        :param top: The number of heaviest players to list.
+        :param budget: The number of bytes that loaded Engines are allowed to
+        keep before some are unloaded, if there is such a limit.
+        """
+        self.players = sorted(players, key=lambda p: p.total, reverse=True)
+        self.top = top
+        self.budget = budget
+
+    @property
+    def total(self) -> int:
+        return sum(p.total for p in self.players)
+
+    @property
+    def by_type(self) -> Dict[str, int]:
+        totals: Dict[str, int] = collections.defaultdict(int)
+        for p in self.players:
+            for t, size in p.by_type.items():
+                totals[t] += size
+        return dict(totals)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        Get the report in a form that can be written as JSON.
+        """
+        d = {
+            'total': self.total,
+            'budget': self.budget,
+            'by_type': self.by_type,
+            'players': [p.to_dict() for p in self.players[:self.top]],
+            'player_count': len(self.players),
+        }
+        return d
+
+    def __str__(self):
+        total = self.total
+        budget_text = format.byte_size(self.budget) if self.budget is not None else "none"
+        msg = "{:d} loaded games using about {:s} (budget: {:s})".format(
+            len(self.players), format.byte_size(total), budget_text
+        )
+
+        by_type = self.by_type
+        msg += "\n\n{:<20s} {:>10s} {:>6s}".format('held by', 'size', 'share')
+        for t in sorted(by_type, key=lambda k: by_type[k], reverse=True):
+            share = by_type[t] / total * 100 if total > 0 else 0.0
+            msg += "\n{:<20s} {:>10s} {:>5.1f}%".format(t, format.byte_size(by_type[t]), share)
+
+        msg += "\n\n{:>4s} {:<30s} {:>10s} {:s}".format('rank', 'player', 'size', 'mostly held by')
+        for rank, p in enumerate(self.players[:self.top], start=1):
+            msg += "\n{:>4d} {:<30s} {:>10s} {:s}".format(rank, p.name, format.byte_size(p.total), p.heaviest_type)
+        return msg
+
+
+def measure_engine(name: str, eng) -> PlayerMemory:
+    """
+    Estimate the memory kept by a loaded Engine.
+
+    :param name: The name to show for the Engine's player.
+    :param eng: The Engine to measure.
+    """
+    # the notifier is shared by every game that it watches
+    total, by_type = retained_size(eng, ignore=(eng.notifier,) if eng.notifier is not None else ())
+    return PlayerMemory(name, total, by_type)
+
+
+def report(engines: Dict[Hashable, Any], top: int = DefaultTopPlayers, budget: Optional[int] = None) -> MemoryReport:
+    """
+    Estimate the memory kept by several loaded Engines.
+
+    :param engines: The Engines to measure, by anything that tells them apart.
+    Each is shown under the name of its player, which several of them may
+    share.
+    :param top: The number of heaviest players to list.
+    :param budget: The memory budget to show in the report, if there is one.
+    """
+    if top < 0:
+        raise ValueError("top must be at least 0")
+    players = [measure_engine(eng.notify_name, eng) for eng in engines.values()]
+    return MemoryReport(players, top, budget)
@@ -0,0 +1,342 @@
+"""
+Lightweight in-process runtime metrics. Counters, gauges, and fixed-bucket
+histograms are kept in a Registry and can be dumped either as human-readable
+text or in the Prometheus text exposition format. Metrics can be recorded from
+several threads at once, as the load generator does.
+"""
+
+import math
+import time
+import threading
+import contextlib
+from typing import Dict, Tuple, Sequence, Optional, List, Union
+
+LabelSet = Tuple[Tuple[str, str], ...]
+
+# bucket upper bounds for histograms that measure durations, in seconds
+DefaultTimeBuckets = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+
+# bucket upper bounds for histograms that measure sizes, in bytes
+DefaultSizeBuckets = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+# bucket upper bounds for histograms that count things
+DefaultCountBuckets = (0, 1, 2, 5, 10, 50, 100, 1000, 10000, 100000)
+
+
+def percentiles(values: Sequence[float], qs: Sequence[float]) -> List[float]:
+    """
+    Get exact percentiles of a set of values by linear interpolation between the
+    closest ranks. Unlike Histogram.quantile(), this needs every value.
+
+    :param values: The values. They do not need to be sorted.
+    :param qs: The quantiles to get, each between 0.0 and 1.0.
+    :return: The value at each quantile, in the same order as qs. Each is NaN
+    if there are no values.
+    """
+    ordered = sorted(values)
+    if len(ordered) == 0:
+        return [float('nan')] * len(qs)
+    result = []
+    for q in qs:
+        pos = q * (len(ordered) - 1)
+        lower = math.floor(pos)
+        upper = min(lower + 1, len(ordered) - 1)
+        result.append(ordered[lower] + (ordered[upper] - ordered[lower]) * (pos - lower))
+    return result
+
+
+def _label_set(labels: Dict[str, str]) -> LabelSet:
+    if len(labels) == 0:
+        return ()
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(label_set: LabelSet, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(label_set)
+    if extra is not None:
+        pairs.append(extra)
+    if len(pairs) == 0:
+        return ''
+    return '{' + ','.join('{:s}="{:s}"'.format(k, v) for k, v in pairs) + '}'
+
+
+def _format_value(value: Union[int, float]) -> str:
+    if isinstance(value, int):
+        return str(value)
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    return repr(value)
+
+
+class Counter:
+    """
+    A value that only ever goes up, such as the number of times something has
+    happened.
+    """
+
+    type_name = 'counter'
+
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self.values: Dict[LabelSet, Union[int, float]] = {}
+        # held while the values are read and changed, so that increments from
+        # different threads aren't lost
+        self._lock = threading.Lock()
+
+    def inc(self, amount: Union[int, float] = 1, **labels):
+        """
+        Increase the counter.
+
+        :param amount: How much to increase it by.
+        :param labels: Labels that pick which of the counter's series to increase.
+        """
+        key = _label_set(labels)
+        with self._lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def get(self, **labels) -> Union[int, float]:
+        return self.values.get(_label_set(labels), 0)
+
+    def samples(self) -> List[Tuple[str, str, Union[int, float]]]:
+        with self._lock:
+            items = sorted(self.values.items())
+        return [(self.name, _format_labels(k), v) for k, v in items]
+
+
+class Gauge:
+    """
+    A value that can go up and down, such as the size of the last save.
+    """
+
+    type_name = 'gauge'
+
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self.values: Dict[LabelSet, Union[int, float]] = {}
+        self._lock = threading.Lock()
+
+    def set(self, value: Union[int, float], **labels):
+        """
+        Set the current value of the gauge.
+
+        :param value: The new value.
+        :param labels: Labels that pick which of the gauge's series to set.
+        """
+        with self._lock:
+            self.values[_label_set(labels)] = value
+
+    def get(self, **labels) -> Union[int, float]:
+        return self.values.get(_label_set(labels), 0)
+
+    def samples(self) -> List[Tuple[str, str, Union[int, float]]]:
+        with self._lock:
+            items = sorted(self.values.items())
+        return [(self.name, _format_labels(k), v) for k, v in items]
+
+
+class _HistogramSeries:
+    def __init__(self, bucket_count: int):
+        # one count per bucket plus one for +Inf; these are not cumulative
+        self.counts = [0] * (bucket_count + 1)
+        self.sum = 0.0
+        self.count = 0
+
+
+class Histogram:
+    """
+    Counts observed values into fixed buckets and tracks their sum, so that
+    averages and approximate percentiles can be found later.
+    """
+
+    type_name = 'histogram'
+
+    def __init__(self, name: str, help: str, buckets: Sequence[float] = DefaultTimeBuckets):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(sorted(buckets))
+        self.series: Dict[LabelSet, _HistogramSeries] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: Union[int, float], **labels):
+        """
+        Record a value.
+
+        :param value: The value to record.
+        :param labels: Labels that pick which of the histogram's series to record
+        it in.
+        """
+        key = _label_set(labels)
+        idx = 0
+        for bound in self.buckets:
+            if value <= bound:
+                break
+            idx += 1
+
+        with self._lock:
+            series = self.series.get(key, None)
+            if series is None:
+                series = _HistogramSeries(len(self.buckets))
+                self.series[key] = series
+            series.counts[idx] += 1
+            series.sum += value
+            series.count += 1
+
+    @contextlib.contextmanager
+    def time(self, **labels):
+        """
+        Context manager that observes the number of seconds spent within it.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, **labels) -> int:
+        series = self.series.get(_label_set(labels), None)
+        return 0 if series is None else series.count
+
+    def quantile(self, q: float, **labels) -> float:
+        """
+        Estimate a quantile from the buckets. The result is the upper bound of
+        the bucket that the quantile falls in, so it is only as precise as the
+        buckets are.
+
+        :param q: The quantile to estimate, between 0.0 and 1.0.
+        :param labels: Labels that pick which of the histogram's series to use.
+        :return: The estimate, or NaN if nothing has been observed.
+        """
+        series = self.series.get(_label_set(labels), None)
+        if series is None or series.count == 0:
+            return float('nan')
+        target = q * series.count
+        running = 0
+        for idx, c in enumerate(series.counts):
+            running += c
+            if running >= target and c > 0:
+                if idx < len(self.buckets):
+                    return float(self.buckets[idx])
+                return float('inf')
+        return float('inf')
+
+    def samples(self) -> List[Tuple[str, str, Union[int, float]]]:
+        result = []
+        for key, series in self._sorted_series():
+            running = 0
+            for bound, c in zip(self.buckets, series.counts):
+                running += c
+                result.append((self.name + '_bucket', _format_labels(key, ('le', _format_value(float(bound)))), running))
+            result.append((self.name + '_bucket', _format_labels(key, ('le', '+Inf')), series.count))
+            result.append((self.name + '_sum', _format_labels(key), series.sum))
+            result.append((self.name + '_count', _format_labels(key), series.count))
+        return result
+
+    def _sorted_series(self) -> List[Tuple[LabelSet, _HistogramSeries]]:
+        with self._lock:
+            return sorted(self.series.items())
+
+
+Metric = Union[Counter, Gauge, Histogram]
+
+
+class Registry:
+    """
+    Holds a set of named metrics. Asking for a metric that already exists
+    returns the existing one, so modules can declare the metrics they use at
+    import time.
+    """
+
+    def __init__(self):
+        self.metrics: Dict[str, Metric] = {}
+        self._lock = threading.Lock()
+
+    def counter(self, name: str, help: str) -> Counter:
+        return self._get_or_create(Counter, name, help)
+
+    def gauge(self, name: str, help: str) -> Gauge:
+        return self._get_or_create(Gauge, name, help)
+
+    def histogram(self, name: str, help: str, buckets: Sequence[float] = DefaultTimeBuckets) -> Histogram:
+        return self._get_or_create(Histogram, name, help, buckets)
+
+    def reset(self):
+        """
+        Clear the recorded values of every metric without unregistering any of
+        them.
+        """
+        for m in self.metrics.values():
+            with m._lock:
+                if isinstance(m, Histogram):
+                    m.series.clear()
+                else:
+                    m.values.clear()
+
+    def format_prometheus(self) -> str:
+        """
+        Get every metric in the Prometheus text exposition format.
+        """
+        lines = []
+        for name in sorted(self.metrics):
+            m = self.metrics[name]
+            lines.append("# HELP {:s} {:s}".format(m.name, m.help))
+            lines.append("# TYPE {:s} {:s}".format(m.name, m.type_name))
+            for sample_name, labels, value in m.samples():
+                lines.append("{:s}{:s} {:s}".format(sample_name, labels, _format_value(value)))
+        return '\n'.join(lines) + '\n'
+
+    def format_text(self) -> str:
+        """
+        Get a human-readable summary of every metric that has recorded values.
+        Histograms are summarized by count, mean, and estimated percentiles.
+        """
+        lines = []
+        for name in sorted(self.metrics):
+            m = self.metrics[name]
+            if isinstance(m, Histogram):
+                for key, series in m._sorted_series():
+                    labels = dict(key)
+                    mean = series.sum / series.count if series.count > 0 else 0.0
+                    line = "{:s}{:s}: n={:d} mean={:.6g} p50<={:.6g} p95<={:.6g} p99<={:.6g}"
+                    lines.append(line.format(
+                        m.name,
+                        _format_labels(key),
+                        series.count,
+                        mean,
+                        m.quantile(0.50, **labels),
+                        m.quantile(0.95, **labels),
+                        m.quantile(0.99, **labels)
+                    ))
+            else:
+                for sample_name, labels, value in m.samples():
+                    lines.append("{:s}{:s}: {:s}".format(sample_name, labels, _format_value(value)))
+        if len(lines) == 0:
+            return "(no metrics recorded)"
+        return '\n'.join(lines)
+
+    def write_prometheus(self, file_name: str):
+        """
+        Write every metric to a file in the Prometheus text exposition format.
+        The file is fully replaced.
+
+        :param file_name: The file to write to.
+        """
+        with open(file_name, 'w') as fp:
+            fp.write(self.format_prometheus())
+
+    def _get_or_create(self, cls, name: str, help: str, *args) -> Metric:
+        with self._lock:
+            existing = self.metrics.get(name, None)
+            if existing is not None:
+                if not isinstance(existing, cls):
+                    msg = "metric {!r} is already registered as a {:s}"
+                    raise ValueError(msg.format(name, existing.type_name))
+                return existing
+            m = cls(name, help, *args)
+            self.metrics[name] = m
+            return m
+
+
+# The default registry that all of cre8 records into.
+registry = Registry()
@@ -0,0 +1,444 @@
+"""
+Notifications for when running executions complete. Pending completions are
+kept in a hierarchical timing wheel keyed on the wall-clock time that each
+execution ends, so any number of players can have executions running without
+anything needing to be checked until one of them is actually due.
+"""
+
+import math
+import pickle
+import logging
+from datetime import datetime, timezone
+from typing import Dict, List, Tuple, Optional, Callable, Any
+
+from .activities import Activity
+from .state import GameState
+from .clock import Clock, DefaultClock
+from . import activities, state, metrics
+
+_log = logging.getLogger(__name__)
+
+CurrentVersion = 1
+
+DefaultNotifyFile = 'notify.p'
+
+# number of bits of the tick count that each level of the timing wheel covers,
+# lowest level first. with 1-second ticks, the levels span 256 seconds, about 4.5
+# hours, about 12 days, and about 2 years; anything further out waits in an
+# overflow list until the top level wraps around.
+DefaultWheelBits = (8, 6, 6, 6)
+
+_fired = metrics.registry.counter('cre8_notify_fired_total', "Completion notifications that have been fired")
+_pending = metrics.registry.gauge('cre8_notify_pending', "Completion notifications waiting to fire")
+
+
+class Timer:
+    """
+    A handle to a single item scheduled in a TimingWheel.
+    """
+
+    def __init__(self, tick: int, payload: Any):
+        self.tick = tick
+        self.payload = payload
+        # where the timer currently sits in its wheel; level is None when it is
+        # not scheduled and -1 when it is in the overflow list
+        self._level: Optional[int] = None
+        self._slot = 0
+
+    @property
+    def scheduled(self) -> bool:
+        return self._level is not None
+
+    def __repr__(self):
+        return "Timer(tick={!r}, payload={!r})".format(self.tick, self.payload)
+
+
+class TimingWheel:
+    """
+    Hierarchical timing wheel. Scheduling and cancelling a timer are O(1).
+    Advancing the wheel costs time in proportion to the number of timers that
+    fire or move to a lower level, and skips over stretches of time that have
+    nothing scheduled in them.
+    """
+
+    def __init__(self, start_tick: int = 0, bits: Tuple[int, ...] = DefaultWheelBits):
+        """
+        :param start_tick: The first tick that has not yet been processed.
+        :param bits: Number of bits of the tick count covered by each level,
+        lowest level first.
+        """
+        if len(bits) == 0:
+            raise ValueError("bits must have at least one level")
+        self.bits = tuple(bits)
+        self.current = start_tick
+        self._shifts = []
+        shift = 0
+        for b in self.bits:
+            self._shifts.append(shift)
+            shift += b
+        self._top_shift = shift
+        self._levels: List[List[Dict[int, Timer]]] = [[{} for _ in range(2 ** b)] for b in self.bits]
+        self._counts = [0] * len(self.bits)
+        self._overflow: Dict[int, Timer] = {}
+
+    def __len__(self) -> int:
+        return sum(self._counts) + len(self._overflow)
+
+    def schedule(self, tick: int, payload: Any) -> Timer:
+        """
+        Schedule something to fire at a tick. If the tick has already been
+        processed, it fires along with the first tick that hasn't been.
+
+        :param tick: The tick to fire at.
+        :param payload: What advance() returns when the timer fires.
+        :return: A handle that can be given to cancel().
+        """
+        timer = Timer(tick, payload)
+        self._place(timer)
+        return timer
+
+    def cancel(self, timer: Timer) -> bool:
+        """
+        Stop a timer from firing.
+
+        :param timer: The handle returned by schedule().
+        :return: Whether the timer was still scheduled.
+        """
+        if timer._level is None:
+            return False
+        if timer._level < 0:
+            del self._overflow[id(timer)]
+        else:
+            del self._levels[timer._level][timer._slot][id(timer)]
+            self._counts[timer._level] -= 1
+        timer._level = None
+        return True
+
+    def advance(self, to_tick: int) -> List[Timer]:
+        """
+        Process every tick up to and including to_tick.
+
+        :param to_tick: The last tick to process.
+        :return: The timers that fired, in the order of the ticks they were
+        scheduled for. They are no longer scheduled.
+        """
+        fired = []
+        while self.current <= to_tick:
+            # when the lowest levels are empty nothing can fire until the next
+            # slot of the lowest non-empty level comes up, so jump straight there
+            empty_levels = 0
+            while empty_levels < len(self.bits) and self._counts[empty_levels] == 0:
+                empty_levels += 1
+            if empty_levels > 0:
+                if empty_levels == len(self.bits) and len(self._overflow) == 0:
+                    self.current = to_tick + 1
+                    break
+                shift = self._shifts[empty_levels] if empty_levels < len(self.bits) else self._top_shift
+                boundary = ((self.current >> shift) + 1) << shift
+                if self.current & ((1 << shift) - 1) != 0:
+                    if boundary > to_tick:
+                        self.current = to_tick + 1
+                        break
+                    self.current = boundary
+
+            self._cascade()
+            
+            # nothing moves into the lowest level until the next cascade, so the
+            # rest of its current turn can be fired in one go
+            low_bits = self.bits[0]
+            turn_end = min((((self.current >> low_bits) + 1) << low_bits) - 1, to_tick)
+            low_level = self._levels[0]
+            for tick in range(self.current, turn_end + 1):
+                slot = low_level[tick & ((1 << low_bits) - 1)]
+                if len(slot) > 0:
+                    due = sorted(slot.values(), key=lambda t: t.tick)
+                    slot.clear()
+                    self._counts[0] -= len(due)
+                    for timer in due:
+                        timer._level = None
+                    fired.extend(due)
+                    if self._counts[0] == 0:
+                        break
+            self.current = turn_end + 1
+        return fired
+
+    def _cascade(self):
+        """
+        Move the timers in the slots of the higher levels that begin at the
+        current tick down to the levels they now belong in.
+        """
+        for level in range(1, len(self.bits)):
+            below_mask = (1 << self._shifts[level]) - 1
+            if self.current & below_mask != 0:
+                return
+            slot_idx = (self.current >> self._shifts[level]) & ((1 << self.bits[level]) - 1)
+            slot = self._levels[level][slot_idx]
+            if len(slot) > 0:
+                moving = list(slot.values())
+                slot.clear()
+                self._counts[level] -= len(moving)
+                for timer in moving:
+                    self._place(timer)
+
+        if self.current & ((1 << self._top_shift) - 1) == 0 and len(self._overflow) > 0:
+            moving = list(self._overflow.values())
+            self._overflow.clear()
+            for timer in moving:
+                self._place(timer)
+
+    def _place(self, timer: Timer):
+        tick = max(timer.tick, self.current)
+        for level, b in enumerate(self.bits):
+            # a timer belongs in the lowest level whose whole span (the range
+            # covered by one slot of the level above) contains both it and the
+            # current tick
+            upper_shift = self._shifts[level] + b
+            if (tick >> upper_shift) == (self.current >> upper_shift):
+                slot_idx = (tick >> self._shifts[level]) & ((1 << b) - 1)
+                self._levels[level][slot_idx][id(timer)] = timer
+                self._counts[level] += 1
+                timer._level = level
+                timer._slot = slot_idx
+                return
+        self._overflow[id(timer)] = timer
+        timer._level = -1
+
+
+class Completion:
+    """
+    Describes an execution that has completed.
+    """
+
+    def __init__(self, player: str, activity: Activity, end: datetime, predicted: bool):
+        """
+        :param player: The player whose execution it was.
+        :param activity: The activity that was executing.
+        :param end: The wall-clock time that the execution ended at.
+        :param predicted: Whether the execution was one that automation was
+        expected to start after the previous one, rather than one that was known
+        to be running the last time the player's game state was seen. Automation
+        stops if the player can't afford the next execution, so a predicted
+        completion might not have actually happened.
+        """
+        self.player = player
+        self.activity = activity
+        self.end = end
+        self.predicted = predicted
+
+    def __str__(self):
+        msg = "{:s} finished for {:s}".format(self.activity.name, self.player)
+        if self.predicted:
+            msg += " (if automation kept running)"
+        return msg
+
+    def __repr__(self):
+        msg = "Completion(player={!r}, activity={!r}, end={!r}, predicted={!r})"
+        return msg.format(self.player, self.activity, self.end, self.predicted)
+
+
+class _Pending:
+    def __init__(self, player: str, act_id: int, end: float, automated: bool, predicted: bool):
+        self.player = player
+        self.act_id = act_id
+        self.end = end
+        self.automated = automated
+        self.predicted = predicted
+
+    def __repr__(self):
+        msg = "_Pending(player={!r}, act_id={!r}, end={!r}, automated={!r}, predicted={!r})"
+        return msg.format(self.player, self.act_id, self.end, self.automated, self.predicted)
+
+
+class CompletionNotifier:
+    """
+    Keeps track of when the running executions of any number of players will
+    complete and calls a callback as each one does. Players' game states only
+    need to be given to watch() when they change; nothing about them is kept
+    except when their executions end, so engines can be unloaded without
+    losing notifications.
+    """
+
+    def __init__(
+        self, callback: Callable[[Completion], None], resolution: float = 1.0, clock: Clock = DefaultClock
+    ):
+        """
+        :param callback: Called with a Completion for each execution that
+        completes.
+        :param resolution: Length of one tick of the timing wheel, in seconds.
+        Notifications fire up to this long after the execution actually ends.
+        :param clock: Gives the current time when poll() isn't given one. It
+        should be the clock of the Engines whose games are watched.
+        """
+        if resolution <= 0:
+            raise ValueError("resolution must be greater than 0")
+        self.callback = callback
+        self.resolution = resolution
+        self.clock = clock
+        self._wheel = TimingWheel(self._tick_at(clock.now().timestamp()))
+        # the timer for each running execution, by player and then activity ID
+        self._timers: Dict[str, Dict[int, Timer]] = {}
+
+    def __len__(self) -> int:
+        return len(self._wheel)
+
+    def watch(self, player: str, gs: GameState):
+        """
+        Update the notifications pending for a player to match their game state.
+        Notifications are added for executions that were started, cancelled for
+        ones that are no longer running, and left alone for ones that haven't
+        changed.
+
+        :param player: The player that the game state belongs to.
+        :param gs: The player's current game state.
+        """
+        # game time passes at the same rate as wall-clock time, so the wall time
+        # an execution ends is however far it is from the last advancement
+        base = gs.last_advancement.timestamp() - gs.time
+        running = {}
+        for oa in gs.jobs + gs.outlets:
+            if oa.execution is not None:
+                running[oa.activity.id] = (base + oa.execution.end, oa.automated)
+
+        player_timers = self._timers.get(player, {})
+        for act_id in [a for a in player_timers if a not in running]:
+            self._wheel.cancel(player_timers.pop(act_id))
+
+        for act_id, (end, automated) in running.items():
+            existing = player_timers.get(act_id, None)
+            if existing is not None:
+                pending = existing.payload
+                if not pending.predicted and self._tick_at(pending.end) == self._tick_at(end):
+                    pending.automated = automated
+                    continue
+                self._wheel.cancel(existing)
+            self._arm(_Pending(player, act_id, end, automated, False))
+        if player in self._timers and len(self._timers[player]) == 0:
+            del self._timers[player]
+        _pending.set(len(self._wheel))
+
+    def forget(self, player: str):
+        """
+        Cancel every notification pending for a player.
+
+        :param player: The player to forget.
+        """
+        for timer in self._timers.pop(player, {}).values():
+            self._wheel.cancel(timer)
+        _pending.set(len(self._wheel))
+
+    def poll(self, now: Optional[float] = None) -> int:
+        """
+        Fire the callback for every execution that has completed. Executions
+        that were automated are assumed to start again immediately and are
+        re-armed for the end of their next cycle.
+
+        :param now: The current wall-clock time as a POSIX timestamp. Defaults to
+        the current time on the clock.
+        :return: The number of notifications that fired.
+        """
+        if now is None:
+            now = self.clock.now().timestamp()
+        # a tick is processed only once it has fully passed
+        fired = self._wheel.advance(self._tick_at(now) - 1)
+        for timer in fired:
+            pending = timer.payload
+            player_timers = self._timers[pending.player]
+            del player_timers[pending.act_id]
+            if len(player_timers) == 0:
+                del self._timers[pending.player]
+            act = activities.from_id(pending.act_id)
+            end = datetime.fromtimestamp(pending.end, timezone.utc)
+            _fired.inc()
+            _log.debug("Execution of {!r} completed for {!r}".format(act.name, pending.player))
+            if pending.automated:
+                # cycles that would have already finished by now are skipped
+                # rather than each being notified late
+                duration = act.duration.total_seconds()
+                skipped_cycles = max(0, math.floor((now - pending.end) / duration))
+                next_end = pending.end + (skipped_cycles + 1) * duration
+                self._arm(_Pending(pending.player, pending.act_id, next_end, True, True))
+            self.callback(Completion(pending.player, act, end, pending.predicted))
+        _pending.set(len(self._wheel))
+        return len(fired)
+
+    def to_dict(self):
+        d = {
+            'resolution': self.resolution,
+            'pending': [
+                {
+                    'player': p.player,
+                    'activity': p.act_id,
+                    'end': p.end,
+                    'automated': p.automated,
+                    'predicted': p.predicted
+                }
+                for player_timers in self._timers.values()
+                for p in (t.payload for t in player_timers.values())
+            ]
+        }
+        return d
+
+    @staticmethod
+    def from_dict(
+        d, callback: Callable[[Completion], None], clock: Clock = DefaultClock
+    ) -> 'CompletionNotifier':
+        notifier = CompletionNotifier(callback, d['resolution'], clock)
+        for p in d['pending']:
+            notifier._arm(_Pending(p['player'], p['activity'], p['end'], p['automated'], p['predicted']))
+        _pending.set(len(notifier._wheel))
+        return notifier
+
+    def _arm(self, pending: _Pending):
+        # anything that ended while no notifier was running fires on the next poll
+        timer = self._wheel.schedule(self._tick_at(pending.end), pending)
+        self._timers.setdefault(pending.player, {})[pending.act_id] = timer
+
+    def _tick_at(self, timestamp: float) -> int:
+        return math.ceil(timestamp / self.resolution)
+
+
+def save(file_name: str, notifier: CompletionNotifier, durability: str = 'atomic'):
+    """
+    Write the pending notifications of a CompletionNotifier so they can be read
+    later with a call to load().
+
+    :param file_name: The file to write to.
+    :param notifier: The CompletionNotifier to write.
+    :param durability: How hard to try to keep the file intact; see
+    state.save().
+    """
+    formatted_data = {
+        'meta': {
+            'version': CurrentVersion
+        },
+        'notifier': notifier.to_dict()
+    }
+    state._write_file(file_name, pickle.dumps(formatted_data), durability)
+
+
+def load(
+    file_name: str, callback: Callable[[Completion], None], clock: Clock = DefaultClock
+) -> CompletionNotifier:
+    """
+    Read a CompletionNotifier written by save(). Notifications that came due
+    while it was not running fire on its first poll.
+
+    :param file_name: The file to read from.
+    :param callback: The callback to give the CompletionNotifier.
+    :param clock: The clock to give the CompletionNotifier.
+    :return: The CompletionNotifier. If the file does not exist, one with
+    nothing pending is returned.
+    """
+    try:
+        with open(file_name, 'rb') as fp:
+            data = pickle.load(fp)
+    except FileNotFoundError:
+        return CompletionNotifier(callback, clock=clock)
+    except (pickle.PickleError, EOFError) as e:
+        raise state.SerializedStateError("Could not read notification file: {!s}".format(str(e)))
+
+    version = data['meta']['version']
+    if version != CurrentVersion:
+        msg = "Notification file is version {:d} but this build of cre8orforge only reads version {:d}"
+        raise state.SerializedStateError(msg.format(version, CurrentVersion))
+    return CompletionNotifier.from_dict(data['notifier'], callback, clock)
@@ -0,0 +1,97 @@
+"""
+Opt-in CPU and memory profiling for CLI commands and GUI ticks. Reports are
+written next to the debug log so they can be sent in along with it.
+"""
+
+import os
+import cProfile
+import tracemalloc
+from datetime import datetime
+from typing import Optional
+
+from . import logutil
+
+ProfileModes = ('cpu', 'mem')
+
+# number of allocation sites listed in a memory profile report
+DefaultTopAllocations = 25
+
+
+class Profiler:
+    """
+    Profiles the code run within it, either for CPU time with cProfile or for
+    memory allocations with tracemalloc. It can be entered any number of times
+    (such as once per GUI tick) and the results accumulate until finish() is
+    called.
+    """
+
+    def __init__(self, mode: str, label: str, top: int = DefaultTopAllocations):
+        """
+        Create a new Profiler. It does not begin profiling until it is entered.
+
+        :param mode: Either 'cpu' or 'mem'.
+        :param label: Short name of what is being profiled; it is included in the
+        name of the report file.
+        :param top: For 'mem' mode, the number of allocation sites to include in
+        the report.
+        """
+        if mode not in ProfileModes:
+            raise ValueError("mode must be one of 'cpu' or 'mem'")
+        self.mode = mode
+        self.label = label
+        self.top = top
+        self._cpu: Optional[cProfile.Profile] = None
+        self._started_tracing = False
+        self._baseline: Optional[tracemalloc.Snapshot] = None
+        if mode == 'cpu':
+            self._cpu = cProfile.Profile()
+
+    def __enter__(self) -> 'Profiler':
+        if self.mode == 'cpu':
+            self._cpu.enable()
+        elif self._baseline is None:
+            # leave tracing on between entries so allocations that are retained
+            # across them are still attributed correctly
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self._started_tracing = True
+            self._baseline = tracemalloc.take_snapshot()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if self.mode == 'cpu':
+            self._cpu.disable()
+        return False
+
+    def finish(self) -> str:
+        """
+        Stop profiling and write the report.
+
+        :return: The path to the written report. For 'cpu' mode this is a
+        .pstats file readable with the pstats module; for 'mem' mode it is a
+        text file listing the top allocation sites.
+        """
+        stamp = datetime.now().strftime('%Y%m%d-%H%M%S')
+        base_name = "profile-{:s}-{:s}".format(self.label, stamp)
+        log_dir = os.path.dirname(os.path.abspath(logutil.LogFileName))
+
+        if self.mode == 'cpu':
+            path = os.path.join(log_dir, base_name + '.pstats')
+            self._cpu.dump_stats(path)
+            return path
+
+        path = os.path.join(log_dir, base_name + '-mem.txt')
+        if self._baseline is None:
+            stats = []
+        else:
+            snapshot = tracemalloc.take_snapshot()
+            stats = snapshot.compare_to(self._baseline, 'lineno')[:self.top]
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+
+        with open(path, 'w') as fp:
+            fp.write("Top {:d} allocation sites for {:s}:\n".format(self.top, self.label))
+            for stat in stats:
+                fp.write(str(stat) + '\n')
+        return path
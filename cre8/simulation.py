@@ -0,0 +1,178 @@
+"""
+Accelerated simulation. A copy of a game is run through the same
+Engine.update() path that the GUI and the daemon use, but under a clock that
+runs faster than real time, so that days or weeks of play can be checked for
+balance or speed in minutes.
+"""
+
+import re
+import time
+import logging
+from datetime import timedelta
+from typing import Any, Dict, Optional
+
+from .engine import Engine
+from .state import GameState
+from .clock import FixedClock, ScaledClock
+from . import format
+
+_log = logging.getLogger(__name__)
+
+# how many times faster than real time a simulation runs unless told otherwise
+DefaultSpeed = 1000.0
+
+# simulated seconds between updates of the game
+DefaultStep = 60.0
+
+_DurationUnits = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400, 'w': 604800}
+
+
+def parse_speed(text: str) -> Optional[float]:
+    """
+    Parse a simulation speed such as '1000x' or '1000', or 'max' to run as fast
+    as possible.
+
+    :param text: The speed to parse.
+    :return: The number of simulated seconds per real second, or None for
+    'max'.
+    """
+    if text.strip().lower() == 'max':
+        return None
+    m = re.fullmatch(r'\s*(\d+(?:\.\d+)?)\s*[xX]?\s*', text)
+    if m is None or float(m.group(1)) <= 0:
+        raise ValueError("{!r} is not a speed such as '1000x' or 'max'".format(text))
+    return float(m.group(1))
+
+
+def parse_duration(text: str) -> float:
+    """
+    Parse a length of time made of numbers with units, such as '2w', '1d12h',
+    or '90m'. A number without a unit is in seconds.
+
+    :param text: The duration to parse.
+    :return: The number of seconds.
+    """
+    parts = re.findall(r'(\d+(?:\.\d+)?)\s*([smhdwSMHDW]?)', text)
+    if len(parts) == 0 or re.fullmatch(r'(\s*\d+(?:\.\d+)?\s*[smhdwSMHDW]?)+\s*', text) is None:
+        raise ValueError("{!r} is not a duration such as '2w', '1d12h', or '90m'".format(text))
+    return sum(float(amount) * _DurationUnits[unit.lower() or 's'] for amount, unit in parts)
+
+
+class SimulationReport:
+    """
+    The results of running a game faster than real time.
+    """
+
+    def __init__(self, config: Dict[str, Any]):
+        self.config = config
+        self.simulated_seconds = 0.0
+        self.real_seconds = 0.0
+        self.updates = 0
+        self.slowest_update = 0.0
+        self.money = 0
+        self.juice = 0.0
+        self.seeds = 0.0
+
+    @property
+    def throughput(self) -> float:
+        """
+        Simulated seconds per real second.
+        """
+        return self.simulated_seconds / self.real_seconds if self.real_seconds > 0 else 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        Get the report in a form that can be written as JSON for comparing
+        builds.
+        """
+        d = {
+            'config': dict(self.config),
+            'simulated_seconds': self.simulated_seconds,
+            'real_seconds': self.real_seconds,
+            'throughput': self.throughput,
+            'updates': self.updates,
+            'updates_per_second': self.updates / self.real_seconds if self.real_seconds > 0 else 0.0,
+            'slowest_update': self.slowest_update,
+            'money': self.money,
+            'juice': self.juice,
+            'seeds': self.seeds,
+        }
+        return d
+
+    def __str__(self):
+        d = self.to_dict()
+        speed = self.config['speed']
+        speed_text = "{:g}x".format(speed) if speed is not None else "max"
+        msg = "Simulated {:s} at {:s} speed in {:.1f}s ({:d} updates of {:g}s)".format(
+            format.format_timer(timedelta(seconds=self.simulated_seconds)), speed_text, self.real_seconds,
+            self.updates, self.config['step']
+        )
+        msg += "\n{:<24s} {:>14.1f}".format('simulated s/real s', d['throughput'])
+        msg += "\n{:<24s} {:>14.1f}".format('updates/s', d['updates_per_second'])
+        msg += "\n{:<24s} {:>14.3f}".format('slowest update ms', self.slowest_update * 1000)
+        msg += "\n{:<24s} {:>14s}".format('money made', format.money(self.money))
+        msg += "\n{:<24s} {:>14.4f}".format('juice made', self.juice)
+        msg += "\n{:<24s} {:>14.4f}".format('seeds made', self.seeds)
+        return msg
+
+
+def run(
+    duration: float,
+    speed: Optional[float] = DefaultSpeed,
+    step: float = DefaultStep,
+    game: Optional[GameState] = None
+) -> SimulationReport:
+    """
+    Run a game under a virtual clock, calling Engine.update() every step of
+    simulated time. The game is only kept in memory.
+
+    :param duration: How many simulated seconds to run for.
+    :param speed: How many simulated seconds pass for each real second, or None
+    to update as fast as possible with a clock that moves forward by step each
+    time.
+    :param step: Simulated seconds between updates.
+    :param game: The game to run a copy of. Defaults to a new game.
+    :return: How fast the simulation ran and what the game made.
+    """
+    if duration <= 0:
+        raise ValueError("duration must be greater than 0")
+    if step <= 0:
+        raise ValueError("step must be greater than 0")
+    config = {
+        'duration': duration,
+        'speed': speed,
+        'step': step,
+    }
+    report = SimulationReport(config)
+
+    clk = FixedClock() if speed is None else ScaledClock(speed)
+    eng = Engine(state_file=None, clock=clk)
+    if game is not None:
+        eng.game = game.copy(clk)
+        eng.game.last_advancement = clk.now()
+        eng.after_advance()
+    start_time = eng.game.time
+    # the end is kept on the clock rather than in game time, since the clock
+    # only moves in whole microseconds and a last step of a sliver of a second
+    # would never bring a float total of game time up to the duration
+    end = eng.game.last_advancement + timedelta(seconds=duration)
+
+    started = time.perf_counter()
+    while eng.game.last_advancement < end:
+        if speed is None:
+            clk.advance(min(step, (end - clk.now()).total_seconds()))
+        else:
+            wait = started + (report.updates + 1) * step / speed - time.perf_counter()
+            if wait > 0:
+                time.sleep(wait)
+        update_started = time.perf_counter()
+        adv = eng.update()
+        report.slowest_update = max(report.slowest_update, time.perf_counter() - update_started)
+        report.updates += 1
+        report.money += adv.money
+        report.juice += adv.juice
+        report.seeds += adv.seeds
+    report.real_seconds = time.perf_counter() - started
+    report.simulated_seconds = eng.game.time - start_time
+    _log.debug("Simulation finished: {!r}".format(report.to_dict()))
+    return report
@@ -1,38 +1,256 @@
+import os
+import mmap
+import array
+import zlib
+import struct
 import pickle
+import hashlib
+import time
 from datetime import datetime, timezone
-from typing import Tuple, Optional, Dict, Any, Sequence
+from typing import Tuple, Optional, Dict, Any, List, Iterator
 
-from .activities import OwnedActivities
-from . import format
+from .activities import OwnedActivities, Activity
+from . import format, metrics
+from .clock import Clock, DefaultClock
 from cre8 import activities
 
 
 CurrentVersion = 1
 
+# the GameState values whose changes are tracked in GameState.change_log along
+# with the card of each owned activity. Game time is left out, since it moves
+# on every update and would make every update a change.
+TrackedScalars = ('money', 'juice', 'free_juice', 'seeds', 'ideas')
+
+DurabilityModes = ('relaxed', 'atomic', 'durable')
+
+_save_seconds = metrics.registry.histogram('cre8_state_save_seconds', "Time taken to save state")
+_load_seconds = metrics.registry.histogram('cre8_state_load_seconds', "Time taken to load state")
+_save_bytes = metrics.registry.histogram(
+    'cre8_state_save_bytes', "Size of each saved state file", buckets=metrics.DefaultSizeBuckets
+)
+_last_save_bytes = metrics.registry.gauge('cre8_state_last_save_bytes', "Size of the most recently saved state file")
+
 
 class SerializedStateError(Exception):
     def __init__(self, msg):
         super().__init__(msg)
 
 
+# the values recorded for each run in a RunHistory, along with the typecode of
+# the array that each is kept in. money is kept as a float so that it fits, so
+# it is only approximate once it gets very large.
+RunColumns = (
+    ('duration', 'd'),
+    ('money', 'd'),
+    ('juice', 'd'),
+    ('seeds', 'q'),
+    ('ideas', 'q'),
+)
+
+RunColumnNames = tuple(name for name, _ in RunColumns)
+
+# a RunHistory downsamples once it has more than this many records
+DefaultMaxRunRecords = 256
+
+# the number of most recent runs that are never downsampled
+DefaultFullRunRecords = 128
+
+
+class RunHistory:
+    """
+    Record of what each run (the time between two prestiges) looked like: how
+    long it lasted, how much money and juice were made, how many seeds were
+    sprouted, and how many ideas there were afterwards. Each value is kept in
+    its own array.
+    
+    The most recent runs are kept individually. Older ones are merged with their
+    neighbors as more runs are added, so a record can stand for more than one
+    run and the total size stays bounded; the older a run is, the more runs it
+    shares a record with. Each record holds the sums of the values of the runs
+    it stands for.
+    """
+    
+    def __init__(self, max_records: int = DefaultMaxRunRecords, full_records: int = DefaultFullRunRecords):
+        """
+        :param max_records: The number of records to keep before downsampling.
+        :param full_records: The number of most recent runs that are always
+        kept individually. Must be less than max_records.
+        """
+        if full_records >= max_records:
+            raise ValueError("full_records must be less than max_records")
+        self.max_records = max_records
+        self.full_records = full_records
+        self.total_runs = 0
+        # number of runs that each record stands for
+        self._counts = array.array('q')
+        self._columns: Dict[str, array.array] = {name: array.array(code) for name, code in RunColumns}
+        # run number and value of the best single run for each column
+        self._best: Dict[str, Tuple[int, float]] = {}
+    
+    def __len__(self) -> int:
+        """
+        Get the number of records currently kept, which is at most the number of
+        runs.
+        """
+        return len(self._counts)
+    
+    def append(self, duration: float, money: int, juice: float, seeds: int, ideas: int):
+        """
+        Record a run that just ended.
+        
+        :param duration: How long the run lasted in game seconds.
+        :param money: Money made during the run.
+        :param juice: Juice made during the run.
+        :param seeds: Seeds sprouted into ideas at the end of the run.
+        :param ideas: Total ideas after the seeds were sprouted.
+        """
+        values = {'duration': duration, 'money': money, 'juice': juice, 'seeds': seeds, 'ideas': ideas}
+        self.total_runs += 1
+        self._counts.append(1)
+        for name, value in values.items():
+            self._columns[name].append(value)
+            best = self._best.get(name, None)
+            if best is None or value > best[1]:
+                self._best[name] = (self.total_runs, value)
+        
+        if len(self._counts) > self.max_records:
+            self._downsample()
+    
+    def best(self, column: str) -> Optional[Tuple[int, float]]:
+        """
+        Get the run with the highest value in a column. This is exact even if the
+        run has since been downsampled.
+        
+        :param column: One of the names in RunColumnNames.
+        :return: The run number (starting at 1) and the value, or None if there
+        have not been any runs.
+        """
+        self._check_column(column)
+        return self._best.get(column, None)
+    
+    def moving_average(self, column: str, window: int) -> Optional[float]:
+        """
+        Get the average value of a column over the most recent runs. If the window
+        reaches into downsampled runs, they are taken to each have the average
+        value of their record.
+        
+        :param column: One of the names in RunColumnNames.
+        :param window: The number of most recent runs to average over.
+        :return: The average, or None if there have not been any runs.
+        """
+        self._check_column(column)
+        if window < 1:
+            raise ValueError("window must be at least 1")
+        values = self._columns[column]
+        remaining = window
+        total = 0.0
+        idx = len(self._counts) - 1
+        while idx >= 0 and remaining > 0:
+            count = self._counts[idx]
+            used = min(count, remaining)
+            total += values[idx] * (used / count)
+            remaining -= used
+            idx -= 1
+        covered = window - remaining
+        if covered == 0:
+            return None
+        return total / covered
+    
+    def records(self) -> Iterator[Tuple[int, int, Dict[str, float]]]:
+        """
+        Iterate over the kept records, oldest first.
+        
+        :return: Tuples of the number of the first run the record stands for
+        (starting at 1), the number of runs it stands for, and the average value
+        of each column over those runs.
+        """
+        first_run = self.total_runs - sum(self._counts) + 1
+        for idx, count in enumerate(self._counts):
+            averages = {name: self._columns[name][idx] / count for name in RunColumnNames}
+            yield first_run, count, averages
+            first_run += count
+    
+    def copy(self) -> 'RunHistory':
+        """
+        Create a RunHistory that is a copy of this one.
+        
+        :return: A copy of this RunHistory.
+        """
+        clone = RunHistory(self.max_records, self.full_records)
+        clone.total_runs = self.total_runs
+        clone._counts = array.array('q', self._counts)
+        clone._columns = {name: array.array(values.typecode, values) for name, values in self._columns.items()}
+        clone._best = dict(self._best)
+        return clone
+    
+    def to_dict(self) -> Dict[str, Any]:
+        d = {
+            'max_records': self.max_records,
+            'full_records': self.full_records,
+            'total_runs': self.total_runs,
+            'counts': self._counts.tobytes(),
+            'columns': {name: values.tobytes() for name, values in self._columns.items()},
+            'best': dict(self._best)
+        }
+        return d
+    
+    @staticmethod
+    def from_dict(d: Dict) -> 'RunHistory':
+        runs = RunHistory(d['max_records'], d['full_records'])
+        runs.total_runs = d['total_runs']
+        runs._counts.frombytes(d['counts'])
+        for name, data in d['columns'].items():
+            runs._columns[name].frombytes(data)
+        runs._best = {name: tuple(best) for name, best in d['best'].items()}
+        return runs
+    
+    def _downsample(self):
+        """
+        Merge each pair of neighboring records older than the most recent
+        full_records runs into one.
+        """
+        old_count = len(self._counts) - self.full_records
+        
+        def merged(values: array.array) -> array.array:
+            result = array.array(values.typecode)
+            for idx in range(0, old_count - 1, 2):
+                result.append(values[idx] + values[idx + 1])
+            if old_count % 2 == 1:
+                result.append(values[old_count - 1])
+            result.extend(values[old_count:])
+            return result
+        
+        self._counts = merged(self._counts)
+        for name in RunColumnNames:
+            self._columns[name] = merged(self._columns[name])
+    
+    # noinspection PyMethodMayBeStatic
+    def _check_column(self, column: str):
+        if column not in RunColumnNames:
+            raise ValueError("column must be one of {:s}".format(', '.join(repr(c) for c in RunColumnNames)))
+
+
 class History:
     """
     Contains historical data that is retained on prestige for record-keeping
     and prestige rate increase.
     """
     
-    def __init__(self, time: float, money: int, juice: float, prestiges: int):
+    def __init__(self, time: float, money: int, juice: float, prestiges: int, runs: Optional[RunHistory] = None):
         self.time = time
         self.money = money
         self.juice = juice
         self.prestiges = prestiges
+        self.runs = runs if runs is not None else RunHistory()
         
     def to_dict(self) -> Dict[str, Any]:
         d = {
             'time': self.time,
             'money': self.money,
             'juice': self.juice,
-            'prestiges': self.prestiges
+            'prestiges': self.prestiges,
+            'runs': self.runs.to_dict()
         }
         return d
         
@@ -42,7 +260,7 @@ class History:
         
         :return: A copy of this History.
         """
-        return History(self.time, self.money, self.juice, self.prestiges)
+        return History(self.time, self.money, self.juice, self.prestiges, self.runs.copy())
 
     # noinspection PyMethodMayBeStatic
     def stage(self) -> int:
@@ -82,21 +300,77 @@ class History:
         
     @staticmethod
     def from_dict(d: Dict) -> 'History':
-        return History(d['time'], d['money'], d['juice'], d['prestiges'])
+        runs = None
+        if 'runs' in d:
+            runs = RunHistory.from_dict(d['runs'])
+        return History(d['time'], d['money'], d['juice'], d['prestiges'], runs)
+
+
+def card_change_key(act: Activity) -> str:
+    """
+    Get the key in GameState.change_log that tracks the card of an activity.
+    """
+    return 'card:{:d}'.format(act.id)
 
 
 class GameState:
-    def __init__(self):
-        self.last_advancement = datetime.now(timezone.utc)
+    def __init__(self, clock: Clock = DefaultClock):
+        """
+        :param clock: Gives the time that the new game was last advanced at.
+        """
+        self.last_advancement = clock.now()
         self.money = 0
         self.juice = 0.0
-        self.jobs: Sequence[activities.OwnedActivities] = []
-        self.outlets: Sequence[activities.OwnedActivities] = []
+        self.jobs: List[activities.OwnedActivities] = []
+        self.outlets: List[activities.OwnedActivities] = []
         self.time: float = 0.0
         self.ideas: int = 0  # prestiging gives you ideas on what to do
         self.seeds: float = 0.0  # seeds sprout into ideas on prestige
         self.history = History(time=0.0, money=0, juice=0, prestiges=0)
         
+        # incremented by the engine whenever something visible changes; change_log
+        # maps each tracked element to the state_version it last changed at and a
+        # fingerprint of its value at that time
+        self.state_version: int = 0
+        self.change_log: Dict[str, Tuple[int, int]] = {}
+        self._owned_by_id: Dict[int, activities.OwnedActivities] = {}
+
+    def owned(self, act: Activity) -> Optional[OwnedActivities]:
+        """
+        Get the OwnedActivities that holds the player's instances of an Activity.
+
+        :param act: The Activity from the store to get the owned instances of.
+        :return: The matching OwnedActivities, or None if the player has never
+        bought any.
+        """
+        return self._owned_by_id.get(act.id, None)
+
+    def add_owned(self, oa: OwnedActivities):
+        """
+        Add a newly-owned OwnedActivities to jobs or outlets (whichever its
+        Activity belongs to) and to the id index. Items are kept in the same
+        relative order as they are listed in the store.
+
+        :param oa: The OwnedActivities to add. The player must not already own
+        any of its Activity.
+        """
+        if oa.activity.id in self._owned_by_id:
+            raise ValueError("Activity is already owned: {!r}".format(oa.activity))
+
+        if activities.is_job(oa.activity):
+            owned_list = self.jobs
+        else:
+            owned_list = self.outlets
+
+        store_idx = activities.store_index(oa.activity)
+        insert_at = len(owned_list)
+        for idx, existing in enumerate(owned_list):
+            if activities.store_index(existing.activity) > store_idx:
+                insert_at = idx
+                break
+        owned_list.insert(insert_at, oa)
+        self._owned_by_id[oa.activity.id] = oa
+        
     @property
     def free_juice(self) -> float:
         total_used = 0.0
@@ -139,26 +413,30 @@ class GameState:
             self.outlets
         )
         
-    def copy(self) -> 'GameState':
+    def copy(self, clock: Clock = DefaultClock) -> 'GameState':
         """
         Create a GameState that is an exact duplicate of this one. All properties are
         deeply copied; modifying anything in the returned GameState will not modify
         this one.
         
+        :param clock: The clock of the Engine that the copy is for.
         :return: A GameState that is a copy of this one.
         """
-        gs = GameState()
+        gs = GameState(clock)
+        gs.last_advancement = self.last_advancement
         gs.time = self.time
         gs.money = self.money
         gs.juice = self.juice
         gs.ideas = self.ideas
         gs.seeds = self.seeds
-        gs.history = self.history
-        gs.jobs = [j.copy() for j in self.jobs]
-        gs.outlets = [o.copy() for o in self.outlets]
+        gs.history = self.history.copy()
+        gs.state_version = self.state_version
+        gs.change_log = dict(self.change_log)
+        for oa in self.jobs + self.outlets:
+            gs.add_owned(oa.copy())
         return gs
         
-    def prestiged(self) -> 'GameState':
+    def prestiged(self, clock: Clock = DefaultClock) -> 'GameState':
         """
         Create a new GameState that is the result of applying a prestige on this one.
         Does not modify the GameState it was called on.
@@ -175,11 +453,12 @@ class GameState:
         indexed job is set to a count of 1 instance with that instance also set to active.
         * All automations are turned off (and will require the player to turn them back on).
         
+        :param clock: The clock of the Engine that the prestiged game is for.
         :return: A GameState that is the same as this one but prestiged an additional
         time.
         """
         # only operate on a copy
-        gs = self.copy()
+        gs = self.copy(clock)
         
         # copy current data to historical
         gs.history.money += gs.money
@@ -189,6 +468,7 @@ class GameState:
             
         # sprout seeds into ideas
         gs.ideas += int(gs.seeds)
+        gs.history.runs.append(gs.time, gs.money, gs.juice, int(gs.seeds), gs.ideas)
         
         # reset all the things!
         gs.money = 0
@@ -220,50 +500,449 @@ class GameState:
             'time': self.time,
             'ideas': self.ideas,
             'seeds': self.seeds,
-            'history': self.history.to_dict()
+            'history': self.history.to_dict(),
+            'state_version': self.state_version,
+            'change_log': dict(self.change_log)
         }
     
     @staticmethod
-    def from_dict(d):
-        gs = GameState()
+    def from_dict(d, clock: Clock = DefaultClock):
+        gs = GameState(clock)
         gs.money = d['money']
         gs.juice = d['juice']
-        gs.jobs = [OwnedActivities.from_dict(job) for job in d['jobs']]
-        gs.outlets = [OwnedActivities.from_dict(outlet) for outlet in d['outlets']]
+        for oa_data in d['jobs'] + d['outlets']:
+            gs.add_owned(OwnedActivities.from_dict(oa_data))
         gs.time = d['time']
         gs.ideas = d['ideas']
         gs.seeds = d['seeds']
         gs.history = History.from_dict(d['history'])
+        if 'last_advancement' in d:
+            gs.last_advancement = d['last_advancement']
+        gs.state_version = d.get('state_version', 0)
+        gs.change_log = {k: tuple(v) for k, v in d.get('change_log', {}).items()}
         return gs
 
 
-def save(file_name: str, gs: GameState):
+def save(
+    file_name: str,
+    gs: GameState,
+    durability: str = 'atomic',
+    hot_file: Optional['HotStateFile'] = None,
+    clock: Clock = DefaultClock
+):
     """
     Saves state to persistence so it can be read later with a call to load().
     Additionally, the shutdown time is recorded so that the monotonic game
     clock can be advanced by the correct number of seconds once state has been
     loaded.
+    
+    :param file_name: The state file to write to relative to the working directory.
+    :param gs: The GameState to save.
+    :param durability: How hard to try to keep the file intact if the program
+    or system crashes partway through. 'relaxed' writes directly into the file.
+    'atomic' writes to a temporary file and then replaces the state file with
+    it, so the state file is always either the old or the new version.
+    'durable' does the same as 'atomic' but also syncs the file and its
+    directory to disk before returning.
+    :param hot_file: If given, state is saved in the hot layout using this
+    HotStateFile instead of as a single pickle. Its file_name must match.
+    :param clock: Gives the shutdown time to record.
     """
+    if durability not in DurabilityModes:
+        raise ValueError("durability must be one of 'relaxed', 'atomic', or 'durable'")
     
     # TODO: sign the rest of the data and put it in the meta dict
     # (similar to JWT method of signing)
     
-    formatted_data = {
-        'meta': {
-            'shutdown_time': datetime.now(timezone.utc),
-            'version': CurrentVersion
-        },
-        'game': gs.to_dict()
+    start = time.perf_counter()
+    shutdown_time = clock.now()
+    
+    if hot_file is not None:
+        if hot_file.file_name != file_name:
+            raise ValueError("hot_file is for {!r}, not {!r}".format(hot_file.file_name, file_name))
+        size = hot_file.write(gs, shutdown_time, durability)
+    else:
+        formatted_data = {
+            'meta': {
+                'shutdown_time': shutdown_time,
+                'version': CurrentVersion
+            },
+            'game': gs.to_dict()
+        }
+        try:
+            data = pickle.dumps(formatted_data)
+        except pickle.PickleError as e:
+            raise SerializedStateError("Could not write state file: {!s}".format(str(e)))
+        size = _write_file(file_name, data, durability)
+
+    _save_seconds.observe(time.perf_counter() - start)
+    _save_bytes.observe(size)
+    _last_save_bytes.set(size)
+
+
+def _write_file(file_name: str, data: bytes, durability: str) -> int:
+    """
+    Replace the contents of a file using the given durability mode (see save()).
+    
+    :return: The number of bytes written.
+    """
+    if durability == 'relaxed':
+        write_name = file_name
+    else:
+        write_name = file_name + '.tmp'
+    
+    with open(write_name, 'wb') as fp:
+        fp.write(data)
+        if durability == 'durable':
+            fp.flush()
+            os.fsync(fp.fileno())
+    
+    if durability != 'relaxed':
+        os.replace(write_name, file_name)
+    if durability == 'durable':
+        _fsync_dir(os.path.dirname(os.path.abspath(file_name)))
+    return len(data)
+
+
+def _fsync_dir(dir_name: str):
+    """
+    Sync a directory so that a rename within it survives a crash. Not all
+    platforms allow directories to be opened; on those, this does nothing.
+    """
+    try:
+        fd = os.open(dir_name, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+# Hot layout
+#
+# A state file in the hot layout starts with a fixed header, followed by two
+# copies of the hot region, followed by the cold section. The cold section is a
+# pickle in the same format as a normal state file and is only rewritten when
+# the structure of the game changes (an activity or automation is bought, or a
+# prestige happens). The hot region holds the fields that change on nearly every
+# action at fixed offsets so that they can be updated in place through an mmap.
+# Each update goes to the older of the two copies, which carry a sequence number
+# and checksum, so a torn write never loses the last good copy.
+#
+# header: magic, layout version, slot count, cold offset, cold length, cold
+#   signature
+# hot copy: sequence, crc32 of the rest of the copy, shutdown time,
+#   last advancement, money, juice, seeds, ideas, time, state version, the
+#   change log entry of each of TrackedScalars, then one slot per owned
+#   activity
+# slot: activity id, active, automated, has execution, execution start, end,
+#   money, juice, auto multiplier, and the change log entry of its card
+
+HotLayoutMagic = b'CRE8HOT\x00'
+HotLayoutVersion = 2
+SaveLayouts = ('pickle', 'hot')
+
+_HotHeader = struct.Struct('<8sIIQQ16s')
+_HotHeaderSize = 64
+_HotFixed = struct.Struct('<QI4xdd16sddqd')
+_HotScalarChanges = struct.Struct('<q' + ('qI4x' * len(TrackedScalars)))
+_HotSlot = struct.Struct('<qqBB6xdd16sdq')
+_HotChange = struct.Struct('<qI4x')
+_HotSlotSize = _HotSlot.size + _HotChange.size
+
+
+def _int128(value: int) -> bytes:
+    return value.to_bytes(16, 'little', signed=True)
+
+
+def _from_int128(data: bytes) -> int:
+    return int.from_bytes(data, 'little', signed=True)
+
+
+def _fits(value: int, bits: int) -> bool:
+    limit = 1 << (bits - 1)
+    return -limit <= value < limit
+
+
+def _cold_signature(gs: GameState) -> bytes:
+    """
+    Get a digest of everything in a GameState that is saved in the cold section
+    of the hot layout, along with the order of the hot slots.
+    """
+    owned = tuple((oa.activity.id, oa.count, oa.automations) for oa in gs.jobs + gs.outlets)
+    hist = gs.history
+    sig = (CurrentVersion, owned, hist.time, hist.money, hist.juice, hist.prestiges)
+    return hashlib.blake2b(repr(sig).encode('utf-8'), digest_size=16).digest()
+
+
+def _pack_hot(gs: GameState, shutdown_time: datetime, seq: int) -> Optional[bytes]:
+    """
+    Pack the hot fields of a GameState into one copy of the hot region. Returns
+    None if any value is too large for its fixed-size field.
+    """
+    if not _fits(gs.money, 128) or not _fits(gs.ideas, 64):
+        return None
+    
+    slots = []
+    for oa in gs.jobs + gs.outlets:
+        ex = oa.execution
+        change = _HotChange.pack(*gs.change_log.get(card_change_key(oa.activity), (0, 0)))
+        if ex is None:
+            slot = _HotSlot.pack(oa.activity.id, oa.active, oa.automated, False, 0.0, 0.0, _int128(0), 0.0, 1)
+            slots.append(slot + change)
+            continue
+        if not _fits(ex.money, 128) or not _fits(ex.auto_multiplier, 64):
+            return None
+        slots.append(_HotSlot.pack(
+            oa.activity.id, oa.active, oa.automated, True, ex.start, ex.end, _int128(ex.money), ex.juice,
+            ex.auto_multiplier
+        ) + change)
+    
+    scalar_changes = []
+    for name in TrackedScalars:
+        scalar_changes.extend(gs.change_log.get(name, (0, 0)))
+    
+    body = _HotFixed.pack(
+        0, 0, shutdown_time.timestamp(), gs.last_advancement.timestamp(), _int128(gs.money), gs.juice, gs.seeds,
+        gs.ideas, gs.time
+    )[12:]
+    body += _HotScalarChanges.pack(gs.state_version, *scalar_changes)
+    body += b''.join(slots)
+    return struct.pack('<QI', seq, zlib.crc32(body)) + body
+
+
+def _hot_region_size(slot_count: int) -> int:
+    return _HotFixed.size + _HotScalarChanges.size + (slot_count * _HotSlotSize)
+
+
+def _unpack_hot(data: bytes, slot_count: int) -> Optional[Tuple[int, Dict[str, Any]]]:
+    """
+    Unpack one copy of the hot region. Returns None if its checksum doesn't
+    match, otherwise the sequence number and the unpacked values.
+    """
+    seq, crc = struct.unpack_from('<QI', data, 0)
+    body = data[12:_hot_region_size(slot_count)]
+    if seq == 0 or zlib.crc32(body) != crc:
+        return None
+    
+    _, _, shutdown_ts, last_adv_ts, money, juice, seeds, ideas, game_time = _HotFixed.unpack_from(data, 0)
+    values = {
+        'shutdown_time': datetime.fromtimestamp(shutdown_ts, timezone.utc),
+        'last_advancement': datetime.fromtimestamp(last_adv_ts, timezone.utc),
+        'money': _from_int128(money),
+        'juice': juice,
+        'seeds': seeds,
+        'ideas': ideas,
+        'time': game_time,
+        'change_log': {},
+        'slots': {}
     }
     
-    with open(file_name, 'wb') as fp:
+    scalar_changes = _HotScalarChanges.unpack_from(data, _HotFixed.size)
+    values['state_version'] = scalar_changes[0]
+    for idx, name in enumerate(TrackedScalars):
+        changed_at = scalar_changes[1 + (idx * 2)]
+        fingerprint = scalar_changes[2 + (idx * 2)]
+        if changed_at > 0:
+            values['change_log'][name] = (changed_at, fingerprint)
+    
+    slots_offset = _HotFixed.size + _HotScalarChanges.size
+    for i in range(slot_count):
+        slot_offset = slots_offset + (i * _HotSlotSize)
+        act_id, active, automated, has_exec, ex_start, ex_end, ex_money, ex_juice, ex_mult = _HotSlot.unpack_from(
+            data, slot_offset
+        )
+        changed_at, fingerprint = _HotChange.unpack_from(data, slot_offset + _HotSlot.size)
+        if changed_at > 0:
+            values['change_log']['card:{:d}'.format(act_id)] = (changed_at, fingerprint)
+        slot = {'active': active, 'automated': bool(automated), 'execution': None}
+        if has_exec:
+            slot['execution'] = {
+                'start': ex_start,
+                'end': ex_end,
+                'money': _from_int128(ex_money),
+                'juice': ex_juice,
+                'auto_multiplier': ex_mult
+            }
+        values['slots'][act_id] = slot
+    return seq, values
+
+
+def _read_hot_layout(data: bytes) -> Dict[str, Any]:
+    """
+    Decode the contents of a state file in the hot layout into the same
+    structure that a pickled state file holds.
+    """
+    magic, layout_version, slot_count, cold_offset, cold_length, _ = _HotHeader.unpack_from(data, 0)
+    if layout_version != HotLayoutVersion:
+        raise SerializedStateError("state file's hot layout version ({!r}) is invalid".format(layout_version))
+    
+    try:
+        decoded = pickle.loads(data[cold_offset:cold_offset + cold_length])
+    except (pickle.PickleError, EOFError) as e:
+        raise SerializedStateError("Could not decode state data: {!s}".format(str(e)))
+    
+    region_size = _hot_region_size(slot_count)
+    best = None
+    for copy_idx in range(2):
+        offset = _HotHeaderSize + (copy_idx * region_size)
+        unpacked = _unpack_hot(data[offset:offset + region_size], slot_count)
+        if unpacked is not None and (best is None or unpacked[0] > best[0]):
+            best = unpacked
+    if best is None:
+        # no hot update was ever made; the cold section is fully up to date
+        return decoded
+    
+    _, hot = best
+    decoded['meta']['shutdown_time'] = hot['shutdown_time']
+    game = decoded['game']
+    for k in ('last_advancement', 'money', 'juice', 'seeds', 'ideas', 'time', 'state_version', 'change_log'):
+        game[k] = hot[k]
+    for oa_data in game['jobs'] + game['outlets']:
+        slot = hot['slots'].get(oa_data['activity'], None)
+        if slot is None:
+            raise SerializedStateError("Hot region is missing activity {!r}".format(oa_data['activity']))
+        oa_data['active'] = slot['active']
+        oa_data['automated'] = slot['automated']
+        oa_data.pop('execution', None)
+        if slot['execution'] is not None:
+            oa_data['execution'] = slot['execution']
+    return decoded
+
+
+class HotStateFile:
+    """
+    Writer for state files in the hot layout. It keeps the file memory-mapped
+    between saves so that saves which only change hot fields are a small
+    in-place write; anything else rewrites the whole file.
+    """
+    
+    def __init__(self, file_name: str):
+        self.file_name = file_name
+        self._fp = None
+        self._mm: Optional[mmap.mmap] = None
+        self._inode = None
+        self._slot_count = 0
+        self._signature = b''
+        self._seq = 0
+        
+    def close(self):
+        """
+        Unmap and close the file. It is reopened on the next write.
+        """
+        if self._mm is not None:
+            self._mm.close()
+            self._mm = None
+        if self._fp is not None:
+            self._fp.close()
+            self._fp = None
+        self._inode = None
+        
+    def write(self, gs: GameState, shutdown_time: datetime, durability: str) -> int:
+        """
+        Save a GameState, in place if possible.
+        
+        :return: The number of bytes written.
+        """
+        signature = _cold_signature(gs)
+        if self._mm is None or not self._still_mapped():
+            self._open()
+        
+        if self._mm is not None and signature == self._signature:
+            self._seq += 1
+            packed = _pack_hot(gs, shutdown_time, self._seq)
+            if packed is not None:
+                region_size = _hot_region_size(self._slot_count)
+                offset = _HotHeaderSize + ((self._seq % 2) * region_size)
+                self._mm[offset:offset + region_size] = packed
+                if durability == 'durable':
+                    self._mm.flush()
+                return region_size
+        
+        return self._rewrite(gs, shutdown_time, signature, durability)
+    
+    def _rewrite(self, gs: GameState, shutdown_time: datetime, signature: bytes, durability: str) -> int:
+        self.close()
+        
+        formatted_data = {
+            'meta': {
+                'shutdown_time': shutdown_time,
+                'version': CurrentVersion
+            },
+            'game': gs.to_dict()
+        }
         try:
-            pickle.dump(formatted_data, fp)
+            cold = pickle.dumps(formatted_data)
         except pickle.PickleError as e:
             raise SerializedStateError("Could not write state file: {!s}".format(str(e)))
+        
+        slot_count = len(gs.jobs) + len(gs.outlets)
+        region_size = _hot_region_size(slot_count)
+        cold_offset = _HotHeaderSize + (2 * region_size)
+        header = _HotHeader.pack(HotLayoutMagic, HotLayoutVersion, slot_count, cold_offset, len(cold), signature)
+        header += bytes(_HotHeaderSize - len(header))
+        
+        # both hot copies start out empty (sequence 0 is never valid) because
+        # the cold section holds the current values
+        data = header + bytes(2 * region_size) + cold
+        size = _write_file(self.file_name, data, durability)
+        self._open()
+        return size
+    
+    def _open(self):
+        """
+        Map the file if it is in the hot layout, picking up its slot count,
+        signature, and latest sequence number.
+        """
+        self.close()
+        try:
+            fp = open(self.file_name, 'r+b')
+        except FileNotFoundError:
+            return
+        
+        head = fp.read(_HotHeaderSize)
+        if len(head) < _HotHeaderSize or head[:len(HotLayoutMagic)] != HotLayoutMagic:
+            fp.close()
+            return
+        _, layout_version, slot_count, _, _, signature = _HotHeader.unpack_from(head, 0)
+        if layout_version != HotLayoutVersion:
+            fp.close()
+            return
+        
+        self._fp = fp
+        self._mm = mmap.mmap(fp.fileno(), 0)
+        self._inode = os.fstat(fp.fileno()).st_ino
+        self._slot_count = slot_count
+        self._signature = signature
+        
+        region_size = _hot_region_size(slot_count)
+        self._seq = 0
+        for copy_idx in range(2):
+            offset = _HotHeaderSize + (copy_idx * region_size)
+            unpacked = _unpack_hot(self._mm[offset:offset + region_size], slot_count)
+            if unpacked is not None:
+                self._seq = max(self._seq, unpacked[0])
+    
+    def _still_mapped(self) -> bool:
+        """
+        Check that the mapped file is still the one at file_name with the same
+        structure; another process may have replaced or rewritten it since it was
+        opened.
+        """
+        try:
+            st = os.stat(self.file_name)
+        except FileNotFoundError:
+            return False
+        if st.st_ino != self._inode or st.st_size != len(self._mm):
+            return False
+        header = _HotHeader.unpack_from(self._mm, 0)
+        return header[2] == self._slot_count and header[5] == self._signature
 
 
-def load(file_name: str) -> Tuple[Optional[GameState], float]:
+def load(file_name: str, clock: Clock = DefaultClock) -> Tuple[Optional[GameState], float]:
     """
     Loads state. Returns (None, None) when a file does not yet exist, and raises
     SerializedStateError if there is an issue loading an existing state
@@ -274,40 +953,51 @@ def load(file_name: str) -> Tuple[Optional[GameState], float]:
     yet exist at all.
     
     :param file_name: The state file to load relative to the working directory.
+    :param clock: Gives the current time that the time since shutdown is
+    measured up to.
     :return: A tuple containing the loaded GameState and the number of seconds that have passed
     since the game was last shut down (distinct from the in-game monotonic clock). If
     no state file was located in file_name, then the tuple will be None, None.
     """
     
+    with _load_seconds.time():
+        return _load(file_name, clock)
+
+
+def _load(file_name: str, clock: Clock) -> Tuple[Optional[GameState], float]:
     try:
         with open(file_name, 'rb') as fp:
-            try:
-                unpickled_data = pickle.load(fp)
-            except pickle.PickleError as e:
-                raise SerializedStateError("Could not decode state data: {!s}".format(str(e)))
-                
-            if 'meta' not in unpickled_data:
-                raise SerializedStateError("Missing 'meta' key in decoded state file")
-            metadata = unpickled_data['meta']
-            if 'version' not in metadata:
-                raise SerializedStateError("Missing 'version' key in decoded state metadata")
-            version = metadata['version']
-            if version == CurrentVersion:
-                shutdown_time = metadata['shutdown_time']
-                gs_data = unpickled_data['game']
-                gs = GameState.from_dict(gs_data)
-                
-                now_time = datetime.now(timezone.utc)
-                if shutdown_time > now_time:
-                    errmsg = "Serialized state was last shut down in the future, the system clock may"
-                    errmsg += " have been tampered with."
-                    raise SerializedStateError(errmsg)
-                seconds_since_shutdown = (now_time - shutdown_time).total_seconds()
-                
-                return gs, seconds_since_shutdown
-            else:
-                raise SerializedStateError("state file's version ({!r}) is invalid".format(version))
-            
+            data = fp.read()
     except FileNotFoundError:
         # This is okay, it just means the file isnt there yet. Return None to indicate this.
         return None, 0.0
+        
+    if data[:len(HotLayoutMagic)] == HotLayoutMagic:
+        unpickled_data = _read_hot_layout(data)
+    else:
+        try:
+            unpickled_data = pickle.loads(data)
+        except pickle.PickleError as e:
+            raise SerializedStateError("Could not decode state data: {!s}".format(str(e)))
+        
+    if 'meta' not in unpickled_data:
+        raise SerializedStateError("Missing 'meta' key in decoded state file")
+    metadata = unpickled_data['meta']
+    if 'version' not in metadata:
+        raise SerializedStateError("Missing 'version' key in decoded state metadata")
+    version = metadata['version']
+    if version == CurrentVersion:
+        shutdown_time = metadata['shutdown_time']
+        gs_data = unpickled_data['game']
+        gs = GameState.from_dict(gs_data, clock)
+        
+        now_time = clock.now()
+        if shutdown_time > now_time:
+            errmsg = "Serialized state was last shut down in the future, the system clock may"
+            errmsg += " have been tampered with."
+            raise SerializedStateError(errmsg)
+        seconds_since_shutdown = (now_time - shutdown_time).total_seconds()
+        
+        return gs, seconds_since_shutdown
+    else:
+        raise SerializedStateError("state file's version ({!r}) is invalid".format(version))
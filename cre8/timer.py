@@ -23,6 +23,8 @@ class FrameClock:
         self.period: timedelta = period
         self._running: bool = False
         self._last_called: float = 0
+        # total frames skipped because a tick came too late to keep up
+        self.dropped_frames: int = 0
 
     @property
     def running(self) -> bool:
@@ -38,13 +40,16 @@ class FrameClock:
         self._last_called = time.monotonic()
         self._running = True
 
-    def tick(self):
+    def tick(self) -> int:
         """Wait until the start of the next period. If the timer has not yet
         been started with a call to start(), it is started automatically and
-        tick() immediately returns."""
+        tick() immediately returns.
+        
+        Returns the number of whole frames that were skipped because this call
+        came more than a period late. They are also added to dropped_frames."""
         if not self.running:
             self.start()
-            return
+            return 0
         
         now = time.monotonic()
         wait_time = self._target() - now
@@ -55,9 +60,11 @@ class FrameClock:
         elif abs(wait_time) > self.period.total_seconds():
             # we missed frames. set new target time as if we called it correctly and
             # move on
-            missed_frames = math.floor(abs(wait_time))
+            missed_frames = math.floor(abs(wait_time) / self.period.total_seconds())
             
         self._last_called = self._target() + (self.period.total_seconds() * missed_frames)
+        self.dropped_frames += missed_frames
+        return missed_frames
 
     def stop(self):
         """Stop the running timer."""
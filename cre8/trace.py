@@ -0,0 +1,281 @@
+"""
+Recording of the commands that players run and replay of those recordings
+against an Engine, so that a real session can be reproduced as fast as possible
+and the time each command takes compared between builds.
+
+A trace is a file with one JSON object per line, each describing a single
+command.
+"""
+
+import io
+import os
+import json
+import time
+import shutil
+import tempfile
+import contextlib
+import logging
+from datetime import timedelta
+from typing import Dict, Any, List, Optional, Callable, Iterator
+
+from .engine import Engine
+from . import metrics
+
+_log = logging.getLogger(__name__)
+
+CurrentVersion = 1
+
+# the percentiles of command latency given in replay reports
+ReportPercentiles = (0.50, 0.95, 0.99)
+
+
+class TraceEntry:
+    """
+    A single command recorded in a trace.
+    """
+
+    def __init__(
+        self,
+        time: float,
+        player: str,
+        command: str,
+        handler: str,
+        args: Dict[str, Any],
+        result: str,
+        seconds: float
+    ):
+        """
+        :param time: The wall-clock time the command started at as a POSIX
+        timestamp.
+        :param player: The player that ran the command.
+        :param command: The name of the command, including the debug subcommand
+        for debug commands (e.g. 'buy' or 'debug money').
+        :param handler: The name of the function in the entrypoint module that
+        ran the command.
+        :param args: The command's arguments, not including global options.
+        :param result: 'ok' if the command succeeded, or else the name of the
+        type of exception that it raised.
+        :param seconds: How long the command took.
+        """
+        self.time = time
+        self.player = player
+        self.command = command
+        self.handler = handler
+        self.args = args
+        self.result = result
+        self.seconds = seconds
+
+    def __repr__(self):
+        msg = "TraceEntry(time={!r}, player={!r}, command={!r}, handler={!r}, args={!r}, result={!r}, seconds={!r})"
+        return msg.format(self.time, self.player, self.command, self.handler, self.args, self.result, self.seconds)
+
+    def to_dict(self) -> Dict[str, Any]:
+        d = {
+            'v': CurrentVersion,
+            'time': self.time,
+            'player': self.player,
+            'command': self.command,
+            'handler': self.handler,
+            'args': self.args,
+            'result': self.result,
+            'seconds': self.seconds
+        }
+        return d
+
+    @staticmethod
+    def from_dict(d: Dict[str, Any]) -> 'TraceEntry':
+        return TraceEntry(d['time'], d['player'], d['command'], d['handler'], d['args'], d['result'], d['seconds'])
+
+
+class TraceRecorder:
+    """
+    Appends the commands run by a player to a trace file. Several processes can
+    record to the same file; each entry is written with a single write.
+    """
+
+    def __init__(self, file_name: str, player: str):
+        """
+        :param file_name: The trace file to append to. It is created if it does
+        not exist.
+        :param player: The player whose commands are being recorded.
+        """
+        self.file_name = file_name
+        self.player = player
+
+    @contextlib.contextmanager
+    def record(self, command: str, handler: str, args: Dict[str, Any]):
+        """
+        Context manager that records a command run within it, along with how
+        long it took and whether it raised an exception. Exceptions are not
+        caught.
+
+        :param command: The name of the command.
+        :param handler: The name of the function in the entrypoint module that
+        runs the command.
+        :param args: The command's arguments. Must be serializable as JSON.
+        """
+        started = time.time()
+        start = time.perf_counter()
+        result = 'ok'
+        try:
+            yield
+        except BaseException as e:
+            result = type(e).__name__
+            raise
+        finally:
+            entry = TraceEntry(started, self.player, command, handler, args, result, time.perf_counter() - start)
+            line = json.dumps(entry.to_dict()) + '\n'
+            with open(self.file_name, 'a') as fp:
+                fp.write(line)
+
+
+def read_trace(file_name: str) -> Iterator[TraceEntry]:
+    """
+    Read the entries of a trace file in the order they were written.
+
+    :param file_name: The trace file to read.
+    """
+    with open(file_name, 'r') as fp:
+        for line_num, line in enumerate(fp, start=1):
+            line = line.strip()
+            if line == '':
+                continue
+            d = json.loads(line)
+            if d.get('v', None) != CurrentVersion:
+                msg = "Line {:d} of trace is version {!r} but this build of cre8orforge only reads version {:d}"
+                raise ValueError(msg.format(line_num, d.get('v', None), CurrentVersion))
+            yield TraceEntry.from_dict(d)
+
+
+class ReplayReport:
+    """
+    The results of a replay.
+    """
+
+    def __init__(self):
+        # seconds taken by each replayed command, by command name
+        self.latencies: Dict[str, List[float]] = {}
+        self.commands = 0
+        self.players = 0
+        # number of commands whose result was not the same as when recorded
+        self.diverged = 0
+        self.wall_seconds = 0.0
+        self.simulated_seconds = 0.0
+
+    def add(self, command: str, seconds: float):
+        self.latencies.setdefault(command, []).append(seconds)
+        self.commands += 1
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        Get the report in a form that can be written as JSON for comparing
+        builds.
+        """
+        per_command = {}
+        for command, values in sorted(self.latencies.items()):
+            pcts = metrics.percentiles(values, ReportPercentiles)
+            per_command[command] = {
+                'count': len(values),
+                'mean': sum(values) / len(values),
+                'max': max(values),
+            }
+            for q, value in zip(ReportPercentiles, pcts):
+                per_command[command]['p{:d}'.format(round(q * 100))] = value
+        d = {
+            'commands': self.commands,
+            'players': self.players,
+            'diverged': self.diverged,
+            'wall_seconds': self.wall_seconds,
+            'simulated_seconds': self.simulated_seconds,
+            'per_command': per_command
+        }
+        return d
+
+    def __str__(self):
+        d = self.to_dict()
+        msg = "Replayed {:d} commands from {:d} players in {:.3f}s covering {:.1f}s of play".format(
+            d['commands'], d['players'], d['wall_seconds'], d['simulated_seconds']
+        )
+        if d['diverged'] > 0:
+            msg += "\n{:d} commands had a different result than when recorded".format(d['diverged'])
+        msg += "\n\n{:<16s} {:>7s} {:>10s} {:>10s} {:>10s} {:>10s}".format('command', 'count', 'p50 ms', 'p95 ms', 'p99 ms', 'max ms')
+        for command, stats in d['per_command'].items():
+            msg += "\n{:<16s} {:>7d} {:>10.3f} {:>10.3f} {:>10.3f} {:>10.3f}".format(
+                command, stats['count'], stats['p50'] * 1000, stats['p95'] * 1000, stats['p99'] * 1000, stats['max'] * 1000
+            )
+        return msg
+
+
+def replay(
+    entries: Iterator[TraceEntry],
+    run: Callable[[Engine, TraceEntry], None],
+    from_save: Optional[str] = None,
+    durability: str = 'atomic'
+) -> ReplayReport:
+    """
+    Run the commands of a trace against a separate Engine for each player,
+    without waiting between them. Instead, each player's game is advanced by
+    however long passed between their commands when they were recorded.
+
+    Engines save to a temporary directory that is removed afterwards, so saving
+    is included in the time each command takes.
+
+    :param entries: The entries of the trace, in the order they were recorded.
+    :param run: Called to run each command against the player's Engine. Any
+    output it prints is discarded.
+    :param from_save: If given, the state file that every player starts from.
+    Otherwise each starts a new game.
+    :param durability: The durability mode each Engine saves with.
+    :return: The latency of each command along with other totals.
+    """
+    report = ReplayReport()
+    engines: Dict[str, Engine] = {}
+    last_time: Dict[str, float] = {}
+    first_time = None
+    final_time = None
+
+    tmp_dir = tempfile.mkdtemp(prefix='cre8-replay-')
+    replay_start = time.perf_counter()
+    try:
+        for entry in entries:
+            if first_time is None:
+                first_time = entry.time
+            final_time = entry.time
+
+            eng = engines.get(entry.player, None)
+            if eng is None:
+                state_file = os.path.join(tmp_dir, 'player{:d}.p'.format(len(engines)))
+                if from_save is not None:
+                    shutil.copyfile(from_save, state_file)
+                eng = Engine(state_file, durability=durability)
+                engines[entry.player] = eng
+            else:
+                # the simulated clock: make the game think that the time between
+                # the two commands has passed since it was last advanced
+                gap = max(entry.time - last_time[entry.player], 0.0)
+                eng.game.last_advancement -= timedelta(seconds=gap)
+            last_time[entry.player] = entry.time
+
+            result = 'ok'
+            start = time.perf_counter()
+            try:
+                with contextlib.redirect_stdout(io.StringIO()):
+                    eng.update()
+                    run(eng, entry)
+            except Exception as e:
+                result = type(e).__name__
+            report.add(entry.command, time.perf_counter() - start)
+            if result != entry.result:
+                _log.debug("Replayed {!r} gave {!r} but recorded {!r}".format(entry.command, result, entry.result))
+                report.diverged += 1
+
+        for eng in engines.values():
+            eng.flush()
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    report.wall_seconds = time.perf_counter() - replay_start
+    report.players = len(engines)
+    if first_time is not None:
+        report.simulated_seconds = final_time - first_time
+    return report
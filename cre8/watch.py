@@ -0,0 +1,184 @@
+"""
+A live view of a game's status for terminals, such as on a headless server
+over SSH. The engine is updated at a fixed frame rate with a timer.FrameClock,
+and only the lines of the terminal that changed since the last frame are
+redrawn, by moving the cursor to them with ANSI escape codes.
+"""
+
+import sys
+import shutil
+import logging
+from typing import Any, Dict, List, Optional, TextIO
+
+from .engine import Engine
+from .timer import FrameClock
+from . import metrics
+
+_log = logging.getLogger(__name__)
+
+# frames drawn per second unless told otherwise
+DefaultFps = 2.0
+
+_HideCursor = '\x1b[?25l'
+_ShowCursor = '\x1b[?25h'
+_ClearScreen = '\x1b[2J'
+_ClearLine = '\x1b[K'
+
+_frames_drawn = metrics.registry.counter(
+    'cre8_watch_frames_total', "Frames drawn by the live terminal view"
+)
+_frames_dropped = metrics.registry.counter(
+    'cre8_watch_dropped_frames_total', "Frames skipped by the live terminal view because it fell behind"
+)
+_lines_drawn = metrics.registry.counter(
+    'cre8_watch_lines_total', "Lines written to the terminal by the live terminal view"
+)
+
+
+def _move_to(row: int) -> str:
+    return '\x1b[{:d};1H'.format(row + 1)
+
+
+class LineCanvas:
+    """
+    Draws frames of text on a terminal, only writing the lines that differ from
+    the last frame drawn.
+    """
+
+    def __init__(self, out: TextIO, width: Optional[int] = None, height: Optional[int] = None):
+        """
+        :param out: The terminal to draw on.
+        :param width: The number of columns that lines are cut to. Defaults to
+        the width of the terminal.
+        :param height: The number of rows that frames are cut to. Defaults to
+        the height of the terminal.
+        """
+        self.out = out
+        self.width = width
+        self.height = height
+        self._shown: List[str] = []
+        self._started = False
+
+    def start(self):
+        """
+        Clear the terminal and hide the cursor.
+        """
+        self.out.write(_HideCursor + _ClearScreen + _move_to(0))
+        self.out.flush()
+        self._shown = []
+        self._started = True
+
+    def draw(self, lines: List[str]) -> int:
+        """
+        Draw a frame, writing only the lines that changed since the last one.
+
+        :param lines: The lines of the frame, without newlines.
+        :return: The number of lines that were written.
+        """
+        if not self._started:
+            self.start()
+        size = shutil.get_terminal_size()
+        width = self.width if self.width is not None else size.columns
+        height = self.height if self.height is not None else size.lines
+        lines = [line[:width] for line in lines[:height]]
+
+        buf = []
+        for row, line in enumerate(lines):
+            if row >= len(self._shown) or self._shown[row] != line:
+                buf.append(_move_to(row) + line + _ClearLine)
+        # blank out whatever is left below a frame that got shorter
+        for row in range(len(lines), len(self._shown)):
+            buf.append(_move_to(row) + _ClearLine)
+        if len(buf) > 0:
+            self.out.write(''.join(buf))
+            self.out.flush()
+        self._shown = lines
+        return len(buf)
+
+    def finish(self):
+        """
+        Put the cursor below the last frame and show it again.
+        """
+        if not self._started:
+            return
+        self.out.write(_move_to(len(self._shown)) + _ShowCursor)
+        self.out.flush()
+        self._started = False
+
+
+class WatchReport:
+    """
+    What the live view did while it ran.
+    """
+
+    def __init__(self, fps: float):
+        self.fps = fps
+        self.frames = 0
+        self.dropped_frames = 0
+        self.lines = 0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {'fps': self.fps, 'frames': self.frames, 'dropped_frames': self.dropped_frames, 'lines': self.lines}
+
+    def __str__(self):
+        msg = "Drew {:d} frames at {:g} fps, writing {:d} lines ({:.1f} per frame); {:d} frames dropped"
+        per_frame = self.lines / self.frames if self.frames > 0 else 0.0
+        return msg.format(self.frames, self.fps, self.lines, per_frame, self.dropped_frames)
+
+
+def run(
+    eng: Engine,
+    fps: float = DefaultFps,
+    frames: Optional[int] = None,
+    out: Optional[TextIO] = None,
+    view: Optional[Dict[str, Any]] = None
+) -> WatchReport:
+    """
+    Show the game's status live on a terminal until interrupted.
+
+    :param eng: The Engine whose game to show. It is updated every frame but
+    not saved.
+    :param fps: Frames per second.
+    :param frames: Stop after this many frames. Defaults to running until
+    KeyboardInterrupt.
+    :param out: The terminal to draw on. Defaults to stdout.
+    :param view: Filtering and paging arguments for Engine.iter_status_lines().
+    :return: How many frames were drawn and dropped.
+    """
+    if fps <= 0:
+        raise ValueError("fps must be greater than 0")
+    if out is None:
+        out = sys.stdout
+    if view is None:
+        view = {}
+    report = WatchReport(fps)
+    canvas = LineCanvas(out)
+    clock = FrameClock(1.0 / fps)
+    canvas.start()
+    clock.start()
+    try:
+        while frames is None or report.frames < frames:
+            eng.update()
+            lines = ''.join(eng.iter_status_lines(**view)).rstrip('\n').split('\n')
+            # the footer is kept on screen even when the status is too tall
+            lines = lines[:max(shutil.get_terminal_size().lines - 2, 0)]
+            footer = "frame {:d} | {:g} fps | {:d} dropped | Ctrl-C to quit"
+            lines.append('')
+            lines.append(footer.format(report.frames + 1, fps, clock.dropped_frames))
+
+            written = canvas.draw(lines)
+            report.frames += 1
+            report.lines += written
+            _frames_drawn.inc()
+            _lines_drawn.inc(written)
+
+            dropped = clock.tick()
+            if dropped > 0:
+                _log.debug("Live view fell behind; dropped {:d} frames".format(dropped))
+                _frames_dropped.inc(dropped)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        canvas.finish()
+    report.dropped_frames = clock.dropped_frames
+    return report
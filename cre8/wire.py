@@ -0,0 +1,141 @@
+"""
+The binary protocol spoken between the daemon and clients that keep a
+connection open and send it many commands, possibly for several players,
+without waiting for each to finish.
+
+A connection starts with the client sending Magic followed by a hello frame
+giving the client's build stamp and working directory. The daemon answers with
+Magic followed by a frame whose code is ResultOk, or ResultRestart if it is from
+a different build, in which case it closes the connection and exits.
+
+After that, the client sends command frames, each with a request ID of its
+choosing, and the daemon sends back one response frame per command with the
+same ID. Commands for the same player are run in the order they were sent, but
+responses for different players can come back in any order.
+
+Every frame is a header of the payload length, the request ID, and a code,
+followed by the payload. The payload of both hello and command frames is a list
+of strings; for commands, they are the command-line arguments exactly as they
+would be given to the CLI, including any global options. Commands read an empty
+stdin. The payload of a response is the list [stdout, stderr, message], where
+message is the error message if the command failed.
+
+Admin frames ask about the daemon itself rather than any one game, and are
+answered right away. Their payload is the name of the request followed by its
+parameters; 'memory', with an optional number of players to list, answers with
+a JSON memory report as its stdout.
+"""
+
+import struct
+from typing import List, Sequence, Tuple, Iterator
+
+Magic = b'CRE8'
+
+CurrentVersion = 1
+
+# largest payload that is accepted, to stop a bad frame from using up memory
+MaxPayload = 16 * 1024 * 1024
+
+# codes of frames sent by clients
+KindHello = 0
+KindCommand = 1
+KindAdmin = 2
+
+# codes of frames sent by the daemon
+ResultOk = 0
+ResultRulesViolation = 1
+ResultError = 2
+ResultRestart = 3
+
+ResultNames = {
+    ResultOk: 'ok',
+    ResultRulesViolation: 'rules',
+    ResultError: 'error',
+    ResultRestart: 'restart',
+}
+
+# payload length, request ID, code
+_Header = struct.Struct('!IIB')
+_Count = struct.Struct('!H')
+_Length = struct.Struct('!I')
+
+
+def encode_frame(request_id: int, code: int, strings: Sequence[str]) -> bytes:
+    """
+    Encode a frame whose payload is a list of strings.
+
+    :param request_id: The ID of the request the frame is for.
+    :param code: KindHello or KindCommand for frames from clients, or one of
+    the Result codes for frames from the daemon.
+    :param strings: The payload.
+    :return: The frame, ready to be written.
+    """
+    parts = [_Count.pack(len(strings))]
+    for s in strings:
+        data = s.encode('utf-8')
+        parts.append(_Length.pack(len(data)))
+        parts.append(data)
+    payload = b''.join(parts)
+    if len(payload) > MaxPayload:
+        raise ValueError("Frame payload of {:d} bytes is too large".format(len(payload)))
+    return _Header.pack(len(payload), request_id, code) + payload
+
+
+def encode_hello(build: str, cwd: str) -> bytes:
+    """
+    Encode what a client sends to start a connection.
+
+    :param build: The client's build stamp.
+    :param cwd: The directory that relative paths in commands are relative to.
+    """
+    return Magic + encode_frame(0, KindHello, (str(CurrentVersion), build, cwd))
+
+
+def decode_strings(payload: bytes) -> List[str]:
+    """
+    Decode the list of strings in a frame's payload.
+    """
+    if len(payload) < _Count.size:
+        raise ValueError("Frame payload is too short")
+    count, = _Count.unpack_from(payload, 0)
+    offset = _Count.size
+    strings = []
+    for _ in range(count):
+        if offset + _Length.size > len(payload):
+            raise ValueError("Frame payload is truncated")
+        length, = _Length.unpack_from(payload, offset)
+        offset += _Length.size
+        if offset + length > len(payload):
+            raise ValueError("Frame payload is truncated")
+        strings.append(payload[offset:offset + length].decode('utf-8'))
+        offset += length
+    return strings
+
+
+class FrameReader:
+    """
+    Splits a stream of bytes into frames as it arrives.
+    """
+
+    def __init__(self):
+        self._buf = bytearray()
+
+    def feed(self, data: bytes) -> Iterator[Tuple[int, int, List[str]]]:
+        """
+        Add bytes read from the stream and get every frame that is now complete.
+
+        :param data: The bytes that were read.
+        :return: The request ID, code, and decoded payload of each complete
+        frame, in the order they were sent.
+        """
+        self._buf += data
+        while len(self._buf) >= _Header.size:
+            length, request_id, code = _Header.unpack_from(self._buf, 0)
+            if length > MaxPayload:
+                raise ValueError("Frame payload of {:d} bytes is too large".format(length))
+            end = _Header.size + length
+            if len(self._buf) < end:
+                break
+            payload = bytes(self._buf[_Header.size:end])
+            del self._buf[:end]
+            yield request_id, code, decode_strings(payload)
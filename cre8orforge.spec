@@ -8,7 +8,7 @@ a = Analysis(
     ['launchgui.py'],
     pathex=[],
     binaries=[],
-    datas=[('cre8/components/warning.png', 'assets')],
+    datas=[('cre8/components/warning.png', 'assets'), ('cre8/catalog.json', 'cre8')],
     hiddenimports=[],
     hookspath=[],
     runtime_hooks=[],
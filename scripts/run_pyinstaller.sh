@@ -29,6 +29,7 @@ else
 fi
 
 pyinstaller launchgui.py --name cre8orforge -y \
-  --add-data cre8/components/warning.png${pathsep}assets
+  --add-data cre8/components/warning.png${pathsep}assets \
+  --add-data cre8/catalog.json${pathsep}cre8
 
 echo "$repo_root/dist/cre8orforge"
\ No newline at end of file
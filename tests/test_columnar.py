@@ -0,0 +1,102 @@
+import random
+from datetime import datetime, timezone, timedelta
+
+import pytest
+
+from cre8 import columnar
+
+_Now = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+# the pure-Python pass over array columns always runs; the NumPy one only where
+# NumPy is installed
+_Backends = [
+    pytest.param(False, id='use_numpy=False'),
+    pytest.param(
+        True, id='use_numpy=True',
+        marks=pytest.mark.skipif(columnar.numpy is None, reason="NumPy is not installed")
+    ),
+]
+
+
+def _engines(seed: int, players: int, idle_seconds: float):
+    rng = random.Random(seed)
+    return [columnar._random_engine(rng, _Now - timedelta(seconds=idle_seconds)) for _ in range(players)]
+
+
+@pytest.mark.parametrize('use_numpy', _Backends)
+@pytest.mark.parametrize('seed,idle_seconds', [(1, 60.0), (2, 3600.0), (3, 21600.0), (4, 0.5)])
+def test_columnar_pass_matches_engine_advance(use_numpy, seed, idle_seconds):
+    by_engine = _engines(seed, 60, idle_seconds)
+    by_columns = _engines(seed, 60, idle_seconds)
+
+    for eng in by_engine:
+        eng._advance((_Now - eng.game.last_advancement).total_seconds())
+
+    columns = columnar.ColumnarGames(use_numpy)
+    assert columns.use_numpy == use_numpy
+    for eng in by_columns:
+        columns.load(eng)
+    completions = columns.advance(_Now)
+    for eng in by_columns:
+        columns.materialize(eng)
+
+    assert completions > 0
+    for expected, actual in zip(by_engine, by_columns):
+        assert columnar._same_game(expected.game, actual.game)
+        assert actual.game.last_advancement == _Now
+
+
+@pytest.mark.parametrize('use_numpy', _Backends)
+def test_several_columnar_passes_match_engine_advances(use_numpy):
+    idle_seconds = 7200.0
+    by_engine = _engines(5, 60, idle_seconds)
+    by_columns = _engines(5, 60, idle_seconds)
+    times = [_Now - timedelta(seconds=idle_seconds - step) for step in (600.0, 1800.0, 4000.0, 7200.0)]
+
+    for eng in by_engine:
+        for at in times:
+            eng._advance((at - eng.game.last_advancement).total_seconds(), at)
+
+    columns = columnar.ColumnarGames(use_numpy)
+    for eng in by_columns:
+        columns.load(eng)
+    for at in times:
+        columns.advance(at)
+    for eng in by_columns:
+        columns.materialize(eng)
+
+    for expected, actual in zip(by_engine, by_columns):
+        assert columnar._same_game(expected.game, actual.game)
+
+
+def test_pure_python_pass_runs_without_numpy(monkeypatch):
+    monkeypatch.setattr(columnar, 'numpy', None)
+    by_engine = _engines(7, 40, 3600.0)
+    by_columns = _engines(7, 40, 3600.0)
+
+    for eng in by_engine:
+        eng._advance((_Now - eng.game.last_advancement).total_seconds())
+
+    columns = columnar.ColumnarGames()
+    assert not columns.use_numpy
+    for eng in by_columns:
+        columns.load(eng)
+    assert columns.advance(_Now) > 0
+    for eng in by_columns:
+        columns.materialize(eng)
+
+    for expected, actual in zip(by_engine, by_columns):
+        assert columnar._same_game(expected.game, actual.game)
+
+
+def test_removed_engine_is_left_alone():
+    by_columns = _engines(6, 3, 600.0)
+    columns = columnar.ColumnarGames(False)
+    for eng in by_columns:
+        columns.load(eng)
+    assert columns.remove(by_columns[1])
+    before = by_columns[1].game.copy()
+    columns.advance(_Now)
+    assert columnar._same_game(before, by_columns[1].game)
+    assert len(columns) == 2
@@ -0,0 +1,89 @@
+import random
+
+import pytest
+
+from cre8 import notify
+
+
+class _NaiveWheel:
+    """
+    Keeps every timer in a dict and checks all of them on each advance. A timer
+    for a tick that was already processed is due at the first tick that wasn't.
+    """
+
+    def __init__(self, start_tick: int):
+        self.current = start_tick
+        self.timers = {}
+
+    def schedule(self, tick: int, payload):
+        self.timers[payload] = max(tick, self.current)
+
+    def cancel(self, payload) -> bool:
+        return self.timers.pop(payload, None) is not None
+
+    def advance(self, to_tick: int):
+        fired = sorted((tick, payload) for payload, tick in self.timers.items() if tick <= to_tick)
+        for _, payload in fired:
+            del self.timers[payload]
+        self.current = max(self.current, to_tick + 1)
+        return [payload for _, payload in fired]
+
+
+@pytest.mark.parametrize('bits', [notify.DefaultWheelBits, (2, 2, 2), (3,), (1, 1, 1, 1)])
+@pytest.mark.parametrize('seed', [1, 2, 3, 4])
+def test_timing_wheel_matches_naive_reference(bits, seed):
+    rng = random.Random(seed)
+    start = rng.randrange(0, 10 ** 6)
+    wheel = notify.TimingWheel(start, bits)
+    naive = _NaiveWheel(start)
+    handles = {}
+    # payloads scheduled for a tick that had not yet been processed, which must
+    # fire in tick order; ones scheduled in the past fire on the next advance
+    future = set()
+    next_payload = 0
+    to_tick = start - 1
+
+    for _ in range(400):
+        for _ in range(rng.randrange(0, 8)):
+            span = rng.choice((4, 64, 1000, 10 ** 5))
+            tick = wheel.current + rng.randrange(-3, span)
+            payload = next_payload
+            next_payload += 1
+            handles[payload] = wheel.schedule(tick, payload)
+            naive.schedule(tick, payload)
+            if tick >= wheel.current:
+                future.add(payload)
+
+        live = list(naive.timers)
+        for payload in rng.sample(live, min(len(live), rng.randrange(0, 3))):
+            assert wheel.cancel(handles[payload]) == naive.cancel(payload)
+            assert not handles[payload].scheduled
+
+        to_tick += rng.choice((0, 1, 3, 17, 250, 5000))
+        fired = [timer.payload for timer in wheel.advance(to_tick)]
+        expected = naive.advance(to_tick)
+        assert sorted(fired) == sorted(expected)
+        ordered = [handles[p].tick for p in fired if p in future]
+        assert ordered == sorted(ordered)
+        assert all(not handles[p].scheduled for p in fired)
+        assert len(wheel) == len(naive.timers)
+
+    fired = [timer.payload for timer in wheel.advance(to_tick + 10 ** 7)]
+    assert sorted(fired) == sorted(naive.advance(to_tick + 10 ** 7))
+    assert len(wheel) == 0
+
+
+def test_cancelling_twice_reports_the_timer_gone():
+    wheel = notify.TimingWheel(0)
+    timer = wheel.schedule(10, 'a')
+    assert wheel.cancel(timer)
+    assert not wheel.cancel(timer)
+    assert wheel.advance(100) == []
+
+
+def test_past_tick_fires_with_the_next_tick_processed():
+    wheel = notify.TimingWheel(0)
+    wheel.advance(50)
+    timer = wheel.schedule(5, 'late')
+    assert wheel.advance(50) == []
+    assert wheel.advance(51) == [timer]
@@ -0,0 +1,77 @@
+import struct
+
+import pytest
+
+from cre8 import wire
+
+
+def _feed_all(reader, chunks):
+    frames = []
+    for chunk in chunks:
+        frames.extend(reader.feed(chunk))
+    return frames
+
+
+def test_whole_frame():
+    reader = wire.FrameReader()
+    frame = wire.encode_frame(7, wire.KindCommand, ('status', '--page', '2'))
+    assert list(reader.feed(frame)) == [(7, wire.KindCommand, ['status', '--page', '2'])]
+
+
+def test_frame_split_into_single_bytes():
+    reader = wire.FrameReader()
+    frame = wire.encode_frame(3, wire.ResultOk, ('out', '', 'café'))
+    chunks = [frame[i:i + 1] for i in range(len(frame))]
+    assert _feed_all(reader, chunks) == [(3, wire.ResultOk, ['out', '', 'café'])]
+
+
+def test_frame_split_inside_header():
+    reader = wire.FrameReader()
+    frame = wire.encode_frame(1, wire.KindCommand, ('buy', 'job', '0'))
+    assert list(reader.feed(frame[:5])) == []
+    assert list(reader.feed(frame[5:])) == [(1, wire.KindCommand, ['buy', 'job', '0'])]
+
+
+def test_frames_split_across_chunk_boundaries():
+    reader = wire.FrameReader()
+    frames = [wire.encode_frame(n, wire.KindCommand, ('status',) * n) for n in range(1, 6)]
+    stream = b''.join(frames)
+    # uneven chunks so that frames both span chunks and share them
+    chunks = [stream[i:i + 11] for i in range(0, len(stream), 11)]
+    got = _feed_all(reader, chunks)
+    assert got == [(n, wire.KindCommand, ['status'] * n) for n in range(1, 6)]
+
+
+def test_empty_payload_list():
+    reader = wire.FrameReader()
+    assert list(reader.feed(wire.encode_frame(9, wire.ResultOk, ()))) == [(9, wire.ResultOk, [])]
+
+
+def test_oversize_frame_is_rejected_from_its_header():
+    reader = wire.FrameReader()
+    header = struct.pack('!IIB', wire.MaxPayload + 1, 1, wire.KindCommand)
+    # the payload never has to arrive for the frame to be refused
+    with pytest.raises(ValueError):
+        list(reader.feed(header))
+
+
+def test_largest_frame_is_accepted():
+    reader = wire.FrameReader()
+    # a count, one length, then the string fill the payload exactly
+    text = 'x' * (wire.MaxPayload - 2 - 4)
+    frame = wire.encode_frame(2, wire.KindCommand, (text,))
+    got = list(reader.feed(frame))
+    assert len(got) == 1 and got[0][2] == [text]
+
+
+def test_encoding_an_oversize_frame_fails():
+    with pytest.raises(ValueError):
+        wire.encode_frame(1, wire.KindCommand, ('x' * wire.MaxPayload,))
+
+
+def test_truncated_payload_is_rejected():
+    reader = wire.FrameReader()
+    payload = struct.pack('!H', 2) + struct.pack('!I', 3) + b'abc'
+    frame = struct.pack('!IIB', len(payload), 1, wire.KindCommand) + payload
+    with pytest.raises(ValueError):
+        list(reader.feed(frame))